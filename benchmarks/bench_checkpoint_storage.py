@@ -0,0 +1,117 @@
+"""Checkpoint storage per thread length: full-state vs delta-encoded saver.
+
+Writes one synthetic thread per length through the tuned (full messages in
+every checkpoint) and the delta saver, then reports the bytes written and
+the cold load time of the newest checkpoint (fresh saver, empty caches).
+
+Run: python benchmarks/bench_checkpoint_storage.py [--turns 10 100 1000]
+"""
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from langchain_core.messages import AIMessage
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.base.id import uuid6
+
+from cache_lm.checkpoint_sqlite import DeltaSqliteSaver
+from cache_lm.checkpoint_sqlite import tuned_pragmas
+from cache_lm.checkpoint_sqlite import TunedSqliteSaver
+
+QUERY = "What are the minimum logging expectations for turn {turn}?"
+ANSWER = ("Per section 4.2 of the manual, every request is logged with its "
+          "ticket id, requester and approval state; logs are kept for 90 "
+          "days and reviewed weekly (turn {turn}). ") * 3
+SAVERS = {"full": TunedSqliteSaver, "delta": DeltaSqliteSaver}
+
+
+def _open(saver_class, db_path: Path):
+    conn = sqlite3.connect(str(db_path), check_same_thread=False)
+    conn.executescript(tuned_pragmas())
+    saver = saver_class(conn, commit_window_s=1.0)
+    saver.setup()
+    return saver
+
+
+def _write_thread(saver, turns: int) -> float:
+    # One checkpoint after each user message and one after each answer, as
+    # the graph's input and final steps write them.
+    config = {"configurable": {"thread_id": "t1", "checkpoint_ns": ""}}
+    messages = []
+    start = time.perf_counter()
+    for turn in range(turns):
+        with saver.group_commits():
+            for message in (HumanMessage(content=QUERY.format(turn=turn)),
+                            AIMessage(content=ANSWER.format(turn=turn))):
+                messages.append(message)
+                checkpoint = empty_checkpoint()
+                checkpoint["id"] = str(uuid6())
+                checkpoint["channel_values"] = {"messages": list(messages)}
+                config = saver.put(config, checkpoint, {"step": turn}, {})
+    return time.perf_counter() - start
+
+
+def _bytes_written(db_path: Path) -> int:
+    conn = sqlite3.connect(str(db_path))
+    try:
+        total = conn.execute(
+            "SELECT SUM(LENGTH(checkpoint) + LENGTH(metadata)) "
+            "FROM checkpoints").fetchone()[0]
+        if conn.execute("SELECT 1 FROM sqlite_master "
+                        "WHERE name = 'message_deltas'").fetchone():
+            total += conn.execute("SELECT SUM(LENGTH(messages)) "
+                                  "FROM message_deltas").fetchone()[0]
+        return total
+    finally:
+        conn.close()
+
+
+def _cold_load_ms(saver_class, db_path: Path, turns: int,
+                  repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        saver = _open(saver_class, db_path)
+        start = time.perf_counter()
+        loaded = saver.get_tuple({"configurable": {"thread_id": "t1"}})
+        timings.append((time.perf_counter() - start) * 1000.0)
+        assert len(loaded.checkpoint["channel_values"]["messages"]) == (2 *
+                                                                        turns)
+        saver.close()
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns",
+                        type=int,
+                        nargs="+",
+                        default=[10, 100, 1000])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'turns':>6} {'saver':>6} {'written':>12} {'file':>12} "
+          f"{'write_s':>8} {'load_ms':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for turns in args.turns:
+            for name, saver_class in SAVERS.items():
+                db_path = Path(tmp) / f"{name}-{turns}.sqlite"
+                saver = _open(saver_class, db_path)
+                write_s = _write_thread(saver, turns)
+                saver.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                saver.close()
+                load_ms = _cold_load_ms(saver_class, db_path, turns,
+                                        args.repeats)
+                print(f"{turns:>6} {name:>6} {_bytes_written(db_path):>12,} "
+                      f"{db_path.stat().st_size:>12,} {write_s:>8.2f} "
+                      f"{load_ms:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
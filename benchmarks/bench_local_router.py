@@ -0,0 +1,95 @@
+"""Local router classifier: scoring latency next to the rules router.
+
+Trains on a routing log (`--log`, as written via CACHE_LM_ROUTER_LOG) or, by
+default, on synthetic questions labelled by the rules router, then times
+`LocalRouterModel.route` on a short query and on pasted logs. The LLM router
+this replaces costs a full model round trip (typically 100s of ms).
+
+Run: python benchmarks/bench_local_router.py [--calls 2000] [--log decisions.jsonl]
+"""
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+import random
+import statistics
+import time
+
+from cache_lm.router import route_experts_rules
+from cache_lm.router_keywords import DEFAULT_KEYWORDS
+from cache_lm.router_local import load_routing_log
+from cache_lm.router_local import train_local_router
+
+QUERY = ("Can I approve in chat, what is the API rate limit, "
+         "and summarize the steps?")
+_FILLER = ("please our team in a for today quick question about account "
+           "payments card transfer").split()
+
+
+def _synthetic_log(n: int) -> list[tuple[str, set[str]]]:
+    rng = random.Random(0)
+    keywords = [k for ks in DEFAULT_KEYWORDS.values() for k in ks]
+    examples = []
+    for _ in range(n):
+        words = [rng.choice(_FILLER) for _ in range(rng.randint(3, 10))]
+        for _ in range(rng.randint(0, 2)):
+            words.insert(rng.randint(0, len(words)), rng.choice(keywords))
+        text = " ".join(words)
+        examples.append(
+            (text, {t["expert"]
+                    for t in route_experts_rules(text).tasks}))
+    return examples
+
+
+def _log(size: int) -> str:
+    # Log lines with unique ids/timestamps: the worst case for n-gram hashing.
+    rng = random.Random(size)
+    lines = []
+    while sum(len(line) + 1 for line in lines) < size:
+        lines.append(f"2024-05-01T12:{rng.randint(0, 59):02d}:"
+                     f"{rng.randint(0, 59):02d}Z INFO worker-"
+                     f"{rng.randint(1, 99)} job={rng.randint(1000, 9999)} "
+                     f"status=ok elapsed_ms={rng.randint(1, 999)}")
+    return " ".join(lines)
+
+
+def _percentiles_us(fn, text: str, calls: int) -> tuple[float, float]:
+    fn(text)
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fn(text)
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--log", type=Path, default=None)
+    args = parser.parse_args()
+
+    examples = load_routing_log(args.log) if args.log else _synthetic_log(2000)
+    start = time.perf_counter()
+    model = train_local_router(examples)
+    print(f"trained on {len(examples)} decisions in "
+          f"{time.perf_counter() - start:.1f}s")
+
+    inputs = {
+        "short query": QUERY,
+        "4 KB log + question": _log(4096) + " " + QUERY,
+        "16 KB log + question": _log(16384) + " " + QUERY,
+    }
+    print(f"{'input':<22} {'rules_p50_us':>13} {'local_p50_us':>13} "
+          f"{'local_p99_us':>13}")
+    for name, text in inputs.items():
+        rules_p50, _ = _percentiles_us(route_experts_rules, text, args.calls)
+        local_p50, local_p99 = _percentiles_us(model.route, text, args.calls)
+        print(f"{name:<22} {rules_p50:13.1f} {local_p50:13.1f} "
+              f"{local_p99:13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Per-call prompt assembly cost: rebuilt from the manual vs memoized artifacts.
+
+Run: python benchmarks/bench_prompt_assembly.py [--calls 2000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+import tracemalloc
+
+from cache_lm.hashing import sha256_text
+from cache_lm.manual import get_manual
+from cache_lm.prompts import build_langchain_messages
+from cache_lm.prompts import build_messages
+from cache_lm.prompts import EXPERT_NAMES
+from cache_lm.prompts import prompt_artifacts
+from cache_lm.prompts import system_prefix_text
+from cache_lm.prompts import to_langchain_messages
+
+QUERY = "What are the minimum logging expectations?"
+HISTORY = [
+    {
+        "role": "user",
+        "content": "Can I do approvals in chat?"
+    },
+    {
+        "role": "assistant",
+        "content": "No. Approvals must go through the ticketing system."
+    },
+]
+
+
+def _rebuilt(manual) -> None:
+    # What every expert call did before: join the prefix, hash it for the
+    # cache key / state, and convert fresh message objects.
+    for expert in EXPERT_NAMES:
+        sha256_text(system_prefix_text(manual_text=manual.text))
+        to_langchain_messages(
+            build_messages(
+                expert=expert,
+                user_input=QUERY,
+                history=HISTORY,
+                manual_text=manual.text,
+            ))
+
+
+def _memoized(manual) -> None:
+    for expert in EXPERT_NAMES:
+        artifacts = prompt_artifacts(manual)
+        build_langchain_messages(
+            expert=expert,
+            user_input=QUERY,
+            history=HISTORY,
+            artifacts=artifacts,
+        )
+
+
+def _measure(fn, manual, calls: int) -> tuple[float, int]:
+    fn(manual)
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn(manual)
+    per_turn_us = (time.perf_counter() - start) / calls * 1e6
+
+    tracemalloc.start()
+    fn(manual)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return per_turn_us, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    manual = get_manual()
+    print(f"manual_bytes={len(manual.bytes)} experts={len(EXPERT_NAMES)} "
+          f"calls={args.calls}")
+    results = {
+        "rebuilt": _measure(_rebuilt, manual, args.calls),
+        "memoized": _measure(_memoized, manual, args.calls),
+    }
+    for name, (per_turn_us, peak) in results.items():
+        print(f"{name:>9}: {per_turn_us:9.1f} us/turn  "
+              f"peak_alloc={peak / 1024:8.1f} KiB/turn")
+    rebuilt_us, rebuilt_peak = results["rebuilt"]
+    memo_us, memo_peak = results["memoized"]
+    print(f"    saved: {rebuilt_us - memo_us:9.1f} us/turn  "
+          f"peak_alloc={(rebuilt_peak - memo_peak) / 1024:8.1f} KiB/turn")
+
+
+if __name__ == "__main__":
+    main()
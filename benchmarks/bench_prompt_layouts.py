@@ -0,0 +1,113 @@
+"""Uncached prompt tokens per multi-expert turn: expert_first vs shared_history.
+
+Replays one thread in which every turn goes to all three experts, builds each
+expert's prompt in both layouts, and feeds the prompts through a simulated
+prefix cache (message granularity, no eviction, so every earlier prompt of
+the run stays cached). Tokens are the `history.py` estimates.
+
+Run: python benchmarks/bench_prompt_layouts.py [--turns 20] [--budget 0]
+"""
+
+from __future__ import annotations
+
+import argparse
+
+from cache_lm.history import message_tokens
+from cache_lm.history import window_history
+from cache_lm.manual import get_manual
+from cache_lm.prompts import build_messages
+from cache_lm.prompts import EXPERT_NAMES
+
+LAYOUTS = ("expert_first", "shared_history")
+QUERY = "For case {turn}: can I approve this in chat, and what are the steps?"
+# The final response concatenates one section per expert.
+SECTION = ("{expert} (case {turn}): approvals go through the ticketing "
+           "system; log the requester, timestamp and approval reference, "
+           "and keep the record for the retention period. ") * 2
+
+
+class _PrefixCache:
+    # A trie of message tuples: how much of a prompt some earlier prompt
+    # already started with.
+
+    def __init__(self) -> None:
+        self._root: dict = {}
+
+    def feed(self, messages: list[dict]) -> int:
+        node, cached, hit = self._root, 0, True
+        for message in messages:
+            key = (message["role"], message["content"])
+            if hit and key in node:
+                cached += message_tokens(message)
+            else:
+                hit = False
+            node = node.setdefault(key, {})
+        return cached
+
+
+def _run(layout: str, turns: int, budget: int | None,
+         manual_text: str) -> list[tuple[int, int]]:
+    cache = _PrefixCache()
+    history: list[dict] = []
+    per_turn = []
+    for turn in range(turns):
+        query = QUERY.format(turn=turn)
+        window, _ = window_history(history, budget)
+        prompt_tokens = uncached = 0
+        for expert in EXPERT_NAMES:
+            messages = build_messages(expert=expert,
+                                      user_input=query,
+                                      history=window,
+                                      manual_text=manual_text,
+                                      layout=layout)
+            tokens = sum(message_tokens(m) for m in messages)
+            prompt_tokens += tokens
+            uncached += tokens - cache.feed(messages)
+        per_turn.append((prompt_tokens, uncached))
+        history.append({"role": "user", "content": query})
+        history.append({
+            "role":
+            "assistant",
+            "content":
+            "\n\n".join(
+                SECTION.format(expert=e, turn=turn) for e in EXPERT_NAMES)
+        })
+    return per_turn
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--budget",
+                        type=int,
+                        default=0,
+                        help="History token budget per expert (0: none).")
+    args = parser.parse_args()
+
+    manual = get_manual()
+    budget = args.budget or None
+    results = {
+        layout: _run(layout, args.turns, budget, manual.text)
+        for layout in LAYOUTS
+    }
+    print(f"experts={len(EXPERT_NAMES)} turns={args.turns} "
+          f"history_budget={budget or '-'}")
+    print(f"{'turn':>5} " + " ".join(f"{layout + ' uncached':>24}"
+                                     for layout in LAYOUTS))
+    for turn in sorted({0, 1, args.turns // 2, args.turns - 1}):
+        print(f"{turn + 1:>5} " + " ".join(f"{results[layout][turn][1]:>24,}"
+                                           for layout in LAYOUTS))
+    for layout in LAYOUTS:
+        prompt = sum(p for p, _ in results[layout])
+        uncached = sum(u for _, u in results[layout])
+        # Turn 1 prefills the manual in both layouts; the rest is the steady
+        # state.
+        steady = sum(u
+                     for _, u in results[layout][1:]) / max(args.turns - 1, 1)
+        print(f"{layout:>14}: prompt_tokens={prompt:,} "
+              f"uncached_tokens={uncached:,} "
+              f"uncached_per_turn_after_first={steady:,.0f}")
+
+
+if __name__ == "__main__":
+    main()
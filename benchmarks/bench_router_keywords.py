@@ -0,0 +1,131 @@
+"""Rules-router keyword matching on short queries and multi-KB pasted logs.
+
+Compares the previous per-expert scans, a single-pass combined regex (prefix
+trie, one alternation per shared prefix) and the compiled `KeywordMatcher`.
+
+Run: python benchmarks/bench_router_keywords.py [--calls 2000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import re
+import time
+
+from cache_lm.router_keywords import DEFAULT_KEYWORDS
+from cache_lm.router_keywords import KeywordMatcher
+
+QUERY = ("Can I approve in chat, what is the API rate limit, "
+         "and summarize the steps?")
+_LOG_WORDS = ("2024-05-01T12:00:03Z INFO worker-7 job=4411 status=ok "
+              "elapsed_ms=12 queue=payments retries=0 host=node-3").split()
+
+
+def _log(size: int, *, tail: str = "") -> str:
+    rng = random.Random(size)
+    words: list[str] = []
+    length = 0
+    while length < size:
+        word = rng.choice(_LOG_WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words) + tail
+
+
+def _per_expert_scans(text: str) -> list[str]:
+    # Previous rules router: lowercase + `any(k in text)` once per expert.
+    found = []
+    for expert, keywords in DEFAULT_KEYWORDS.items():
+        text_lower = text.lower()
+        if any(k in text_lower for k in keywords):
+            found.append(expert)
+    return found
+
+
+def _trie_pattern(keywords: list[str]) -> str:
+    trie: dict = {}
+    for keyword in keywords:
+        node = trie
+        for ch in keyword:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        branches = [
+            re.escape(ch) + build(child) for ch, child in sorted(node.items())
+            if ch
+        ]
+        if not branches:
+            return ""
+        body = branches[0]
+        if len(branches) > 1:
+            body = "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+class _SinglePassRegex:
+    # One regex over all keywords; stops once every expert is labelled.
+
+    def __init__(self) -> None:
+        keywords = sorted({k for ks in DEFAULT_KEYWORDS.values() for k in ks})
+        self._pattern = re.compile(_trie_pattern(keywords))
+        # A match also implies every keyword it contains.
+        self._labels: dict[str, set[str]] = {k: set() for k in keywords}
+        for expert, expert_keywords in DEFAULT_KEYWORDS.items():
+            for keyword in keywords:
+                if any(other in keyword for other in expert_keywords):
+                    self._labels[keyword].add(expert)
+
+    def match(self, text: str) -> list[str]:
+        text_lower = text.lower()
+        found: set[str] = set()
+        pos = 0
+        while len(found) < len(DEFAULT_KEYWORDS):
+            m = self._pattern.search(text_lower, pos)
+            if m is None:
+                break
+            found |= self._labels[m.group(0)]
+            pos = m.start() + 1
+        return [e for e in DEFAULT_KEYWORDS if e in found]
+
+
+def _time_us(fn, text: str, calls: int) -> float:
+    fn(text)
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn(text)
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    matcher = KeywordMatcher(DEFAULT_KEYWORDS)
+    regex = _SinglePassRegex()
+    inputs = {
+        "short query": QUERY,
+        "4 KB log, no keywords": _log(4096),
+        "4 KB log + question": _log(4096, tail=" " + QUERY),
+        "16 KB log, no keywords": _log(16384),
+        "16 KB log + question": _log(16384, tail=" " + QUERY),
+        "question + 16 KB log": QUERY + " " + _log(16384),
+    }
+    print(f"{'input':<24} {'previous_us':>12} {'regex_us':>10} "
+          f"{'compiled_us':>12} {'speedup':>8}")
+    for name, text in inputs.items():
+        expected = _per_expert_scans(text)
+        assert matcher.match(text) == regex.match(text) == expected
+        previous = _time_us(_per_expert_scans, text, args.calls)
+        single = _time_us(regex.match, text, args.calls)
+        compiled = _time_us(matcher.match, text, args.calls)
+        print(f"{name:<24} {previous:12.1f} {single:10.1f} {compiled:12.1f} "
+              f"{previous / compiled:7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import random
+import threading
+import time
+
+from cache_lm.env import get_env
+
+# Concrete modes the adaptive mode chooses between, per turn.
+ADAPTIVE_MODES: tuple[str, ...] = ("sequential", "parallel", "leader")
+
+# Weight of the newest turn in the running means: recent turns dominate, so
+# the estimates follow backend load and prefix warmth as they drift.
+_EWMA_ALPHA = 0.2
+
+
+class _ModeStats:
+
+    def __init__(self) -> None:
+        self.turns = 0
+        self.latency_ms = 0.0
+        self.ttft_ms: float | None = None
+
+    def record(self, latency_ms: float, ttft_ms: float | None) -> None:
+        self.turns += 1
+        if self.turns == 1:
+            self.latency_ms = latency_ms
+        else:
+            self.latency_ms += _EWMA_ALPHA * (latency_ms - self.latency_ms)
+        if ttft_ms is not None:
+            if self.ttft_ms is None:
+                self.ttft_ms = ttft_ms
+            else:
+                self.ttft_ms += _EWMA_ALPHA * (ttft_ms - self.ttft_ms)
+
+
+def _explore_rate() -> float:
+    return float(get_env("CACHE_LM_ADAPTIVE_EXPLORE", "0.1") or "0.1")
+
+
+def _min_samples() -> int:
+    return int(get_env("CACHE_LM_ADAPTIVE_MIN_SAMPLES", "3") or "3")
+
+
+class AdaptiveExecution:
+    # Online per-(mode, expert count) estimates of how long the expert phase
+    # of a turn takes (routing done -> response assembled), and the first
+    # visible token. A turn gets the mode with the lowest estimate; every
+    # mode is first tried `min_samples` times, and afterwards a random mode
+    # is explored with probability `explore`. Turns cut off by the budget
+    # are not sampled: their latency is the budget, not the mode's cost.
+
+    def __init__(self, *, rng: random.Random | None = None) -> None:
+        self._lock = threading.Lock()
+        self._rng = rng or random.Random()
+        self._stats: dict[tuple[str, int], _ModeStats] = {}
+
+    def choose(self, experts: int) -> dict[str, object]:
+        if experts <= 1:
+            # With a single expert every mode runs the same one call.
+            mode, explored, predicted = "sequential", False, None
+        else:
+            with self._lock:
+                estimates = {
+                    m: self._stats.get((m, experts))
+                    for m in ADAPTIVE_MODES
+                }
+                untried = [
+                    m for m, s in estimates.items()
+                    if s is None or s.turns < _min_samples()
+                ]
+                explored = bool(untried) or (self._rng.random() <
+                                             _explore_rate())
+                if untried:
+                    mode = min(untried,
+                               key=lambda m: estimates[m].turns
+                               if estimates[m] else 0)
+                elif explored:
+                    mode = self._rng.choice(ADAPTIVE_MODES)
+                else:
+                    mode = min(ADAPTIVE_MODES,
+                               key=lambda m: estimates[m].latency_ms)
+                stats = estimates[mode]
+                predicted = stats.latency_ms if stats else None
+        return {
+            "mode": mode,
+            "experts": experts,
+            "explored": explored,
+            "predicted_ms": predicted,
+            "actual_ms": None,
+            "sampled": False,
+            "started_at": time.perf_counter(),
+        }
+
+    def record(self,
+               decision: dict[str, object],
+               *,
+               ttft_ms: float | None,
+               partial: bool = False) -> dict[str, object]:
+        actual_ms = (time.perf_counter() - decision["started_at"]) * 1000.0
+        if not partial:
+            with self._lock:
+                key = (decision["mode"], decision["experts"])
+                self._stats.setdefault(key, _ModeStats()).record(
+                    actual_ms, ttft_ms)
+        return decision | {"actual_ms": actual_ms, "sampled": not partial}
+
+    def stats(self) -> dict[str, dict[str, float | int | None]]:
+        with self._lock:
+            return {
+                f"{mode}/{experts}": {
+                    "turns": s.turns,
+                    "latency_ms": s.latency_ms,
+                    "ttft_ms": s.ttft_ms,
+                }
+                for (mode, experts), s in sorted(self._stats.items())
+            }
+
+
+_ADAPTIVE = AdaptiveExecution()
+
+
+def get_adaptive_execution() -> AdaptiveExecution:
+    return _ADAPTIVE
+
+
+def reset_adaptive_execution(*, rng: random.Random | None = None) -> None:
+    global _ADAPTIVE
+    _ADAPTIVE = AdaptiveExecution(rng=rng)
+
+
+def adaptive_stats() -> dict[str, dict[str, float | int | None]]:
+    return _ADAPTIVE.stats()
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+from collections.abc import Iterator
+from concurrent.futures import as_completed
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from dataclasses import dataclass
+from dataclasses import field
+import json
+from pathlib import Path
+import statistics
+import time
+
+from langchain_core.messages import HumanMessage
+
+from cache_lm.graph import compiled_graph
+
+
+@dataclass(frozen=True)
+class BatchRecord:
+    id: str
+    input: str
+    manual_id: str | None = None
+
+
+@dataclass
+class BatchSummary:
+    completed: int = 0
+    failed: int = 0
+    # Records already in the output file from an earlier run.
+    skipped: int = 0
+    wall_s: float = 0.0
+    latencies_ms: list[float] = field(default_factory=list, repr=False)
+    ttfts_ms: list[float] = field(default_factory=list, repr=False)
+
+    @property
+    def records_per_s(self) -> float:
+        return self.completed / self.wall_s if self.wall_s else 0.0
+
+    def as_dict(self) -> dict[str, float | int | None]:
+        return {
+            "completed": self.completed,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "wall_s": self.wall_s,
+            "records_per_s": self.records_per_s,
+            "p50_latency_ms": _percentile(self.latencies_ms, 50),
+            "p95_latency_ms": _percentile(self.latencies_ms, 95),
+            "p50_ttft_ms": _percentile(self.ttfts_ms, 50),
+        }
+
+
+def _percentile(values: list[float], pct: int) -> float | None:
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
+
+
+def read_records(path: Path) -> Iterator[BatchRecord | dict]:
+    # One JSON object per line: `{"input": ..., "id"?: ..., "manual_id"?:
+    # ...}`. Lines are read lazily, so the input can be larger than memory.
+    # A line that cannot be used yields its error record instead.
+    with path.open(encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+                user_input = data["input"]
+                if not isinstance(user_input, str):
+                    raise TypeError("'input' must be a string")
+            except (json.JSONDecodeError, KeyError, TypeError) as exc:
+                yield {"id": str(line_no), "error": f"invalid record: {exc}"}
+                continue
+            yield BatchRecord(
+                id=str(data.get("id", line_no)),
+                input=user_input,
+                manual_id=data.get("manual_id"),
+            )
+
+
+def completed_ids(path: Path) -> set[str]:
+    # Ids with a successful result. A crash can leave a torn last line; it
+    # is cut off so appended results start on a line of their own.
+    if not path.exists():
+        return set()
+    data = path.read_bytes()
+    if data and not data.endswith(b"\n"):
+        with path.open("r+b") as f:
+            f.truncate(data.rfind(b"\n") + 1)
+    done: set[str] = set()
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "error" not in result:
+                done.add(str(result["id"]))
+    return done
+
+
+def run_record(graph, record: BatchRecord) -> dict[str, object]:
+    config = None
+    if record.manual_id:
+        config = {"configurable": {"manual_id": record.manual_id}}
+    started = time.perf_counter()
+    try:
+        state = graph.invoke(
+            {"messages": [HumanMessage(content=record.input)]},
+            config=config,
+        )
+    except Exception as exc:
+        return {
+            "id": record.id,
+            "error": f"{type(exc).__name__}: {exc}",
+            "latency_ms": (time.perf_counter() - started) * 1000.0,
+        }
+    return {
+        "id": record.id,
+        "input": record.input,
+        "response": state.get("response", ""),
+        "experts": list(state.get("expert_outputs") or {}),
+        "partial": bool(state.get("partial_response")),
+        "latency_ms": (time.perf_counter() - started) * 1000.0,
+        "ttft_ms": state.get("first_visible_token_ms"),
+        "ttft_ms_by_expert": state.get("ttft_ms_by_expert") or {},
+        "latency_ms_by_expert": state.get("latency_ms_by_expert") or {},
+    }
+
+
+def run_batch(input_path: Path,
+              output_path: Path,
+              *,
+              concurrency: int = 4,
+              resume: bool = True,
+              graph=None) -> BatchSummary:
+    # Every turn runs on the same compiled graph (and so the same pooled LLM
+    # connections). At most `concurrency` turns are in flight; the next input
+    # line is only read when one finishes, and each result is appended and
+    # flushed as soon as it is done, so a crash loses only in-flight turns.
+    graph = graph or compiled_graph()
+    concurrency = max(concurrency, 1)
+    summary = BatchSummary()
+    done = completed_ids(output_path) if resume else set()
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+
+    def write(out, result: dict[str, object]) -> None:
+        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        out.flush()
+        if "error" in result:
+            summary.failed += 1
+            return
+        summary.completed += 1
+        summary.latencies_ms.append(result["latency_ms"])
+        if result.get("ttft_ms") is not None:
+            summary.ttfts_ms.append(result["ttft_ms"])
+
+    mode = "a" if resume else "w"
+    with output_path.open(mode, encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=concurrency,
+                               thread_name_prefix="cache-lm-batch") as pool:
+        in_flight: set[Future] = set()
+        for record in read_records(input_path):
+            if isinstance(record, dict):
+                write(out, record)
+                continue
+            if record.id in done:
+                summary.skipped += 1
+                continue
+            if len(in_flight) >= concurrency:
+                finished, in_flight = wait(in_flight,
+                                           return_when=FIRST_COMPLETED)
+                for future in finished:
+                    write(out, future.result())
+            in_flight.add(pool.submit(run_record, graph, record))
+        for future in as_completed(in_flight):
+            write(out, future.result())
+    summary.wall_s = time.perf_counter() - started
+    return summary
@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from collections.abc import Callable
+from pathlib import Path
+import re
+import sqlite3
+import threading
+import time
+
+_TABLE_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class MemoryLru:
+
+    def __init__(self, *, max_entries: int, ttl_s: float | None) -> None:
+        self._max_entries = max_entries
+        self._ttl_s = ttl_s
+        # key -> (expires_at, value); ordered from least to most recently used.
+        self._entries: OrderedDict[str, tuple[float | None, str]]
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        expires_at = None
+        if self._ttl_s is not None:
+            expires_at = time.time() + self._ttl_s
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def purge(self, keep: Callable[[str], bool]) -> int:
+        with self._lock:
+            stale = [key for key in self._entries if not keep(key)]
+            for key in stale:
+                del self._entries[key]
+            return len(stale)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class SqliteStore:
+    # Rows carry a `tag` (e.g. manual_sha256). Lookups only match their own
+    # tag, and `purge_tags` drops everything written under tags that are no
+    # longer live.
+
+    def __init__(
+        self,
+        path: str | Path,
+        *,
+        table: str,
+        max_entries: int,
+        ttl_s: float | None,
+    ) -> None:
+        if not _TABLE_NAME.match(table):
+            raise ValueError(f"Invalid table name: {table!r}")
+        self._table = table
+        self._max_entries = max_entries
+        self._ttl_s = ttl_s
+        self._lock = threading.Lock()
+        db_path = Path(path)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                key TEXT PRIMARY KEY,
+                tag TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )""")
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed "
+                           f"ON {table} (accessed_at)")
+        self._conn.commit()
+
+    def get(self, key: str, *, tag: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, created_at FROM {self._table} "
+                "WHERE key = ? AND tag = ?",
+                (key, tag),
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if self._ttl_s is not None and created_at + self._ttl_s <= now:
+                self._conn.execute(f"DELETE FROM {self._table} WHERE key = ?",
+                                   (key, ))
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                f"UPDATE {self._table} SET accessed_at = ? WHERE key = ?",
+                (now, key))
+            self._conn.commit()
+            return value
+
+    def set(self, key: str, value: str, *, tag: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self._table} "
+                "(key, tag, value, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, tag, value, now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        if self._ttl_s is not None:
+            self._conn.execute(
+                f"DELETE FROM {self._table} WHERE created_at <= ?",
+                (now - self._ttl_s, ))
+        self._conn.execute(
+            f"DELETE FROM {self._table} WHERE key IN ("
+            f"SELECT key FROM {self._table} ORDER BY accessed_at DESC "
+            "LIMIT -1 OFFSET ?)",
+            (self._max_entries, ),
+        )
+
+    def purge_tags(self, is_live: Callable[[str], bool]) -> int:
+        with self._lock:
+            stale = [(tag, ) for (tag, ) in self._conn.execute(
+                f"SELECT DISTINCT tag FROM {self._table}") if not is_live(tag)]
+            before = self._conn.total_changes
+            self._conn.executemany(f"DELETE FROM {self._table} WHERE tag = ?",
+                                   stale)
+            self._conn.commit()
+            return self._conn.total_changes - before
+
+    def __len__(self) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT COUNT(*) FROM {self._table}").fetchone()
+            return int(row[0])
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _scoped_key(key: str, tag: str) -> str:
+    # Keys alone (e.g. a routing key) may repeat across tags.
+    return f"{tag}\0{key}"
+
+
+class TieredCache:
+    # Entries of several tags (e.g. one per resident manual) live side by
+    # side; a lookup only matches entries written under its own tag. The
+    # first time a tag is seen, entries of tags `is_live` rejects are purged
+    # from both tiers. Without `is_live` nothing is purged eagerly; stale
+    # entries can never match and age out through the LRU and TTL.
+
+    def __init__(self,
+                 memory: MemoryLru,
+                 sqlite: SqliteStore | None,
+                 *,
+                 is_live: Callable[[str], bool] | None = None) -> None:
+        self.memory = memory
+        self.sqlite = sqlite
+        self._is_live = is_live
+        self._tags: set[str] = set()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.sqlite_hits = 0
+        self.misses = 0
+
+    def _ensure_tag(self, tag: str) -> None:
+        with self._lock:
+            if tag in self._tags:
+                return
+            self._tags.add(tag)
+        if self._is_live is None:
+            return
+
+        def is_live(candidate: str) -> bool:
+            return candidate == tag or self._is_live(candidate)
+
+        self.memory.purge(lambda key: is_live(key.split("\0", 1)[0]))
+        if self.sqlite is not None:
+            self.sqlite.purge_tags(is_live)
+        with self._lock:
+            self._tags = {t for t in self._tags if is_live(t)}
+
+    def get(self, key: str, *, tag: str) -> str | None:
+        self._ensure_tag(tag)
+        scoped = _scoped_key(key, tag)
+        value = self.memory.get(scoped)
+        if value is not None:
+            with self._lock:
+                self.memory_hits += 1
+            return value
+        if self.sqlite is not None:
+            value = self.sqlite.get(scoped, tag=tag)
+            if value is not None:
+                self.memory.set(scoped, value)
+                with self._lock:
+                    self.sqlite_hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: str, *, tag: str) -> None:
+        self._ensure_tag(tag)
+        scoped = _scoped_key(key, tag)
+        self.memory.set(scoped, value)
+        if self.sqlite is not None:
+            self.sqlite.set(scoped, value, tag=tag)
+
+    def stats(self) -> dict[str, float | int]:
+        with self._lock:
+            hits = self.memory_hits + self.sqlite_hits
+            lookups = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "sqlite_hits": self.sqlite_hits,
+                "misses": self.misses,
+                "hit_ratio": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self.memory),
+            }
+
+    def close(self) -> None:
+        if self.sqlite is not None:
+            self.sqlite.close()
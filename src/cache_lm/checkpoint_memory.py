@@ -0,0 +1,299 @@
+from __future__ import annotations
+
+from collections import deque
+from collections import OrderedDict
+from collections.abc import Iterator
+import math
+from pathlib import Path
+import sqlite3
+import threading
+import time
+
+from langgraph.checkpoint.base import CheckpointTuple
+from langgraph.checkpoint.memory import InMemorySaver
+
+from cache_lm.env import get_env
+
+# Reload latencies kept for the p95.
+_RELOAD_SAMPLES = 256
+
+_SPILL_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS spilled_checkpoints (
+        thread_id TEXT NOT NULL,
+        checkpoint_ns TEXT NOT NULL,
+        checkpoint_id TEXT NOT NULL,
+        type TEXT,
+        checkpoint BLOB,
+        metadata_type TEXT,
+        metadata BLOB,
+        parent_checkpoint_id TEXT,
+        PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+    );
+    CREATE TABLE IF NOT EXISTS spilled_writes (
+        thread_id TEXT NOT NULL,
+        checkpoint_ns TEXT NOT NULL,
+        checkpoint_id TEXT NOT NULL,
+        task_id TEXT NOT NULL,
+        idx INTEGER NOT NULL,
+        channel TEXT NOT NULL,
+        type TEXT,
+        value BLOB,
+        task_path TEXT NOT NULL DEFAULT '',
+        PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+    );
+    CREATE TABLE IF NOT EXISTS spilled_blobs (
+        thread_id TEXT NOT NULL,
+        checkpoint_ns TEXT NOT NULL,
+        channel TEXT NOT NULL,
+        version TEXT NOT NULL,
+        type TEXT,
+        blob BLOB,
+        PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+    );
+"""
+
+
+def memory_limits() -> tuple[int, int, str | None]:
+    # (max threads, max bytes, spill DB); 0 means no limit.
+    max_threads = get_env("CACHE_LM_CHECKPOINT_MEMORY_MAX_THREADS", "0") or "0"
+    max_bytes = get_env("CACHE_LM_CHECKPOINT_MEMORY_MAX_BYTES", "0") or "0"
+    spill = (get_env("CACHE_LM_CHECKPOINT_MEMORY_SPILL_DB") or "").strip()
+    return int(max_threads), int(max_bytes), spill or None
+
+
+def _typed_bytes(typed: tuple[str, bytes]) -> int:
+    return len(typed[0]) + len(typed[1])
+
+
+class BoundedInMemorySaver(InMemorySaver):
+    # An `InMemorySaver` that keeps at most `max_threads` threads and
+    # `max_bytes` of serialized state resident (0: no limit). Past a limit
+    # the least recently used threads are evicted: dropped, or with
+    # `spill_path` moved to a SQLite file and reloaded the next time the
+    # thread is read or written. The thread being used is never evicted, so
+    # a single thread larger than `max_bytes` stays resident.
+    #
+    # Values are already serialized in memory, so spilling copies bytes
+    # without re-serializing. `list(None)` only covers resident threads.
+
+    def __init__(self,
+                 *,
+                 max_threads: int = 0,
+                 max_bytes: int = 0,
+                 spill_path: str | None = None,
+                 **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.max_threads = max_threads
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        # thread_id -> resident bytes, least recently used first.
+        self._resident: OrderedDict[str, int] = OrderedDict()
+        self._resident_bytes = 0
+        self._spilled: set[str] = set()
+        self._evictions = 0
+        self._dropped = 0
+        self._reload_ms: deque[float] = deque(maxlen=_RELOAD_SAMPLES)
+        self._reloads = 0
+        self._spill: sqlite3.Connection | None = None
+        if spill_path:
+            path = Path(spill_path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._spill = sqlite3.connect(str(path), check_same_thread=False)
+            self._spill.executescript(_SPILL_SCHEMA)
+            # Threads spilled by an earlier process are reloadable too.
+            self._spilled.update(row[0] for row in self._spill.execute(
+                "SELECT DISTINCT thread_id FROM spilled_checkpoints"))
+
+    def _add_bytes(self, thread_id: str, delta: int) -> None:
+        self._resident[thread_id] = self._resident.get(thread_id, 0) + delta
+        self._resident.move_to_end(thread_id)
+        self._resident_bytes += delta
+
+    def _touch(self, thread_id: str) -> None:
+        if thread_id in self._spilled:
+            self._reload(thread_id)
+        elif thread_id in self._resident:
+            self._resident.move_to_end(thread_id)
+
+    def _enforce(self, current: str) -> None:
+        while len(self._resident) > 1 and (
+            (self.max_threads and len(self._resident) > self.max_threads) or
+            (self.max_bytes and self._resident_bytes > self.max_bytes)):
+            victim = next(iter(self._resident))
+            if victim == current:
+                self._resident.move_to_end(victim)
+                victim = next(iter(self._resident))
+            self._evict(victim)
+
+    def _take_thread(self, thread_id: str):
+        checkpoints = self.storage.pop(thread_id, {})
+        writes = {
+            k: self.writes.pop(k)
+            for k in [k for k in self.writes if k[0] == thread_id]
+        }
+        blobs = {
+            k: self.blobs.pop(k)
+            for k in [k for k in self.blobs if k[0] == thread_id]
+        }
+        self._resident_bytes -= self._resident.pop(thread_id, 0)
+        return checkpoints, writes, blobs
+
+    def _evict(self, thread_id: str) -> None:
+        checkpoints, writes, blobs = self._take_thread(thread_id)
+        self._evictions += 1
+        if self._spill is None:
+            self._dropped += 1
+            return
+        with self._spill:
+            self._spill.executemany(
+                "INSERT OR REPLACE INTO spilled_checkpoints VALUES "
+                "(?, ?, ?, ?, ?, ?, ?, ?)",
+                [(thread_id, ns, checkpoint_id, *checkpoint, *metadata, parent)
+                 for ns, by_id in checkpoints.items()
+                 for checkpoint_id, (checkpoint, metadata,
+                                     parent) in by_id.items()])
+            self._spill.executemany(
+                "INSERT OR REPLACE INTO spilled_writes VALUES "
+                "(?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(thread_id, ns, checkpoint_id, task_id, idx, channel, *value,
+                  task_path)
+                 for (_, ns, checkpoint_id), by_task in writes.items()
+                 for (task_id, idx), (_, channel, value,
+                                      task_path) in by_task.items()])
+            self._spill.executemany(
+                "INSERT OR REPLACE INTO spilled_blobs VALUES "
+                "(?, ?, ?, ?, ?, ?)",
+                [(thread_id, ns, channel, version, *value)
+                 for (_, ns, channel, version), value in blobs.items()])
+        self._spilled.add(thread_id)
+
+    def _reload(self, thread_id: str) -> None:
+        start = time.perf_counter()
+        size = 0
+        with self._spill:
+            for (ns, checkpoint_id, type_, checkpoint, metadata_type, metadata,
+                 parent) in self._spill.execute(
+                     "SELECT checkpoint_ns, checkpoint_id, type, checkpoint, "
+                     "metadata_type, metadata, parent_checkpoint_id "
+                     "FROM spilled_checkpoints WHERE thread_id = ?",
+                     (thread_id, )):
+                entry = ((type_, checkpoint), (metadata_type, metadata),
+                         parent)
+                self.storage[thread_id][ns][checkpoint_id] = entry
+                size += _typed_bytes(entry[0]) + _typed_bytes(entry[1])
+            for (ns, checkpoint_id, task_id, idx, channel, type_, value,
+                 task_path) in self._spill.execute(
+                     "SELECT checkpoint_ns, checkpoint_id, task_id, idx, "
+                     "channel, type, value, task_path FROM spilled_writes "
+                     "WHERE thread_id = ?", (thread_id, )):
+                self.writes[(thread_id, ns,
+                             checkpoint_id)][(task_id,
+                                              idx)] = (task_id, channel,
+                                                       (type_,
+                                                        value), task_path)
+                size += _typed_bytes((type_, value))
+            for ns, channel, version, type_, blob in self._spill.execute(
+                    "SELECT checkpoint_ns, channel, version, type, blob "
+                    "FROM spilled_blobs WHERE thread_id = ?", (thread_id, )):
+                self.blobs[(thread_id, ns, channel, version)] = (type_, blob)
+                size += _typed_bytes((type_, blob))
+            for table in ("spilled_checkpoints", "spilled_writes",
+                          "spilled_blobs"):
+                self._spill.execute(f"DELETE FROM {table} WHERE thread_id = ?",
+                                    (thread_id, ))
+        self._spilled.discard(thread_id)
+        self._add_bytes(thread_id, size)
+        self._reloads += 1
+        self._reload_ms.append((time.perf_counter() - start) * 1000.0)
+
+    def get_tuple(self, config) -> CheckpointTuple | None:
+        thread_id = str(config["configurable"]["thread_id"])
+        with self._lock:
+            self._touch(thread_id)
+            tuple_ = super().get_tuple(config)
+            if thread_id not in self._resident:
+                # Reading an unknown thread leaves empty defaultdict entries.
+                self.storage.pop(thread_id, None)
+            else:
+                self._enforce(thread_id)
+            return tuple_
+
+    def list(self, config, **kwargs) -> Iterator[CheckpointTuple]:
+        with self._lock:
+            if config is not None:
+                thread_id = str(config["configurable"]["thread_id"])
+                self._touch(thread_id)
+                if thread_id not in self._resident:
+                    self.storage.pop(thread_id, None)
+            tuples = list(super().list(config, **kwargs))
+        yield from tuples
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = str(config["configurable"]["thread_id"])
+        ns = config["configurable"]["checkpoint_ns"]
+        with self._lock:
+            self._touch(thread_id)
+            blob_keys = [(thread_id, ns, k, v)
+                         for k, v in new_versions.items()]
+            before = sum(
+                _typed_bytes(self.blobs[k]) for k in blob_keys
+                if k in self.blobs)
+            result = super().put(config, checkpoint, metadata, new_versions)
+            checkpoint_, metadata_, _ = self.storage[thread_id][ns][
+                checkpoint["id"]]
+            size = _typed_bytes(checkpoint_) + _typed_bytes(metadata_) + sum(
+                _typed_bytes(self.blobs[k]) for k in blob_keys)
+            self._add_bytes(thread_id, size - before)
+            self._enforce(thread_id)
+            return result
+
+    def put_writes(self, config, writes, task_id, task_path="") -> None:
+        configurable = config["configurable"]
+        thread_id = str(configurable["thread_id"])
+        key = (thread_id, configurable.get("checkpoint_ns",
+                                           ""), configurable["checkpoint_id"])
+        with self._lock:
+            self._touch(thread_id)
+            before = sum(
+                _typed_bytes(w[2]) for w in self.writes.get(key, {}).values())
+            super().put_writes(config, writes, task_id, task_path)
+            after = sum(
+                _typed_bytes(w[2]) for w in self.writes.get(key, {}).values())
+            self._add_bytes(thread_id, after - before)
+            self._enforce(thread_id)
+
+    def delete_thread(self, thread_id: str) -> None:
+        thread_id = str(thread_id)
+        with self._lock:
+            self._take_thread(thread_id)
+            if thread_id in self._spilled:
+                with self._spill:
+                    for table in ("spilled_checkpoints", "spilled_writes",
+                                  "spilled_blobs"):
+                        self._spill.execute(
+                            f"DELETE FROM {table} WHERE thread_id = ?",
+                            (thread_id, ))
+                self._spilled.discard(thread_id)
+
+    def memory_stats(self) -> dict[str, float | int | None]:
+        with self._lock:
+            reloads = sorted(self._reload_ms)
+            p95 = reloads[min(
+                len(reloads) - 1,
+                math.ceil(0.95 * len(reloads)) - 1)] if reloads else None
+            return {
+                "resident_threads": len(self._resident),
+                "resident_bytes": self._resident_bytes,
+                "spilled_threads": len(self._spilled),
+                "evictions": self._evictions,
+                "dropped": self._dropped,
+                "reloads": self._reloads,
+                "avg_reload_ms":
+                sum(reloads) / len(reloads) if reloads else None,
+                "p95_reload_ms": p95,
+            }
+
+    def close(self) -> None:
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
@@ -0,0 +1,620 @@
+from __future__ import annotations
+
+import asyncio
+import atexit
+from collections import deque
+from collections import OrderedDict
+from collections.abc import AsyncIterator
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import asdict
+from dataclasses import dataclass
+import math
+from pathlib import Path
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+
+from langgraph.checkpoint.base import CheckpointTuple
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from cache_lm.env import get_env
+
+# Write/commit latencies kept for the stats.
+_LATENCY_SAMPLES = 1000
+# 100-ns intervals between the UUID epoch (1582-10-15) and the Unix epoch.
+_UUID_EPOCH_OFFSET = 0x01B21DD213814000
+# Delta storage: marker stored in place of `messages`, the metadata key that
+# mirrors it (so SQL can see which deltas are live), and the cache sizes.
+_MESSAGES_REF = "__cache_lm_messages__"
+_HEAD_METADATA_KEY = "cache_lm_message_head"
+_COMPRESSED_SUFFIX = "+zlib"
+_ZLIB_LEVEL = 3
+_CACHED_HEADS = 256
+_CACHED_CHECKPOINTS = 4096
+
+
+def _synchronous() -> str:
+    value = (get_env("CACHE_LM_CHECKPOINT_SYNCHRONOUS", "NORMAL")
+             or "NORMAL").strip().upper()
+    if value not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+        raise ValueError(f"Invalid CACHE_LM_CHECKPOINT_SYNCHRONOUS: {value}")
+    return value
+
+
+def _compress_min_bytes() -> int:
+    value = get_env("CACHE_LM_CHECKPOINT_COMPRESS_MIN_BYTES", "1024") or "1024"
+    return int(value)
+
+
+def _commit_window_s() -> float:
+    value = get_env("CACHE_LM_CHECKPOINT_COMMIT_MS", "1000") or "1000"
+    return float(value) / 1000.0
+
+
+def tuned_pragmas() -> str:
+    # WAL lets readers proceed while a turn writes. In WAL mode, NORMAL only
+    # fsyncs when the WAL is checkpointed into the DB, so a commit no longer
+    # waits for the disk (a power loss can drop the last commits, but cannot
+    # corrupt the DB).
+    return (f"PRAGMA journal_mode=WAL; "
+            f"PRAGMA synchronous={_synchronous()}; "
+            f"PRAGMA busy_timeout=5000;")
+
+
+def _percentile(values: list[float], pct: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, math.ceil(pct * len(ordered)) - 1)]
+
+
+def _mean(values: list[float]) -> float | None:
+    return sum(values) / len(values) if values else None
+
+
+class TunedSqliteSaver(SqliteSaver):
+    # `SqliteSaver` commits after every `put`/`put_writes`, i.e. several times
+    # per turn. Inside `group_commits()` commits are deferred to the end of
+    # the group, or until the oldest uncommitted write is `commit_window_s`
+    # old, so a turn's checkpoint writes share one commit. The open write
+    # transaction holds SQLite's write lock meanwhile; other processes wait
+    # up to `busy_timeout`.
+
+    def __init__(self, conn: sqlite3.Connection, *,
+                 commit_window_s: float) -> None:
+        super().__init__(conn, serde=JsonPlusSerializer(pickle_fallback=True))
+        self.commit_window_s = commit_window_s
+        self._groups = 0
+        self._dirty_since: float | None = None
+        self._write_ms: deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+        self._commit_ms: deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+        self._writes = 0
+        self._commits = 0
+
+    def _commit(self) -> None:
+        # Caller holds `self.lock`.
+        started = time.perf_counter()
+        self.conn.commit()
+        self._commit_ms.append((time.perf_counter() - started) * 1000.0)
+        self._commits += 1
+        self._dirty_since = None
+
+    @contextmanager
+    def cursor(self, transaction: bool = True) -> Iterator[sqlite3.Cursor]:
+        with self.lock:
+            self.setup()
+            cur = self.conn.cursor()
+            try:
+                yield cur
+            finally:
+                if transaction:
+                    now = time.perf_counter()
+                    if self._dirty_since is None:
+                        self._dirty_since = now
+                    if (not self._groups or
+                            now - self._dirty_since >= self.commit_window_s):
+                        self._commit()
+                cur.close()
+
+    @contextmanager
+    def group_commits(self) -> Iterator[None]:
+        with self.lock:
+            self._groups += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self._groups -= 1
+                if not self._groups and self._dirty_since is not None:
+                    self._commit()
+
+    def _timed(self, method, *args, **kwargs):
+        # Serialization + INSERT (+ the commit, when not deferred).
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000.0
+            with self.lock:
+                self._write_ms.append(elapsed_ms)
+                self._writes += 1
+
+    def put(self, *args, **kwargs):
+        return self._timed(self._put, *args, **kwargs)
+
+    def _put(self, *args, **kwargs):
+        return super().put(*args, **kwargs)
+
+    def put_writes(self, *args, **kwargs) -> None:
+        self._timed(super().put_writes, *args, **kwargs)
+
+    def write_stats(self) -> dict[str, float | int | None]:
+        with self.lock:
+            write_ms = list(self._write_ms)
+            commit_ms = list(self._commit_ms)
+            writes, commits = self._writes, self._commits
+        return {
+            "writes": writes,
+            "commits": commits,
+            "writes_per_commit": writes / commits if commits else None,
+            "avg_write_ms": _mean(write_ms),
+            "p95_write_ms": _percentile(write_ms, 0.95),
+            "avg_commit_ms": _mean(commit_ms),
+        }
+
+    def close(self) -> None:
+        with self.lock:
+            if self._dirty_since is not None:
+                self._commit()
+            self.conn.close()
+
+
+class CompressingSerializer(SerializerProtocol):
+    # zlib-compresses payloads of at least `min_bytes` (when that makes them
+    # smaller); the type tag records it, so small payloads stay as they are.
+
+    def __init__(self, inner: SerializerProtocol, *, min_bytes: int) -> None:
+        self.inner = inner
+        self.min_bytes = min_bytes
+
+    def dumps_typed(self, obj) -> tuple[str, bytes]:
+        type_, data = self.inner.dumps_typed(obj)
+        if self.min_bytes > 0 and len(data) >= self.min_bytes:
+            packed = zlib.compress(data, _ZLIB_LEVEL)
+            if len(packed) < len(data):
+                return type_ + _COMPRESSED_SUFFIX, packed
+        return type_, data
+
+    def loads_typed(self, data: tuple[str, bytes]):
+        type_, payload = data
+        if type_.endswith(_COMPRESSED_SUFFIX):
+            return self.inner.loads_typed(
+                (type_[:-len(_COMPRESSED_SUFFIX)], zlib.decompress(payload)))
+        return self.inner.loads_typed(data)
+
+
+class DeltaSqliteSaver(TunedSqliteSaver):
+    # Stores `messages` append-only. A checkpoint whose messages differ from
+    # its parent's writes one `message_deltas` row: the messages after the
+    # common prefix (`start`) plus a link to the parent's row (its head).
+    # The checkpoint itself keeps only `{head, count}`, so a thread of N
+    # turns writes O(N) message bytes instead of O(N^2). Reads rebuild the
+    # list by walking the chain back from the head; forks and edits are just
+    # rows with a smaller `start`. Large payloads are zlib-compressed.
+    #
+    # DBs written this way must be read with this saver.
+
+    def __init__(self, conn: sqlite3.Connection, *,
+                 commit_window_s: float) -> None:
+        super().__init__(conn, commit_window_s=commit_window_s)
+        self.serde = CompressingSerializer(self.serde,
+                                           min_bytes=_compress_min_bytes())
+        self._cache_lock = threading.Lock()
+        # (thread_id, ns, head) -> messages; (thread_id, ns, checkpoint_id)
+        # -> head. Puts and reads of the same thread hit these.
+        self._head_messages: OrderedDict[tuple[str, str, str],
+                                         tuple] = OrderedDict()
+        self._checkpoint_heads: OrderedDict[tuple[str, str, str],
+                                            str | None] = OrderedDict()
+
+    def setup(self) -> None:
+        if self.is_setup:
+            return
+        super().setup()
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS message_deltas (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL DEFAULT '',
+                head TEXT NOT NULL,
+                parent_head TEXT,
+                start INTEGER NOT NULL,
+                type TEXT,
+                messages BLOB,
+                PRIMARY KEY (thread_id, checkpoint_ns, head)
+            )""")
+
+    def _cache(self, thread_id: str, ns: str, checkpoint_id: str,
+               head: str | None, messages: list | None) -> None:
+        with self._cache_lock:
+            key = (thread_id, ns, checkpoint_id)
+            self._checkpoint_heads[key] = head
+            self._checkpoint_heads.move_to_end(key)
+            while len(self._checkpoint_heads) > _CACHED_CHECKPOINTS:
+                self._checkpoint_heads.popitem(last=False)
+            if head is not None and messages is not None:
+                key = (thread_id, ns, head)
+                self._head_messages[key] = tuple(messages)
+                self._head_messages.move_to_end(key)
+                while len(self._head_messages) > _CACHED_HEADS:
+                    self._head_messages.popitem(last=False)
+
+    def _cached_messages(self, thread_id: str, ns: str,
+                         head: str) -> tuple | None:
+        with self._cache_lock:
+            messages = self._head_messages.get((thread_id, ns, head))
+            if messages is not None:
+                self._head_messages.move_to_end((thread_id, ns, head))
+            return messages
+
+    def _load_messages(self, thread_id: str, ns: str,
+                       head: str | None) -> list:
+        if head is None:
+            return []
+        cached = self._cached_messages(thread_id, ns, head)
+        if cached is not None:
+            return list(cached)
+        # Rows come back newest first; stop at the first cached ancestor.
+        rows = []
+        base: tuple = ()
+        with self.cursor(transaction=False) as cur:
+            cur.execute(
+                """
+                WITH RECURSIVE chain(head, parent_head, start, type, messages)
+                AS (
+                    SELECT head, parent_head, start, type, messages
+                    FROM message_deltas
+                    WHERE thread_id = ? AND checkpoint_ns = ? AND head = ?
+                    UNION ALL
+                    SELECT d.head, d.parent_head, d.start, d.type, d.messages
+                    FROM message_deltas d JOIN chain c
+                      ON d.thread_id = ? AND d.checkpoint_ns = ?
+                     AND d.head = c.parent_head
+                )
+                SELECT head, parent_head, start, type, messages FROM chain
+                """, (thread_id, ns, head, thread_id, ns))
+            for row in cur:
+                rows.append(row)
+                parent_head = row[1]
+                if parent_head is not None:
+                    cached = self._cached_messages(thread_id, ns, parent_head)
+                    if cached is not None:
+                        base = cached
+                        break
+        messages = list(base)
+        for _, _, start, type_, blob in reversed(rows):
+            del messages[start:]
+            messages.extend(self.serde.loads_typed((type_, blob)))
+        with self._cache_lock:
+            key = (thread_id, ns, head)
+            self._head_messages[key] = tuple(messages)
+            while len(self._head_messages) > _CACHED_HEADS:
+                self._head_messages.popitem(last=False)
+        return messages
+
+    def _expand(self, tuple_: CheckpointTuple) -> CheckpointTuple:
+        configurable = tuple_.config["configurable"]
+        thread_id = str(configurable["thread_id"])
+        ns = configurable.get("checkpoint_ns", "")
+        values = tuple_.checkpoint.get("channel_values") or {}
+        ref = values.get("messages")
+        if not (isinstance(ref, dict) and _MESSAGES_REF in ref):
+            # Written by another saver: messages are inline.
+            self._cache(thread_id, ns, configurable["checkpoint_id"], None,
+                        None)
+            return tuple_
+        head = ref[_MESSAGES_REF]
+        messages = self._load_messages(thread_id, ns, head)
+        self._cache(thread_id, ns, configurable["checkpoint_id"], head,
+                    messages)
+        checkpoint = {
+            **tuple_.checkpoint, "channel_values": {
+                **values, "messages": messages
+            }
+        }
+        return tuple_._replace(checkpoint=checkpoint)
+
+    def get_tuple(self, config) -> CheckpointTuple | None:
+        tuple_ = super().get_tuple(config)
+        return self._expand(tuple_) if tuple_ is not None else None
+
+    def list(self, config, **kwargs) -> Iterator[CheckpointTuple]:
+        # The base generator holds the connection lock while it yields, and
+        # expanding needs the connection: read the (small) rows first.
+        for tuple_ in list(super().list(config, **kwargs)):
+            yield self._expand(tuple_)
+
+    def _parent(self, thread_id: str, ns: str,
+                parent_id: str | None) -> tuple[str | None, list]:
+        # (head, messages) of the parent checkpoint; a parent with inline
+        # messages (or none) has no head, so the delta starts from scratch.
+        if parent_id is None:
+            return None, []
+        with self._cache_lock:
+            key = (thread_id, ns, parent_id)
+            known = key in self._checkpoint_heads
+            head = self._checkpoint_heads.get(key)
+        if not known:
+            self.get_tuple({
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": ns,
+                    "checkpoint_id": parent_id,
+                }
+            })
+            with self._cache_lock:
+                head = self._checkpoint_heads.get(key)
+        if head is None:
+            return None, []
+        return head, self._load_messages(thread_id, ns, head)
+
+    def _put(self, config, checkpoint, metadata, new_versions):
+        values = checkpoint.get("channel_values") or {}
+        messages = values.get("messages")
+        if not isinstance(messages, list):
+            return super()._put(config, checkpoint, metadata, new_versions)
+        configurable = config["configurable"]
+        thread_id = str(configurable["thread_id"])
+        ns = configurable.get("checkpoint_ns", "")
+        parent_head, parent_messages = self._parent(
+            thread_id, ns, configurable.get("checkpoint_id"))
+        start = 0
+        for old, new in zip(parent_messages, messages):
+            if old is not new and old != new:
+                break
+            start += 1
+        head = parent_head
+        with self.group_commits():
+            if start < len(parent_messages) or start < len(messages):
+                head = checkpoint["id"]
+                type_, blob = self.serde.dumps_typed(messages[start:])
+                with self.cursor() as cur:
+                    cur.execute(
+                        "INSERT OR REPLACE INTO message_deltas (thread_id, "
+                        "checkpoint_ns, head, parent_head, start, type, "
+                        "messages) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (thread_id, ns, head, parent_head, start, type_, blob))
+            self._cache(thread_id, ns, checkpoint["id"], head, messages)
+            ref = {_MESSAGES_REF: head, "count": len(messages)}
+            return super()._put(
+                config,
+                {
+                    **checkpoint, "channel_values": {
+                        **values, "messages": ref
+                    }
+                },
+                {
+                    **metadata, _HEAD_METADATA_KEY: head
+                },
+                new_versions,
+            )
+
+    def delete_thread(self, thread_id: str) -> None:
+        super().delete_thread(thread_id)
+        with self.cursor() as cur:
+            cur.execute("DELETE FROM message_deltas WHERE thread_id = ?",
+                        (str(thread_id), ))
+        with self._cache_lock:
+            for cache in (self._head_messages, self._checkpoint_heads):
+                for key in [k for k in cache if k[0] == str(thread_id)]:
+                    del cache[key]
+
+    # The shared saver serves `graph.ainvoke` too: each call runs on a worker
+    # thread (the connection is shared across threads already).
+    async def aget_tuple(self, config) -> CheckpointTuple | None:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, **kwargs) -> AsyncIterator[CheckpointTuple]:
+        tuples = await asyncio.to_thread(
+            lambda: list(self.list(config, **kwargs)))
+        for tuple_ in tuples:
+            yield tuple_
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata,
+                                       new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        await asyncio.to_thread(self.put_writes, config, writes, task_id,
+                                task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+# One long-lived saver (and connection) per DB file, shared by every thread
+# and turn of the process instead of a connection per run.
+_SHARED: dict[Path, TunedSqliteSaver] = {}
+_SHARED_LOCK = threading.Lock()
+
+
+def shared_sqlite_checkpointer(db_path: str,
+                               *,
+                               delta: bool = False) -> TunedSqliteSaver:
+    path = Path(db_path).resolve()
+    saver_class = DeltaSqliteSaver if delta else TunedSqliteSaver
+    with _SHARED_LOCK:
+        saver = _SHARED.get(path)
+        if saver is not None and type(saver) is not saver_class:
+            saver.close()
+            saver = None
+        if saver is None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(path), check_same_thread=False)
+            conn.executescript(tuned_pragmas())
+            saver = saver_class(conn, commit_window_s=_commit_window_s())
+            _SHARED[path] = saver
+        return saver
+
+
+def close_shared_checkpointers() -> None:
+    with _SHARED_LOCK:
+        savers = list(_SHARED.values())
+        _SHARED.clear()
+    for saver in savers:
+        saver.close()
+
+
+atexit.register(close_shared_checkpointers)
+
+
+def checkpoint_db_stats(db_path: str) -> dict[str, float | int | None]:
+    path = Path(db_path)
+    wal = path.with_name(path.name + "-wal")
+    stats: dict[str, float | int | None] = {
+        "db_bytes": path.stat().st_size if path.exists() else 0,
+        "wal_bytes": wal.stat().st_size if wal.exists() else 0,
+    }
+    with _SHARED_LOCK:
+        saver = _SHARED.get(path.resolve())
+    if saver is not None:
+        stats.update(saver.write_stats())
+    return stats
+
+
+def checkpoint_id_floor(unix_s: float) -> str:
+    # Smallest uuid6 checkpoint id generated at `unix_s`. LangGraph's ids are
+    # uuid6, whose string form sorts by creation time, so age filters are
+    # plain string comparisons.
+    timestamp = int(unix_s * 10_000_000) + _UUID_EPOCH_OFFSET
+    value = ((timestamp >> 12) & 0xFFFFFFFFFFFF) << 80
+    value |= (0x6000 | (timestamp & 0x0FFF)) << 64
+    return str(uuid.UUID(int=value))
+
+
+@dataclass(frozen=True)
+class PruneReport:
+    checkpoints_deleted: int
+    writes_deleted: int
+    deltas_deleted: int
+    checkpoints_kept: int
+    db_bytes_before: int
+    db_bytes_after: int
+
+    def as_dict(self) -> dict[str, int]:
+        return asdict(self)
+
+
+def _has_table(conn: sqlite3.Connection, name: str) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (name, )).fetchone() is not None
+
+
+def _prune_message_deltas(conn: sqlite3.Connection) -> int:
+    # Keeps the delta chains of the remaining checkpoints (their head is
+    # mirrored in the metadata JSON). `rowcount` is not set for statements
+    # starting with WITH, hence `total_changes`.
+    before = conn.total_changes
+    conn.execute(f"""
+        WITH RECURSIVE live(thread_id, checkpoint_ns, head) AS (
+            SELECT thread_id, checkpoint_ns,
+                   json_extract(CAST(metadata AS TEXT),
+                                '$.{_HEAD_METADATA_KEY}')
+            FROM checkpoints
+            UNION
+            SELECT d.thread_id, d.checkpoint_ns, d.parent_head
+            FROM message_deltas d JOIN live l
+              ON d.thread_id = l.thread_id
+             AND d.checkpoint_ns = l.checkpoint_ns AND d.head = l.head
+            WHERE d.parent_head IS NOT NULL
+        )
+        DELETE FROM message_deltas WHERE NOT EXISTS (
+            SELECT 1 FROM live l
+            WHERE l.thread_id = message_deltas.thread_id
+              AND l.checkpoint_ns = message_deltas.checkpoint_ns
+              AND l.head = message_deltas.head)
+        """)
+    return conn.total_changes - before
+
+
+def _file_bytes(path: Path) -> int:
+    return sum(p.stat().st_size
+               for p in (path, path.with_name(path.name + "-wal"))
+               if p.exists())
+
+
+def prune_checkpoints(db_path: str,
+                      *,
+                      keep_last: int,
+                      max_age_s: float | None = None,
+                      vacuum: bool = False,
+                      now: float | None = None) -> PruneReport:
+    # Keeps the newest `keep_last` checkpoints of every thread (0: no count
+    # limit) and drops checkpoints older than `max_age_s`, so threads idle
+    # for longer disappear entirely. Each checkpoint stores full channel
+    # values (or, with delta storage, a head whose chain is kept), so the
+    # newest one still restores the thread's state.
+    path = Path(db_path)
+    before = _file_bytes(path)
+    conn = sqlite3.connect(str(path))
+    try:
+        if not (_has_table(conn, "checkpoints")
+                and _has_table(conn, "writes")):
+            # No saver has set this DB up yet: nothing to prune, and the
+            # file is left as it is (no WAL switch).
+            return PruneReport(checkpoints_deleted=0,
+                               writes_deleted=0,
+                               deltas_deleted=0,
+                               checkpoints_kept=0,
+                               db_bytes_before=before,
+                               db_bytes_after=before)
+        conn.executescript(tuned_pragmas())
+        with conn:
+            deleted = 0
+            if keep_last > 0:
+                deleted += conn.execute(
+                    """
+                    DELETE FROM checkpoints WHERE rowid IN (
+                        SELECT rowid FROM (
+                            SELECT rowid, ROW_NUMBER() OVER (
+                                PARTITION BY thread_id, checkpoint_ns
+                                ORDER BY checkpoint_id DESC) AS rank
+                            FROM checkpoints)
+                        WHERE rank > ?)
+                    """, (keep_last, )).rowcount
+            if max_age_s:
+                cutoff = checkpoint_id_floor((now or time.time()) - max_age_s)
+                deleted += conn.execute(
+                    "DELETE FROM checkpoints WHERE checkpoint_id < ?",
+                    (cutoff, )).rowcount
+            writes = conn.execute("""
+                DELETE FROM writes WHERE NOT EXISTS (
+                    SELECT 1 FROM checkpoints c
+                    WHERE c.thread_id = writes.thread_id
+                      AND c.checkpoint_ns = writes.checkpoint_ns
+                      AND c.checkpoint_id = writes.checkpoint_id)
+                """).rowcount
+            deltas = 0
+            if _has_table(conn, "message_deltas"):
+                deltas = _prune_message_deltas(conn)
+        kept = conn.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0]
+        # Fold the WAL back into the DB so the freed pages are reusable (and,
+        # with `vacuum`, returned to the file system).
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        if vacuum:
+            conn.execute("VACUUM")
+    finally:
+        conn.close()
+    return PruneReport(
+        checkpoints_deleted=deleted,
+        writes_deleted=writes,
+        deltas_deleted=deltas,
+        checkpoints_kept=kept,
+        db_bytes_before=before,
+        db_bytes_after=_file_bytes(path),
+    )
@@ -1,27 +1,70 @@
 from __future__ import annotations
 
+from collections.abc import AsyncIterator
 from collections.abc import Iterator
+from contextlib import asynccontextmanager
 from contextlib import contextmanager
 from pathlib import Path
 import sqlite3
+from typing import Literal
 
 from langgraph.checkpoint.memory import InMemorySaver
 from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
 
+from cache_lm.env import get_env
 
-def inmemory_checkpointer() -> InMemorySaver:
-    return InMemorySaver(serde=JsonPlusSerializer(pickle_fallback=True))
+CheckpointMode = Literal["default", "tuned", "delta"]
+
+
+def get_checkpoint_mode() -> CheckpointMode:
+    value = (get_env("CACHE_LM_CHECKPOINT_MODE") or "").strip().lower()
+    if value in ("default", "tuned", "delta"):
+        return value  # type: ignore[return-value]
+    return "default"
+
+
+def inmemory_checkpointer(*,
+                          max_threads: int | None = None,
+                          max_bytes: int | None = None,
+                          spill_path: str | None = None) -> InMemorySaver:
+    # Unbounded unless a limit is passed or set via
+    # CACHE_LM_CHECKPOINT_MEMORY_MAX_THREADS / _MAX_BYTES.
+    from cache_lm.checkpoint_memory import BoundedInMemorySaver
+    from cache_lm.checkpoint_memory import memory_limits
+
+    env_threads, env_bytes, env_spill = memory_limits()
+    max_threads = env_threads if max_threads is None else max_threads
+    max_bytes = env_bytes if max_bytes is None else max_bytes
+    spill_path = spill_path or env_spill
+    serde = JsonPlusSerializer(pickle_fallback=True)
+    if not (max_threads or max_bytes):
+        return InMemorySaver(serde=serde)
+    return BoundedInMemorySaver(max_threads=max_threads,
+                                max_bytes=max_bytes,
+                                spill_path=spill_path,
+                                serde=serde)
 
 
 @contextmanager
 def sqlite_checkpointer(db_path: str) -> Iterator[object]:
     try:
         from langgraph.checkpoint.sqlite import SqliteSaver
+
+        from cache_lm.checkpoint_sqlite import shared_sqlite_checkpointer
     except ImportError as e:  # pragma: no cover
         raise RuntimeError(
             "SQLite checkpointer support requires `langgraph-checkpoint-sqlite` "
             "(install dependencies and retry).") from e
 
+    mode = get_checkpoint_mode()
+    if mode in ("tuned", "delta"):
+        # The process-wide saver stays open; what is written inside this
+        # block (one CLI turn) is committed together.
+        saver = shared_sqlite_checkpointer(db_path, delta=mode == "delta")
+        with saver.group_commits():
+            yield saver
+        return
+
     path = Path(db_path)
     path.parent.mkdir(parents=True, exist_ok=True)
     conn = sqlite3.connect(str(path), check_same_thread=False)
@@ -32,3 +75,38 @@ def sqlite_checkpointer(db_path: str) -> Iterator[object]:
         )
     finally:
         conn.close()
+
+
+@asynccontextmanager
+async def async_sqlite_checkpointer(db_path: str) -> AsyncIterator[object]:
+    try:
+        import aiosqlite
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+    except ImportError as e:  # pragma: no cover
+        raise RuntimeError(
+            "Async SQLite checkpointer support requires "
+            "`langgraph-checkpoint-sqlite` and `aiosqlite` (install "
+            "dependencies and retry).") from e
+
+    if get_checkpoint_mode() == "delta":
+        # Delta rows are read and written by the sync saver, so async runs
+        # share it too (its async methods run on worker threads).
+        from cache_lm.checkpoint_sqlite import shared_sqlite_checkpointer
+        yield shared_sqlite_checkpointer(db_path, delta=True)
+        return
+
+    path = Path(db_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = await aiosqlite.connect(str(path))
+    if get_checkpoint_mode() == "tuned":
+        # aiosqlite connections are bound to the event loop of the run, so the
+        # async path gets the pragmas but not the shared saver.
+        from cache_lm.checkpoint_sqlite import tuned_pragmas
+        await conn.executescript(tuned_pragmas())
+    try:
+        yield AsyncSqliteSaver(
+            conn,
+            serde=JsonPlusSerializer(pickle_fallback=True),
+        )
+    finally:
+        await conn.close()
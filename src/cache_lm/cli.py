@@ -1,36 +1,393 @@
 from __future__ import annotations
 
 import argparse
+import asyncio
 import json
+from pathlib import Path
 
 from langchain_core.messages import HumanMessage
 
+from cache_lm.batch import run_batch
+from cache_lm.checkpoint_sqlite import checkpoint_db_stats
+from cache_lm.checkpoint_sqlite import prune_checkpoints
+from cache_lm.checkpointing import async_sqlite_checkpointer
 from cache_lm.checkpointing import sqlite_checkpointer
 from cache_lm.env import get_env
 from cache_lm.graph import compiled_graph
 from cache_lm.graph import create_graph
-from cache_lm.manual import get_manual
-from cache_lm.prompts import system_prefix_hash
+from cache_lm.llm import chat_model_pool_stats
+from cache_lm.manual_registry import DEFAULT_MANUAL_ID
+from cache_lm.manual_registry import get_manual_registry
+from cache_lm.routing_cache import routing_cache_stats
+from cache_lm.scheduler import scheduler_stats
+from cache_lm.streaming import SECTION_ORDER
+from cache_lm.streaming import SectionOrderer
+from cache_lm.warmup import compare_router_layouts
+from cache_lm.warmup import warm_prefix
 
 
-def manual_stats() -> dict[str, object]:
-    manual = get_manual()
+def manual_stats(manual_id: str = DEFAULT_MANUAL_ID) -> dict[str, object]:
+    registered = get_manual_registry().get(manual_id)
     return {
-        "path": str(manual.path),
-        "bytes": len(manual.bytes),
-        "manual_sha256": manual.sha256,
-        "system_prefix_hash": system_prefix_hash(manual_text=manual.text),
+        "manual_id": registered.manual_id,
+        "path": str(registered.manual.path),
+        "bytes": registered.manual.size_bytes,
+        "manual_sha256": registered.manual.sha256,
+        "system_prefix_hash": registered.artifacts.system_prefix_hash,
     }
 
 
+def train_router(log_path: Path, output: Path, *, features: int, epochs: int,
+                 holdout: float) -> dict[str, object]:
+    # NumPy is only needed for the local router.
+    from cache_lm.router_local import evaluate_local_router
+    from cache_lm.router_local import load_routing_log
+    from cache_lm.router_local import local_router_threshold
+    from cache_lm.router_local import train_local_router
+
+    examples = load_routing_log(log_path)
+    # Every k-th decision is held out, so the split is reproducible.
+    step = round(1 / holdout) if 0 < holdout < 1 else 0
+    held = examples[::step] if step else []
+    train = [e for i, e in enumerate(examples) if not step or i % step]
+    model = train_local_router(train, n_features=features, epochs=epochs)
+    stats: dict[str, object] = {
+        "samples": len(train),
+        "holdout": len(held),
+        "artifact_bytes": model.save(output),
+    }
+    if held:
+        stats.update(
+            evaluate_local_router(model,
+                                  held,
+                                  threshold=local_router_threshold()))
+    return stats
+
+
+def _invoke(graph, inputs: dict, *, config: dict | None, stream: bool) -> dict:
+    if not stream:
+        return graph.invoke(inputs, config=config)
+    orderer = SectionOrderer()
+    result: dict = {}
+    for mode, chunk in graph.stream(inputs,
+                                    config=config,
+                                    stream_mode=["custom", "values"]):
+        if mode == "custom":
+            for text in orderer.feed(chunk):
+                print(text, end="", flush=True)
+        else:
+            result = chunk
+    print()
+    return result
+
+
+async def _ainvoke(graph, inputs: dict, *, config: dict | None,
+                   stream: bool) -> dict:
+    if not stream:
+        return await graph.ainvoke(inputs, config=config)
+    orderer = SectionOrderer()
+    result: dict = {}
+    async for mode, chunk in graph.astream(inputs,
+                                           config=config,
+                                           stream_mode=["custom", "values"]):
+        if mode == "custom":
+            for text in orderer.feed(chunk):
+                print(text, end="", flush=True)
+        else:
+            result = chunk
+    print()
+    return result
+
+
+def _run_turn(user_input: str, *, config: dict | None,
+              checkpoint_db: str | None, stream: bool) -> dict:
+    inputs = {"messages": [HumanMessage(content=user_input)]}
+    if checkpoint_db:
+        with sqlite_checkpointer(checkpoint_db) as checkpointer:
+            graph = create_graph().compile(checkpointer=checkpointer)
+            return _invoke(graph, inputs, config=config, stream=stream)
+    return _invoke(compiled_graph(), inputs, config=config, stream=stream)
+
+
+async def _arun_turn(user_input: str, *, config: dict | None,
+                     checkpoint_db: str | None, stream: bool) -> dict:
+    inputs = {"messages": [HumanMessage(content=user_input)]}
+    if checkpoint_db:
+        async with async_sqlite_checkpointer(checkpoint_db) as checkpointer:
+            graph = create_graph().compile(checkpointer=checkpointer)
+            return await _ainvoke(graph, inputs, config=config, stream=stream)
+    return await _ainvoke(compiled_graph(),
+                          inputs,
+                          config=config,
+                          stream=stream)
+
+
+def _print_metrics(result: dict) -> None:
+    ttft = result.get("ttft_ms_by_expert") or {}
+    latency = result.get("latency_ms_by_expert") or {}
+    cache_hits = result.get("cache_hit_by_expert") or {}
+    if not ttft:
+        return
+    print("\nmetrics:")
+    for expert in SECTION_ORDER:
+        if expert not in ttft:
+            continue
+        line = f"- {expert}: ttft_ms={ttft[expert]:.1f}"
+        lat_ms = latency.get(expert)
+        if lat_ms is not None:
+            line += f" latency_ms={lat_ms:.1f}"
+        prompt = (result.get("prompt_by_expert") or {}).get(expert)
+        if prompt:
+            line += (f" prompt_tokens~{prompt['prompt_tokens']} "
+                     f"cached_tokens~{prompt['cached_tokens']}")
+            if prompt["history_dropped"]:
+                line += f" history_dropped={prompt['history_dropped']}"
+        if cache_hits.get(expert):
+            line += " (cached)"
+        hedge = (result.get("hedge_by_expert") or {}).get(expert)
+        if hedge and hedge.get("fired"):
+            line += f" (hedged, winner={hedge['winner']})"
+        print(line)
+    first_visible = result.get("first_visible_token_ms")
+    if first_visible is not None:
+        line = f"- turn: first_visible_token_ms={first_visible:.1f}"
+        turn_ms = result.get("turn_latency_ms")
+        if turn_ms is not None:
+            line += f" turn_latency_ms={turn_ms:.1f}"
+        overlap_ms = result.get("router_overlap_ms_saved")
+        if overlap_ms is not None:
+            line += f" router_overlap_ms_saved={overlap_ms:.1f}"
+        if result.get("leader_expert"):
+            line += f" leader={result['leader_expert']}"
+        print(line)
+    decision = result.get("execution_decision")
+    if decision:
+        predicted = decision.get("predicted_ms")
+        predicted_text = f"{predicted:.1f}" if predicted is not None else "-"
+        print(f"- execution: mode={decision['mode']} "
+              f"experts={decision['experts']} "
+              f"predicted_ms={predicted_text} "
+              f"actual_ms={decision['actual_ms']:.1f} "
+              f"explored={decision['explored']} "
+              f"sampled={decision.get('sampled', True)}")
+    deadline = result.get("deadline")
+    if deadline:
+        print(f"- deadline: budget_ms={deadline['budget_ms']:.0f} "
+              f"cut_off={','.join(deadline['cut_off'])} "
+              f"skipped={','.join(deadline['skipped']) or '-'} "
+              f"ms_saved={deadline['ms_saved']:.1f} "
+              f"tokens_saved={deadline['tokens_saved']:.0f}")
+    router_ttft = result.get("router_ttft_ms")
+    if router_ttft is not None:
+        line = (f"- router_layout: {result.get('router_layout')} "
+                f"router_ttft_ms={router_ttft:.1f}")
+        first_expert_ttft = result.get("first_expert_ttft_ms")
+        if first_expert_ttft is not None:
+            line += f" first_expert_ttft_ms={first_expert_ttft:.1f}"
+        print(line)
+    manual_id = result.get("manual_id")
+    if manual_id:
+        manual = get_manual_registry().stats()["manuals"].get(manual_id, {})
+        print(f"- manual: id={manual_id} turns={manual.get('turns', 0)} "
+              f"system_prefix_hash={result.get('system_prefix_hash')}")
+    pool = chat_model_pool_stats()
+    print(f"- llm_pool: hits={pool['hits']} "
+          f"connections_opened={pool['connections_opened']} "
+          f"reuse_ratio={pool['connection_reuse_ratio']:.2f}")
+    _print_scheduler_stats()
+    confidence = result.get("local_router_confidence")
+    if confidence is not None:
+        # Imported here so NumPy is only needed in `local` mode.
+        from cache_lm.router_local import local_router_stats
+        local = local_router_stats()
+        print(f"- local_router: confidence={confidence:.2f} "
+              f"local_decisions={local['local_decisions']} "
+              f"llm_fallbacks={local['llm_fallbacks']} "
+              f"avg_predict_us={local['avg_predict_us']:.1f}")
+    speculation = result.get("speculation")
+    if speculation:
+        hit_rate = speculation["hit_rate"]
+        # No hit rate when the LLM router failed and the guess was kept.
+        hit_rate_text = "-" if hit_rate is None else f"{hit_rate:.2f}"
+        print(f"- speculation: hit_rate={hit_rate_text} "
+              f"kept={','.join(speculation['kept']) or '-'} "
+              f"cancelled={','.join(speculation['cancelled']) or '-'} "
+              f"added={','.join(speculation['added']) or '-'} "
+              f"wasted_tokens={speculation['wasted_tokens']}")
+    router_cache_hit = result.get("router_cache_hit")
+    if router_cache_hit is not None:
+        routing = routing_cache_stats()
+        hits = routing.get("memory_hits", 0) + routing.get("sqlite_hits", 0)
+        print(f"- router: cache_hit={router_cache_hit} hits={hits} "
+              f"misses={routing.get('misses', 0)} "
+              f"router_ms_saved={routing['router_ms_saved']:.1f}")
+
+
+def _print_scheduler_stats() -> None:
+    scheduler = scheduler_stats()
+    if scheduler is None:
+        return
+    print(f"- scheduler: queue_depth={scheduler['queue_depth']} "
+          f"max_queue_depth={scheduler['max_queue_depth']} "
+          f"waves={scheduler['waves']} "
+          f"avg_wave_size={scheduler['avg_wave_size']:.1f} "
+          f"hit_rate={scheduler['hit_rate']:.2f} "
+          f"timeouts={scheduler['timeouts']} "
+          f"avg_wait_ms={scheduler['avg_wait_ms']:.1f}")
+
+
+def _print_checkpoint_stats(db_path: str) -> None:
+    stats = checkpoint_db_stats(db_path)
+    line = (f"- checkpoints: db_bytes={stats['db_bytes']} "
+            f"wal_bytes={stats['wal_bytes']}")
+    if "writes" in stats:
+        # Write latencies are only tracked by the tuned saver.
+        for key in ("writes", "commits"):
+            line += f" {key}={stats[key]}"
+        for key in ("avg_write_ms", "p95_write_ms", "avg_commit_ms"):
+            value = stats[key]
+            line += f" {key}={value:.2f}" if value is not None else (
+                f" {key}=-")
+    print(line)
+
+
 def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(prog="cache-lm")
     subparsers = parser.add_subparsers(dest="command")
 
-    subparsers.add_parser(
+    stats_parser = subparsers.add_parser(
         "manual-stats",
         help="Print basic information about the operations manual.",
     )
+    stats_parser.add_argument(
+        "--manual-id",
+        default=DEFAULT_MANUAL_ID,
+        help="Manual to describe (see CACHE_LM_MANUAL_DIR).",
+    )
+
+    warm_parser = subparsers.add_parser(
+        "warm",
+        help=("Prefill the manual prefix + each expert suffix on the LLM "
+              "backend (KV cache warm-up)."),
+    )
+    warm_parser.add_argument(
+        "--force",
+        action="store_true",
+        help=("Warm even if this system_prefix_hash was already warmed "
+              "(e.g. after a backend restart)."),
+    )
+
+    layouts_parser = subparsers.add_parser(
+        "router-layouts",
+        help=("Compare router TTFT + first-expert TTFT for the standalone and "
+              "shared_prefix router layouts (CACHE_LM_ROUTER_LAYOUT)."),
+    )
+    layouts_parser.add_argument(
+        "--input",
+        required=True,
+        help="User input to route (and to send to the first expert).",
+    )
+    layouts_parser.add_argument(
+        "--repeats",
+        type=int,
+        default=3,
+        help="Cold runs per layout; medians are printed.",
+    )
+
+    train_parser = subparsers.add_parser(
+        "router-train",
+        help=("Train the local router classifier (CACHE_LM_ROUTER_MODE=local) "
+              "from logged LLM routing decisions (CACHE_LM_ROUTER_LOG)."),
+    )
+    train_parser.add_argument(
+        "--log",
+        required=True,
+        help="JSONL routing log written by the LLM router.",
+    )
+    train_parser.add_argument(
+        "--output",
+        default=None,
+        help=("Artifact path (default: CACHE_LM_LOCAL_ROUTER_MODEL or "
+              ".cache_lm/router_local.npz)."),
+    )
+    train_parser.add_argument(
+        "--features",
+        type=int,
+        default=1 << 13,
+        help="Number of hashed n-gram buckets.",
+    )
+    train_parser.add_argument("--epochs", type=int, default=200)
+    train_parser.add_argument(
+        "--holdout",
+        type=float,
+        default=0.1,
+        help="Share of decisions held out for evaluation (0 disables).",
+    )
+
+    batch_parser = subparsers.add_parser(
+        "batch",
+        help=("Answer a JSONL file of inputs on one compiled graph with "
+              "bounded concurrency."),
+    )
+    batch_parser.add_argument(
+        "--input",
+        required=True,
+        help='JSONL input, one {"input": ..., "id"?: ..., "manual_id"?: ...} '
+        "per line.",
+    )
+    batch_parser.add_argument(
+        "--output",
+        required=True,
+        help=("JSONL results, appended as turns complete. Ids already "
+              "answered there are skipped (resume)."),
+    )
+    batch_parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Maximum turns in flight.",
+    )
+    batch_parser.add_argument(
+        "--no-resume",
+        dest="resume",
+        action="store_false",
+        help="Overwrite --output instead of skipping answered ids.",
+    )
+
+    checkpoints_parser = subparsers.add_parser(
+        "checkpoints",
+        help="Inspect or prune a SQLite checkpoint DB.",
+    )
+    checkpoints_parser.add_argument(
+        "action",
+        choices=["stats", "prune"],
+        help=("`stats`: DB and WAL size. `prune`: apply the retention "
+              "policy."),
+    )
+    checkpoints_parser.add_argument(
+        "--checkpoint-db",
+        default=None,
+        help="SQLite DB path (default: CACHE_LM_CHECKPOINT_DB).",
+    )
+    checkpoints_parser.add_argument(
+        "--keep-last",
+        type=int,
+        default=None,
+        help=("Checkpoints to keep per thread, newest first; 0 keeps all "
+              "(default: CACHE_LM_CHECKPOINT_KEEP_LAST or 20)."),
+    )
+    checkpoints_parser.add_argument(
+        "--ttl-s",
+        type=float,
+        default=None,
+        help=("Delete checkpoints older than this many seconds; 0 disables "
+              "(default: CACHE_LM_CHECKPOINT_TTL_S or 0)."),
+    )
+    checkpoints_parser.add_argument(
+        "--vacuum",
+        action="store_true",
+        help="VACUUM after pruning to shrink the DB file.",
+    )
 
     run_parser = subparsers.add_parser(
         "run",
@@ -52,6 +409,35 @@ def build_parser() -> argparse.ArgumentParser:
         help=("SQLite DB path for persistence. If set, state is persisted per "
               "--thread-id across runs."),
     )
+    run_parser.add_argument(
+        "--manual-id",
+        default=None,
+        help=("Manual to answer from (graph config `configurable.manual_id`; "
+              "see CACHE_LM_MANUAL_DIR). Defaults to the operations manual."),
+    )
+    run_parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=None,
+        help=(
+            "Turn latency budget (graph config `configurable.turn_budget_ms`,"
+            " default CACHE_LM_TURN_BUDGET_MS). Experts still streaming "
+            "when it runs out are cancelled; the response is marked "
+            "partial."),
+    )
+    run_parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help=("Run the turn through the async path (`graph.ainvoke`, async "
+              "nodes and async SQLite checkpointer)."),
+    )
+    run_parser.add_argument(
+        "--stream",
+        action="store_true",
+        help=("Print expert tokens as they arrive (sections in final response "
+              "order)."),
+    )
     run_parser.add_argument(
         "--json",
         action="store_true",
@@ -75,13 +461,88 @@ def main(argv: list[str] | None = None) -> int:
         return 0
 
     if args.command == "manual-stats":
-        stats = manual_stats()
+        stats = manual_stats(args.manual_id)
+        print(f"manual_id: {stats['manual_id']}")
         print(f"path: {stats['path']}")
         print(f"bytes: {stats['bytes']}")
         print(f"manual_sha256: {stats['manual_sha256']}")
         print(f"system_prefix_hash: {stats['system_prefix_hash']}")
         return 0
 
+    if args.command == "warm":
+        report = warm_prefix(force=args.force)
+        print(f"system_prefix_hash: {report.system_prefix_hash}")
+        if report.skipped:
+            print("already warm (use --force to warm again)")
+            return 0
+        for result in report.results:
+            print(f"- {result.expert}: cold_ttft_ms={result.cold_ttft_ms:.1f} "
+                  f"warm_ttft_ms={result.warm_ttft_ms:.1f}")
+        return 0
+
+    if args.command == "router-layouts":
+        timings = compare_router_layouts(user_input=args.input,
+                                         repeats=args.repeats)
+        for timing in timings.values():
+            total_ms = timing.router_ttft_ms + timing.first_expert_ttft_ms
+            print(f"- {timing.layout}: router_ttft_ms="
+                  f"{timing.router_ttft_ms:.1f} first_expert="
+                  f"{timing.first_expert} first_expert_ttft_ms="
+                  f"{timing.first_expert_ttft_ms:.1f} total_ms={total_ms:.1f}")
+        return 0
+
+    if args.command == "router-train":
+        output = args.output or get_env("CACHE_LM_LOCAL_ROUTER_MODEL",
+                                        ".cache_lm/router_local.npz")
+        stats = train_router(Path(args.log),
+                             Path(output),
+                             features=args.features,
+                             epochs=args.epochs,
+                             holdout=args.holdout)
+        print(f"artifact: {output}")
+        for key, value in stats.items():
+            if isinstance(value, float):
+                value = f"{value:.3f}"
+            print(f"{key}: {value}")
+        return 0
+
+    if args.command == "batch":
+        summary = run_batch(Path(args.input),
+                            Path(args.output),
+                            concurrency=args.concurrency,
+                            resume=args.resume)
+        for key, value in summary.as_dict().items():
+            if isinstance(value, float):
+                value = f"{value:.1f}" if key != "records_per_s" else (
+                    f"{value:.2f}")
+            print(f"{key}: {value}")
+        _print_scheduler_stats()
+        return 0
+
+    if args.command == "checkpoints":
+        checkpoint_db = args.checkpoint_db or get_env("CACHE_LM_CHECKPOINT_DB")
+        if not checkpoint_db:
+            raise SystemExit("--checkpoint-db is required")
+        if not Path(checkpoint_db).exists():
+            raise SystemExit(f"no checkpoint DB at {checkpoint_db}")
+        if args.action == "stats":
+            _print_checkpoint_stats(checkpoint_db)
+            return 0
+        keep_last = args.keep_last
+        if keep_last is None:
+            keep_last = int(
+                get_env("CACHE_LM_CHECKPOINT_KEEP_LAST", "20") or "20")
+        ttl_s = args.ttl_s
+        if ttl_s is None:
+            ttl_s = float(get_env("CACHE_LM_CHECKPOINT_TTL_S", "0") or "0")
+        report = prune_checkpoints(checkpoint_db,
+                                   keep_last=keep_last,
+                                   max_age_s=ttl_s or None,
+                                   vacuum=args.vacuum)
+        for key, value in report.as_dict().items():
+            print(f"{key}: {value}")
+        return 0
+
     if args.command == "run":
         thread_id = args.thread_id or get_env("CACHE_LM_THREAD_ID")
         checkpoint_db = args.checkpoint_db or get_env("CACHE_LM_CHECKPOINT_DB")
@@ -90,53 +551,41 @@ def main(argv: list[str] | None = None) -> int:
             raise SystemExit(
                 "--checkpoint-db is required when --thread-id is set")
 
-        config = None
+        configurable: dict[str, object] = {}
         if thread_id:
-            config = {"configurable": {"thread_id": thread_id}}
-
-        if checkpoint_db:
-            if not thread_id:
-                raise SystemExit(
-                    "--thread-id is required when --checkpoint-db is set")
-            with sqlite_checkpointer(checkpoint_db) as checkpointer:
-                graph = create_graph().compile(checkpointer=checkpointer)
-                result = graph.invoke(
-                    {"messages": [HumanMessage(content=args.input)]},
-                    config=config,
-                )
+            configurable["thread_id"] = thread_id
+        if args.manual_id:
+            configurable["manual_id"] = args.manual_id
+        if args.budget_ms is not None:
+            configurable["turn_budget_ms"] = args.budget_ms
+        config = {"configurable": configurable} if configurable else None
+
+        if checkpoint_db and not thread_id:
+            raise SystemExit(
+                "--thread-id is required when --checkpoint-db is set")
+
+        if args.use_async:
+            result = asyncio.run(
+                _arun_turn(args.input,
+                           config=config,
+                           checkpoint_db=checkpoint_db,
+                           stream=args.stream))
         else:
-            graph = compiled_graph()
-            result = graph.invoke(
-                {"messages": [HumanMessage(content=args.input)]},
-                config=config,
-            )
+            result = _run_turn(args.input,
+                               config=config,
+                               checkpoint_db=checkpoint_db,
+                               stream=args.stream)
 
         if args.json:
             print(json.dumps(result, indent=2, default=str))
             return 0
 
-        print(result.get("response", ""))
+        if not args.stream:
+            print(result.get("response", ""))
         if args.show_metrics:
-            ttft = result.get("ttft_ms_by_expert") or {}
-            latency = result.get("latency_ms_by_expert") or {}
-            if ttft:
-                print("\nmetrics:")
-                ordered_experts = [
-                    "compliance_auditor",
-                    "technical_specialist",
-                    "support_concierge",
-                ]
-                for expert in ordered_experts:
-                    if expert not in ttft:
-                        continue
-                    ms = ttft[expert]
-                    lat_ms = latency.get(expert)
-                    if lat_ms is None:
-                        print(f"- {expert}: ttft_ms={ms:.1f}")
-                    else:
-                        print(
-                            f"- {expert}: ttft_ms={ms:.1f} latency_ms={lat_ms:.1f}"
-                        )
+            _print_metrics(result)
+            if checkpoint_db:
+                _print_checkpoint_stats(checkpoint_db)
         return 0
 
     raise ValueError(f"Unhandled command: {args.command}")
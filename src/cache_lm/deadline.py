@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import threading
+import time
+
+from cache_lm.env import get_env
+from cache_lm.state import Expert
+from cache_lm.state import State
+from cache_lm.streaming import SECTION_ORDER
+
+# Weight of the newest call in the running means.
+_EWMA_ALPHA = 0.2
+
+
+def turn_budget_ms(config: dict | None) -> float | None:
+    # `configurable.turn_budget_ms` (`cache-lm run --budget-ms`) overrides
+    # CACHE_LM_TURN_BUDGET_MS; unset or 0 means the turn has no budget.
+    configurable = (config or {}).get("configurable") or {}
+    value = configurable.get("turn_budget_ms")
+    if value is None:
+        value = get_env("CACHE_LM_TURN_BUDGET_MS", "0") or "0"
+    budget = float(value)
+    return budget if budget > 0 else None
+
+
+def remaining_s(deadline_at: float | None) -> float | None:
+    if deadline_at is None:
+        return None
+    return max(deadline_at - time.time(), 0.0)
+
+
+def expired(deadline_at: float | None) -> bool:
+    return deadline_at is not None and time.time() >= deadline_at
+
+
+class CompletionHistory:
+    # Running means of how long a complete (uncached) expert call takes and
+    # how many tokens it streams, per expert: what a cut-off call would still
+    # have cost.
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._means: dict[Expert, tuple[float, float]] = {}
+
+    def record(self, expert: Expert, *, latency_ms: float,
+               tokens: int) -> None:
+        with self._lock:
+            previous = self._means.get(expert)
+            if previous is None:
+                self._means[expert] = (latency_ms, float(tokens))
+                return
+            mean_ms, mean_tokens = previous
+            self._means[expert] = (
+                mean_ms + _EWMA_ALPHA * (latency_ms - mean_ms),
+                mean_tokens + _EWMA_ALPHA * (tokens - mean_tokens),
+            )
+
+    def estimate(self, expert: Expert) -> tuple[float, float] | None:
+        with self._lock:
+            return self._means.get(expert)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._means.clear()
+
+
+COMPLETION_HISTORY = CompletionHistory()
+
+
+def cutoff_record(expert: Expert, *, started: bool, elapsed_ms: float,
+                  streamed_tokens: int) -> dict[str, object]:
+    # Savings are None until the expert has completed a call to compare with.
+    ms_saved = tokens_saved = None
+    estimate = COMPLETION_HISTORY.estimate(expert)
+    if estimate is not None:
+        mean_ms, mean_tokens = estimate
+        ms_saved = max(mean_ms - elapsed_ms, 0.0)
+        tokens_saved = max(mean_tokens - streamed_tokens, 0.0)
+    return {
+        "started": started,
+        "elapsed_ms": elapsed_ms,
+        "streamed_tokens": streamed_tokens,
+        "ms_saved": ms_saved,
+        "tokens_saved": tokens_saved,
+    }
+
+
+def deadline_summary(state: State) -> dict[str, object] | None:
+    cutoff = state.get("cutoff_by_expert") or {}
+    if not cutoff:
+        return None
+    records = cutoff.values()
+    return {
+        "budget_ms":
+        state.get("turn_budget_ms"),
+        "cut_off": [expert for expert in SECTION_ORDER if expert in cutoff],
+        "skipped": [
+            expert for expert in SECTION_ORDER
+            if expert in cutoff and not cutoff[expert]["started"]
+        ],
+        # Backend time/tokens the cut-off calls would still have used.
+        "ms_saved":
+        sum(r["ms_saved"] or 0.0 for r in records),
+        "tokens_saved":
+        sum(r["tokens_saved"] or 0.0 for r in records),
+    }
+
+
+def partial_notice(summary: dict[str, object]) -> str:
+    return (
+        f"[Partial response: the {summary['budget_ms']:.0f} ms turn budget "
+        f"ran out before {', '.join(summary['cut_off'])} finished.]")
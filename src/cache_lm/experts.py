@@ -1,16 +1,49 @@
 from __future__ import annotations
 
+import asyncio
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+from dataclasses import dataclass
+from dataclasses import field
+import threading
 import time
+import uuid
 
+from cache_lm.deadline import COMPLETION_HISTORY
+from cache_lm.deadline import cutoff_record
+from cache_lm.deadline import expired
+from cache_lm.deadline import remaining_s
+from cache_lm.env import get_env
+from cache_lm.hedging import ahedged_stream
+from cache_lm.hedging import bounded_stream
+from cache_lm.hedging import hedge_delay_ms
+from cache_lm.hedging import hedged_stream
+from cache_lm.hedging import HedgeInfo
+from cache_lm.hedging import hedging_enabled
+from cache_lm.hedging import TTFT_HISTORY
+from cache_lm.history import history_token_budget
+from cache_lm.history import prompt_usage
 from cache_lm.llm import create_chat_model
-from cache_lm.manual import get_manual
+from cache_lm.llm import load_llm_config
+from cache_lm.manual_registry import get_manual_registry
 from cache_lm.message_text import message_role
 from cache_lm.message_text import message_to_text
 from cache_lm.mode import get_mode
-from cache_lm.prompts import build_messages
-from cache_lm.prompts import to_langchain_messages
+from cache_lm.prompts import build_langchain_messages
+from cache_lm.prompts import get_prompt_layout
+from cache_lm.response_cache import areplay_chunks
+from cache_lm.response_cache import get_response_cache
+from cache_lm.response_cache import replay_chunks
+from cache_lm.response_cache import response_cache_key
+from cache_lm.scheduler import get_scheduler
 from cache_lm.state import Expert
+from cache_lm.state import ExpertTask
 from cache_lm.state import State
+from cache_lm.streaming import cancel_event
+from cache_lm.streaming import end_event
+from cache_lm.streaming import stream_writer
+from cache_lm.streaming import token_event
 
 
 def _append_expert_output(
@@ -20,12 +53,24 @@ def _append_expert_output(
     output: str,
     ttft_ms: float | None,
     latency_ms: float | None,
+    cache_hit: bool | None = None,
+    hedge: dict[str, object] | None = None,
+    first_token_at: float | None = None,
+    prompt: dict[str, object] | None = None,
 ) -> dict[str, object]:
     update: dict[str, object] = {"expert_outputs": {expert: output}}
     if ttft_ms is not None:
         update["ttft_ms_by_expert"] = {expert: ttft_ms}
     if latency_ms is not None:
         update["latency_ms_by_expert"] = {expert: latency_ms}
+    if cache_hit is not None:
+        update["cache_hit_by_expert"] = {expert: cache_hit}
+    if hedge is not None:
+        update["hedge_by_expert"] = {expert: hedge}
+    if first_token_at is not None:
+        update["first_token_at_by_expert"] = {expert: first_token_at}
+    if prompt is not None:
+        update["prompt_by_expert"] = {expert: prompt}
     return update
 
 
@@ -68,131 +113,709 @@ def _history_as_chat_messages(history_messages: list) -> list[dict]:
     return converted
 
 
-def _call_expert_llm(
+@dataclass(frozen=True)
+class ExpertCallResult:
+    content: str
+    ttft_ms: float
+    latency_ms: float
+    cache_hit: bool = False
+    hedge: dict[str, object] | None = None
+    first_token_at: float | None = None
+    # Streamed chunks (one token each on OpenAI-compatible servers).
+    tokens: int = 0
+    # The turn budget ran out: before the backend call (`started=False`) or
+    # while it was streaming (`content` is then incomplete).
+    cut_off: bool = False
+    started: bool = True
+    # Estimated prompt/cached tokens and history window (`history.py`).
+    prompt: dict[str, object] | None = None
+    # TTFT from the moment the request was sent, i.e. without leader-gate
+    # and scheduler waits; what the hedge delay is learned from.
+    backend_ttft_ms: float | None = None
+
+
+@dataclass(frozen=True)
+class _PreparedCall:
+    messages: list
+    manual_sha256: str
+    system_prefix_hash: str
+    cache_key: str | None
+    prompt: dict[str, object]
+
+
+def _prepare_expert_call(
     *,
     expert: Expert,
     query: str,
     history_messages: list,
-) -> tuple[str, float, float]:
-    manual = get_manual()
-    prompt_messages = build_messages(
-        expert=expert,
-        user_input=query,
-        history=_history_as_chat_messages(history_messages) or None,
-        manual_text=manual.text,
+    manual_id: str | None = None,
+    manual_sha256: str | None = None,
+) -> _PreparedCall:
+    # The init node pins each turn to one manual version; a reload that lands
+    # mid-turn must not change the prefix for the remaining experts.
+    artifacts = get_manual_registry().for_turn(
+        manual_id=manual_id,
+        manual_sha256=manual_sha256,
+    ).artifacts
+    layout = get_prompt_layout()
+    prefix_message, suffix_message = artifacts.expert_system_messages[expert]
+    usage = prompt_usage(
+        prefix={
+            "role": "system",
+            "content": prefix_message.content
+        },
+        suffix={
+            "role": "system",
+            "content": suffix_message.content
+        },
+        history=_history_as_chat_messages(history_messages),
+        query=query,
+        budget=history_token_budget(expert),
+        layout=layout,
+    )
+    history = usage.pop("window")
+    cache_key = None
+    if get_response_cache() is not None:
+        cache_key = response_cache_key(
+            system_prefix_hash=artifacts.system_prefix_hash,
+            expert=expert,
+            history=history,
+            query=query,
+            llm_config=load_llm_config(),
+            layout=layout,
+        )
+    return _PreparedCall(
+        messages=build_langchain_messages(
+            expert=expert,
+            user_input=query,
+            history=history,
+            artifacts=artifacts,
+            layout=layout,
+        ),
+        manual_sha256=artifacts.manual_sha256,
+        system_prefix_hash=artifacts.system_prefix_hash,
+        cache_key=cache_key,
+        prompt=usage,
     )
-    lc_messages = to_langchain_messages(prompt_messages)
 
-    model = create_chat_model(streaming=True)
 
-    start = time.perf_counter()
-    first_token_time: float | None = None
-    parts: list[str] = []
-    for chunk in model.stream(lc_messages):
+def _cached_response(call: _PreparedCall) -> str | None:
+    cache = get_response_cache()
+    if cache is None or call.cache_key is None:
+        return None
+    return cache.get(call.cache_key, tag=call.manual_sha256)
+
+
+def _store_response(call: _PreparedCall, result: ExpertCallResult) -> None:
+    cache = get_response_cache()
+    if cache is None or call.cache_key is None or not result.content:
+        return
+    cache.set(call.cache_key, result.content, tag=call.manual_sha256)
+
+
+def _hedge_info(expert: Expert) -> HedgeInfo | None:
+    if not hedging_enabled():
+        return None
+    return HedgeInfo(delay_ms=hedge_delay_ms(expert))
+
+
+class _StreamTimer:
+    # Measures TTFT/latency and forwards every token to LangGraph's `custom`
+    # stream, so callers see tokens as they arrive instead of after `_finalize`.
+
+    def __init__(self, expert: Expert, call_id: str | None = None) -> None:
+        self.expert = expert
+        self.call_id = call_id
+        self.start = time.perf_counter()
+        self.first_token_time: float | None = None
+        self.first_token_at: float | None = None
+        self.sent: float | None = None
+        self.parts: list[str] = []
+        self.prompt: dict[str, object] | None = None
+        self._write = stream_writer()
+
+    def mark_sent(self) -> None:
+        self.sent = time.perf_counter()
+
+    def add(self, chunk) -> None:
         chunk_text = chunk.content
         if isinstance(chunk_text, str) and chunk_text:
-            if first_token_time is None:
-                first_token_time = time.perf_counter()
-            parts.append(chunk_text)
+            if self.first_token_time is None:
+                self.first_token_time = time.perf_counter()
+                self.first_token_at = time.time()
+            self.parts.append(chunk_text)
+            self._write(token_event(self.expert, chunk_text, self.call_id))
 
-    end = time.perf_counter()
-    if first_token_time is None:
-        first_token_time = end
+    def result(self,
+               *,
+               cache_hit: bool = False,
+               hedge: HedgeInfo | None = None,
+               cut_off: bool = False,
+               started: bool = True) -> ExpertCallResult:
+        end = time.perf_counter()
+        first_token_time = self.first_token_time
+        if first_token_time is None:
+            first_token_time = end
+        backend_ttft_ms = None
+        if self.sent is not None:
+            backend_ttft_ms = (first_token_time - self.sent) * 1000.0
 
-    content = "".join(parts).strip()
-    ttft_ms = (first_token_time - start) * 1000.0
-    latency_ms = (end - start) * 1000.0
-    return content, ttft_ms, latency_ms
+        return ExpertCallResult(
+            content="".join(self.parts).strip(),
+            ttft_ms=(first_token_time - self.start) * 1000.0,
+            latency_ms=(end - self.start) * 1000.0,
+            cache_hit=cache_hit,
+            hedge=hedge.as_state() if hedge is not None else None,
+            first_token_at=self.first_token_at,
+            tokens=len(self.parts),
+            cut_off=cut_off,
+            started=started,
+            prompt=self.prompt,
+            backend_ttft_ms=backend_ttft_ms,
+        )
 
 
-def _stub_output(expert_label: str, query: str) -> str:
-    return (
-        f"{expert_label} (stub): I will answer from the manual once LLM calls are "
-        f"wired in. Query: {query}")
+class PrimeGate:
+    # Leader/followers fan-out (`CACHE_LM_EXPERT_EXECUTION=leader`): opened
+    # by the leader's first token, i.e. once the backend has prefilled the
+    # shared System #1, so followers that start then get prefix-cache hits.
 
+    def __init__(self, participants: int) -> None:
+        self.participants = participants
+        self._opened = threading.Event()
+        self._lock = threading.Lock()
+        self._futures: list[tuple[asyncio.AbstractEventLoop,
+                                  asyncio.Future]] = []
 
-def technical_specialist_node(state: State) -> dict[str, object]:
-    query = _task_query_from_state(state)
-    if get_mode() != "llm":
-        return _append_expert_output(
-            state,
-            expert="technical_specialist",
-            output=_stub_output("Technical Specialist", query),
-            ttft_ms=None,
-            latency_ms=None,
-        )
+    def open(self) -> None:
+        with self._lock:
+            if self._opened.is_set():
+                return
+            self._opened.set()
+            futures, self._futures = self._futures, []
+        for loop, future in futures:
+            loop.call_soon_threadsafe(_resolve_future, future)
 
-    history, user_input = _prepare_history_and_user_input(
-        state_messages=list(state.get("messages", [])),
-        user_input=query,
-    )
-    content, ttft_ms, latency_ms = _call_expert_llm(
-        expert="technical_specialist",
-        query=user_input,
-        history_messages=history,
+    def wait(self, timeout_s: float) -> bool:
+        return self._opened.wait(timeout_s)
+
+    async def await_open(self, timeout_s: float) -> bool:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if self._opened.is_set():
+                return True
+            self._futures.append((loop, future))
+        try:
+            await asyncio.wait_for(future, timeout_s)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+def _resolve_future(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+# Gates by `prime_gate_id`; each expert of the turn takes the gate once and
+# the last one removes it.
+_PRIME_GATES: dict[str, PrimeGate] = {}
+_PRIME_LOCK = threading.Lock()
+
+
+def create_prime_gate(participants: int) -> str:
+    gate_id = uuid.uuid4().hex
+    with _PRIME_LOCK:
+        _PRIME_GATES[gate_id] = PrimeGate(participants)
+    return gate_id
+
+
+def _take_prime_gate(state: State) -> PrimeGate | None:
+    gate_id = state.get("prime_gate_id")
+    if not gate_id:
+        return None
+    with _PRIME_LOCK:
+        gate = _PRIME_GATES.get(gate_id)
+        if gate is not None:
+            gate.participants -= 1
+            if gate.participants <= 0:
+                del _PRIME_GATES[gate_id]
+    return gate
+
+
+def leader_max_wait_s() -> float:
+    value = get_env("CACHE_LM_LEADER_MAX_WAIT_MS", "10000") or "10000"
+    return float(value) / 1000.0
+
+
+def _gate_wait_s(deadline_at: float | None) -> float:
+    remaining = remaining_s(deadline_at)
+    if remaining is None:
+        return leader_max_wait_s()
+    return min(leader_max_wait_s(), remaining)
+
+
+def _record_completion(expert: Expert, call: _PreparedCall,
+                       result: ExpertCallResult) -> None:
+    if result.backend_ttft_ms is not None:
+        TTFT_HISTORY.record(expert, result.backend_ttft_ms)
+    COMPLETION_HISTORY.record(expert,
+                              latency_ms=result.latency_ms,
+                              tokens=result.tokens)
+    _store_response(call, result)
+
+
+def _call_expert_llm(
+    *,
+    expert: Expert,
+    query: str,
+    history_messages: list,
+    manual_id: str | None = None,
+    manual_sha256: str | None = None,
+    timer: _StreamTimer | None = None,
+    cancelled: threading.Event | None = None,
+    prime_gate: PrimeGate | None = None,
+    prime_leader: bool = False,
+    deadline_at: float | None = None,
+) -> ExpertCallResult:
+    call = _prepare_expert_call(
+        expert=expert,
+        query=query,
+        history_messages=history_messages,
+        manual_id=manual_id,
+        manual_sha256=manual_sha256,
     )
-    return _append_expert_output(
-        state,
-        expert="technical_specialist",
-        output=content,
-        ttft_ms=ttft_ms,
-        latency_ms=latency_ms,
+    cached = _cached_response(call)
+    timer = timer or _StreamTimer(expert)
+    timer.prompt = call.prompt
+    if cached is not None:
+        if prime_gate is not None and prime_leader:
+            prime_gate.open()
+        for chunk in replay_chunks(cached):
+            timer.add(chunk)
+        return timer.result(cache_hit=True)
+
+    # Followers wait (up to the max wait) for the leader's first token;
+    # the wait counts towards their TTFT.
+    leading = prime_gate if prime_leader else None
+    if prime_gate is not None and not prime_leader:
+        prime_gate.wait(_gate_wait_s(deadline_at))
+    scheduler = get_scheduler()
+    slot = None
+    if scheduler is not None:
+        slot = scheduler.acquire((call.system_prefix_hash, expert),
+                                 remaining_s(deadline_at))
+    if expired(deadline_at):
+        # The budget ran out while this call was held back: never send it.
+        if slot is not None:
+            slot.close()
+        if leading is not None:
+            leading.open()
+        return timer.result(cut_off=True, started=False)
+    try:
+        timer.mark_sent()
+        model = create_chat_model(streaming=True)
+        hedge = _hedge_info(expert)
+        if hedge is None:
+            make_stream = lambda: model.stream(call.messages)
+        else:
+            make_stream = lambda: hedged_stream(
+                lambda: model.stream(call.messages), info=hedge)
+        # With a budget the stream is pumped on a worker, so a stalled
+        # prefill or chunk cannot keep this call past the deadline.
+        stream = (make_stream() if deadline_at is None else bounded_stream(
+            make_stream, deadline_at=deadline_at))
+        for chunk in stream:
+            cut_off = expired(deadline_at)
+            if cut_off or (cancelled is not None and cancelled.is_set()):
+                # The partial answer is neither cached nor used for TTFT
+                # statistics.
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    close()
+                return timer.result(hedge=hedge, cut_off=cut_off)
+            timer.add(chunk)
+            if timer.first_token_time is not None:
+                if slot is not None:
+                    slot.first_token()
+                if leading is not None:
+                    leading.open()
+    except TimeoutError:
+        if not expired(deadline_at):
+            raise
+        return timer.result(hedge=hedge, cut_off=True)
+    finally:
+        if slot is not None:
+            slot.close()
+        if leading is not None:
+            # Followers never wait on a leader that failed.
+            leading.open()
+    result = timer.result(hedge=hedge)
+    _record_completion(expert, call, result)
+    return result
+
+
+async def _acall_expert_llm(
+    *,
+    expert: Expert,
+    query: str,
+    history_messages: list,
+    manual_id: str | None = None,
+    manual_sha256: str | None = None,
+    timer: _StreamTimer | None = None,
+    prime_gate: PrimeGate | None = None,
+    prime_leader: bool = False,
+    deadline_at: float | None = None,
+) -> ExpertCallResult:
+    call = _prepare_expert_call(
+        expert=expert,
+        query=query,
+        history_messages=history_messages,
+        manual_id=manual_id,
+        manual_sha256=manual_sha256,
     )
+    cached = _cached_response(call)
+    timer = timer or _StreamTimer(expert)
+    timer.prompt = call.prompt
+    if cached is not None:
+        if prime_gate is not None and prime_leader:
+            prime_gate.open()
+        async for chunk in areplay_chunks(cached):
+            timer.add(chunk)
+        return timer.result(cache_hit=True)
 
+    leading = prime_gate if prime_leader else None
+    if prime_gate is not None and not prime_leader:
+        await prime_gate.await_open(_gate_wait_s(deadline_at))
+    scheduler = get_scheduler()
+    slot = None
+    if scheduler is not None:
+        slot = await scheduler.aacquire((call.system_prefix_hash, expert),
+                                        remaining_s(deadline_at))
+    if expired(deadline_at):
+        if slot is not None:
+            slot.close()
+        if leading is not None:
+            leading.open()
+        return timer.result(cut_off=True, started=False)
 
-def compliance_auditor_node(state: State) -> dict[str, object]:
-    query = _task_query_from_state(state)
-    if get_mode() != "llm":
-        return _append_expert_output(
-            state,
-            expert="compliance_auditor",
-            output=_stub_output("Compliance Auditor", query),
-            ttft_ms=None,
-            latency_ms=None,
-        )
+    async def consume(stream) -> None:
+        try:
+            async for chunk in stream:
+                timer.add(chunk)
+                if timer.first_token_time is not None:
+                    if slot is not None:
+                        slot.first_token()
+                    if leading is not None:
+                        leading.open()
+        finally:
+            # Also runs when the deadline cancels us mid-chunk, so the
+            # backend request is closed rather than left to finish.
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    try:
+        timer.mark_sent()
+        model = create_chat_model(streaming=True)
+        hedge = _hedge_info(expert)
+        if hedge is None:
+            stream = model.astream(call.messages)
+        else:
+            stream = ahedged_stream(lambda: model.astream(call.messages),
+                                    info=hedge)
+        await asyncio.wait_for(consume(stream), remaining_s(deadline_at))
+    except TimeoutError:
+        if not expired(deadline_at):
+            raise
+        return timer.result(hedge=hedge, cut_off=True)
+    finally:
+        if slot is not None:
+            slot.close()
+        if leading is not None:
+            # Followers never wait on a leader that failed.
+            leading.open()
+    result = timer.result(hedge=hedge)
+    _record_completion(expert, call, result)
+    return result
+
+
+@dataclass
+class EarlyExpertCall:
+    # An expert call started by the router before routing finished (streaming
+    # or speculative dispatch). The timer is created up front so a cancelled
+    # call can still report how many tokens it had streamed.
+    task: ExpertTask
+    timer: _StreamTimer
+    cancelled: threading.Event = field(default_factory=threading.Event)
+    handle: Future | asyncio.Task | None = None
+
+    def cancel(self) -> int:
+        # Returns the tokens generated in vain (streamed chunks, which is one
+        # token per chunk on OpenAI-compatible servers).
+        self.cancelled.set()
+        if isinstance(self.handle, asyncio.Task):
+            self.handle.cancel()
+        return len(self.timer.parts)
 
+
+# Early calls keyed by (early_dispatch_id, expert). The expert node picks its
+# call up instead of starting a new one; calls run in a copy of the router's
+# context so their tokens still reach the graph's `custom` stream.
+_EARLY_CALLS: dict[tuple[str, Expert], EarlyExpertCall] = {}
+_EARLY_LOCK = threading.Lock()
+_EARLY_EXECUTOR = ThreadPoolExecutor(thread_name_prefix="cache-lm-early")
+
+
+def _early_call_kwargs(state: State, task: ExpertTask) -> dict[str, object]:
     history, user_input = _prepare_history_and_user_input(
         state_messages=list(state.get("messages", [])),
-        user_input=query,
+        user_input=task["query"],
     )
-    content, ttft_ms, latency_ms = _call_expert_llm(
-        expert="compliance_auditor",
-        query=user_input,
-        history_messages=history,
+    return {
+        "expert": task["expert"],
+        "query": user_input,
+        "history_messages": history,
+        "manual_id": state.get("manual_id"),
+        "manual_sha256": state.get("manual_sha256"),
+        "deadline_at": state.get("turn_deadline_at"),
+    }
+
+
+def _register_early_call(dispatch_id: str, early: EarlyExpertCall) -> None:
+    with _EARLY_LOCK:
+        _EARLY_CALLS[(dispatch_id, early.task["expert"])] = early
+
+
+def _early_timer(dispatch_id: str, expert: Expert) -> _StreamTimer:
+    return _StreamTimer(expert, call_id=f"{dispatch_id}/{expert}")
+
+
+def start_early_expert_call(state: State, task: ExpertTask, *,
+                            dispatch_id: str) -> EarlyExpertCall:
+    early = EarlyExpertCall(task=task,
+                            timer=_early_timer(dispatch_id, task["expert"]))
+    early.handle = _EARLY_EXECUTOR.submit(
+        contextvars.copy_context().run,
+        lambda: _call_expert_llm(**_early_call_kwargs(state, task),
+                                 timer=early.timer,
+                                 cancelled=early.cancelled),
     )
+    _register_early_call(dispatch_id, early)
+    return early
+
+
+def astart_early_expert_call(state: State, task: ExpertTask, *,
+                             dispatch_id: str) -> EarlyExpertCall:
+    early = EarlyExpertCall(task=task,
+                            timer=_early_timer(dispatch_id, task["expert"]))
+    early.handle = asyncio.ensure_future(
+        _acall_expert_llm(**_early_call_kwargs(state, task),
+                          timer=early.timer))
+    _register_early_call(dispatch_id, early)
+    return early
+
+
+def cancel_early_expert_call(dispatch_id: str, expert: Expert) -> int:
+    with _EARLY_LOCK:
+        early = _EARLY_CALLS.pop((dispatch_id, expert), None)
+    if early is None:
+        return 0
+    # Retracts the tokens it already streamed (see `SectionOrderer`).
+    stream_writer()(cancel_event(expert, early.timer.call_id))
+    return early.cancel()
+
+
+def _take_early_call(state: State, expert: Expert) -> EarlyExpertCall | None:
+    dispatch_id = state.get("early_dispatch_id")
+    if not dispatch_id:
+        return None
+    with _EARLY_LOCK:
+        return _EARLY_CALLS.pop((dispatch_id, expert), None)
+
+
+def _stub_output(expert_label: str, query: str) -> str:
+    return (
+        f"{expert_label} (stub): I will answer from the manual once LLM calls are "
+        f"wired in. Query: {query}")
+
+
+_EXPERT_LABELS: dict[Expert, str] = {
+    "technical_specialist": "Technical Specialist",
+    "compliance_auditor": "Compliance Auditor",
+    "support_concierge": "Support Concierge",
+}
+
+
+def _stub_update(state: State, *, expert: Expert,
+                 query: str) -> dict[str, object]:
+    output = _stub_output(_EXPERT_LABELS[expert], query)
+    write = stream_writer()
+    write(token_event(expert, output))
+    write(end_event(expert))
     return _append_expert_output(
         state,
-        expert="compliance_auditor",
-        output=content,
-        ttft_ms=ttft_ms,
-        latency_ms=latency_ms,
+        expert=expert,
+        output=output,
+        ttft_ms=None,
+        latency_ms=None,
     )
 
 
-def support_concierge_node(state: State) -> dict[str, object]:
+def _leader_update(state: State, expert: Expert) -> dict[str, object]:
+    if state.get("leader_expert") != expert:
+        return {}
+    return {"leader_expert": expert}
+
+
+def _cutoff_update(expert: Expert,
+                   *,
+                   started: bool,
+                   elapsed_ms: float,
+                   streamed_tokens: int,
+                   partial: str = "") -> dict[str, object]:
+    # A cut-off expert keeps the text it already streamed as its section, so
+    # the response matches the stream; `_finalize` also lists it as cut off.
+    stream_writer()(end_event(expert))
+    update: dict[str, object] = {
+        "cutoff_by_expert": {
+            expert:
+            cutoff_record(expert,
+                          started=started,
+                          elapsed_ms=elapsed_ms,
+                          streamed_tokens=streamed_tokens)
+        }
+    }
+    if partial:
+        update["expert_outputs"] = {expert: partial}
+    return update
+
+
+def _skip_update(state: State, expert: Expert) -> dict[str, object] | None:
+    # Experts reached after the turn budget ran out are not started at all.
+    if not expired(state.get("turn_deadline_at")):
+        return None
+    gate = _take_prime_gate(state)
+    if gate is not None and state.get("leader_expert") == expert:
+        gate.open()
+    early = _take_early_call(state, expert)
+    if early is not None:
+        # A call the router started is stopped rather than left streaming.
+        # Its section is already being printed (the route event came
+        # first), so what it streamed is kept, as for any cut-off call.
+        early.cancel()
+        if isinstance(early.handle, Future):
+            # Stops at its next chunk or at the (passed) deadline.
+            early.handle.exception()
+        return _result_update(state, expert, early.timer.result(cut_off=True))
+    return _cutoff_update(expert,
+                          started=False,
+                          elapsed_ms=0.0,
+                          streamed_tokens=0)
+
+
+def _result_update(state: State, expert: Expert,
+                   result: ExpertCallResult) -> dict[str, object]:
+    if result.cut_off:
+        return _cutoff_update(
+            expert,
+            started=result.started,
+            elapsed_ms=result.latency_ms if result.started else 0.0,
+            streamed_tokens=result.tokens,
+            partial=result.content,
+        ) | _leader_update(state, expert)
+    stream_writer()(end_event(expert))
+    return _append_expert_output(
+        state,
+        expert=expert,
+        output=result.content,
+        ttft_ms=result.ttft_ms,
+        latency_ms=result.latency_ms,
+        cache_hit=result.cache_hit,
+        hedge=result.hedge,
+        first_token_at=result.first_token_at,
+        prompt=result.prompt,
+    ) | _leader_update(state, expert)
+
+
+def _run_expert(state: State, *, expert: Expert) -> dict[str, object]:
     query = _task_query_from_state(state)
+    skipped = _skip_update(state, expert)
+    if skipped is not None:
+        return skipped
     if get_mode() != "llm":
-        return _append_expert_output(
-            state,
-            expert="support_concierge",
-            output=_stub_output("Support Concierge", query),
-            ttft_ms=None,
-            latency_ms=None,
+        return _stub_update(state, expert=expert, query=query)
+
+    early = _take_early_call(state, expert)
+    if early is not None and isinstance(early.handle, Future):
+        result = early.handle.result()
+    else:
+        history, user_input = _prepare_history_and_user_input(
+            state_messages=list(state.get("messages", [])),
+            user_input=query,
         )
+        result = _call_expert_llm(
+            expert=expert,
+            query=user_input,
+            history_messages=history,
+            manual_id=state.get("manual_id"),
+            manual_sha256=state.get("manual_sha256"),
+            prime_gate=_take_prime_gate(state),
+            prime_leader=state.get("leader_expert") == expert,
+            deadline_at=state.get("turn_deadline_at"),
+        )
+    return _result_update(state, expert, result)
 
-    history, user_input = _prepare_history_and_user_input(
-        state_messages=list(state.get("messages", [])),
-        user_input=query,
-    )
-    content, ttft_ms, latency_ms = _call_expert_llm(
-        expert="support_concierge",
-        query=user_input,
-        history_messages=history,
-    )
-    return _append_expert_output(
-        state,
-        expert="support_concierge",
-        output=content,
-        ttft_ms=ttft_ms,
-        latency_ms=latency_ms,
-    )
+
+async def _arun_expert(state: State, *, expert: Expert) -> dict[str, object]:
+    query = _task_query_from_state(state)
+    skipped = _skip_update(state, expert)
+    if skipped is not None:
+        return skipped
+    if get_mode() != "llm":
+        return _stub_update(state, expert=expert, query=query)
+
+    early = _take_early_call(state, expert)
+    if early is not None and isinstance(early.handle, asyncio.Future):
+        result = await early.handle
+    else:
+        history, user_input = _prepare_history_and_user_input(
+            state_messages=list(state.get("messages", [])),
+            user_input=query,
+        )
+        result = await _acall_expert_llm(
+            expert=expert,
+            query=user_input,
+            history_messages=history,
+            manual_id=state.get("manual_id"),
+            manual_sha256=state.get("manual_sha256"),
+            prime_gate=_take_prime_gate(state),
+            prime_leader=state.get("leader_expert") == expert,
+            deadline_at=state.get("turn_deadline_at"),
+        )
+    return _result_update(state, expert, result)
+
+
+def technical_specialist_node(state: State) -> dict[str, object]:
+    return _run_expert(state, expert="technical_specialist")
+
+
+def compliance_auditor_node(state: State) -> dict[str, object]:
+    return _run_expert(state, expert="compliance_auditor")
+
+
+def support_concierge_node(state: State) -> dict[str, object]:
+    return _run_expert(state, expert="support_concierge")
+
+
+async def atechnical_specialist_node(state: State) -> dict[str, object]:
+    return await _arun_expert(state, expert="technical_specialist")
+
+
+async def acompliance_auditor_node(state: State) -> dict[str, object]:
+    return await _arun_expert(state, expert="compliance_auditor")
+
+
+async def asupport_concierge_node(state: State) -> dict[str, object]:
+    return await _arun_expert(state, expert="support_concierge")
@@ -1,8 +1,11 @@
 from __future__ import annotations
 
+import time
 from typing import Literal
 
 from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import END
 from langgraph.graph import START
 from langgraph.graph import StateGraph
@@ -10,27 +13,109 @@ from langgraph.types import Overwrite
 from langgraph.types import Send
 
 from cache_lm import experts as expert_nodes
+from cache_lm.adaptive import get_adaptive_execution
+from cache_lm.deadline import deadline_summary
+from cache_lm.deadline import partial_notice
+from cache_lm.deadline import turn_budget_ms
 from cache_lm.env import get_env
-from cache_lm.manual import get_manual
-from cache_lm.prompts import system_prefix_hash
+from cache_lm.manual_registry import get_manual_registry
+from cache_lm.manual_registry import manual_id_from_config
+from cache_lm.manual_reload import record_manual_turn
+from cache_lm.mode import get_mode
+from cache_lm.router import arouter_node
+from cache_lm.router import aspeculative_router_node
+from cache_lm.router import astreaming_router_node
 from cache_lm.router import router_node
-from cache_lm.state import Expert
+from cache_lm.router import router_speculation_enabled
+from cache_lm.router import router_streaming_enabled
+from cache_lm.router import speculative_router_node
+from cache_lm.router import streaming_router_node
 from cache_lm.state import State
-
-ExpertExecutionMode = Literal["sequential", "parallel"]
-
-
-def _initialize_debug_metadata(state: State) -> dict[str, object]:
-    manual = get_manual()
+from cache_lm.streaming import partial_event
+from cache_lm.streaming import SECTION_ORDER
+from cache_lm.streaming import SECTION_SEPARATOR
+from cache_lm.streaming import stream_writer
+from cache_lm.warmup import ensure_prefix_warm
+from cache_lm.warmup import warmup_enabled
+
+ExpertExecutionMode = Literal["sequential", "parallel", "leader", "adaptive"]
+
+
+def _initialize_debug_metadata(state: State,
+                               config: RunnableConfig) -> dict[str, object]:
+    registry = get_manual_registry()
+    registered = registry.get(manual_id_from_config(config))
+    manual = registered.manual
+    if warmup_enabled() and get_mode() == "llm":
+        # No-op when this prefix hash is already warm (or being warmed); a new
+        # manual/prefix triggers a background re-warm.
+        ensure_prefix_warm(manual=manual)
+    registry.record_turn(registered.manual_id)
+    record_manual_turn(manual.sha256)
+    started_at = time.time()
+    budget_ms = turn_budget_ms(config)
     return {
-        "manual_sha256": manual.sha256,
-        "system_prefix_hash": system_prefix_hash(manual_text=manual.text),
-        "expert_outputs": Overwrite({}),
-        "response": Overwrite(""),
-        "pending_tasks": Overwrite([]),
-        "current_task": Overwrite(None),
-        "ttft_ms_by_expert": Overwrite({}),
-        "latency_ms_by_expert": Overwrite({}),
+        "manual_id":
+        registered.manual_id,
+        "manual_sha256":
+        manual.sha256,
+        "system_prefix_hash":
+        registered.artifacts.system_prefix_hash,
+        "expert_outputs":
+        Overwrite({}),
+        "response":
+        Overwrite(""),
+        "pending_tasks":
+        Overwrite([]),
+        "current_task":
+        Overwrite(None),
+        "ttft_ms_by_expert":
+        Overwrite({}),
+        "latency_ms_by_expert":
+        Overwrite({}),
+        "cache_hit_by_expert":
+        Overwrite({}),
+        "hedge_by_expert":
+        Overwrite({}),
+        "turn_started_at":
+        started_at,
+        "first_token_at_by_expert":
+        Overwrite({}),
+        "first_visible_token_ms":
+        None,
+        "local_router_confidence":
+        None,
+        "early_dispatch_id":
+        None,
+        "router_lead_ms_by_expert": {},
+        "router_overlap_ms_saved":
+        None,
+        "speculation":
+        None,
+        "router_layout":
+        None,
+        "router_ttft_ms":
+        None,
+        "first_expert_ttft_ms":
+        None,
+        "leader_expert":
+        None,
+        "turn_latency_ms":
+        None,
+        "execution_decision":
+        None,
+        "turn_budget_ms":
+        budget_ms,
+        "turn_deadline_at":
+        (started_at + budget_ms / 1000.0 if budget_ms is not None else None),
+        "cutoff_by_expert":
+        Overwrite({}),
+        "partial_response":
+        False,
+        "deadline":
+        None,
+        "prompt_by_expert":
+        Overwrite({}),
     }
 
 
@@ -49,57 +134,180 @@ def _dispatch(state: State) -> str:
     return current_task["expert"]
 
 
+def _first_visible_token_ms(state: State) -> float | None:
+    # Sections are shown in `SECTION_ORDER`, so the first token a reader sees
+    # is the first token of the first section that produced one.
+    started = state.get("turn_started_at")
+    first_tokens = state.get("first_token_at_by_expert") or {}
+    if not started:
+        return None
+    for expert in SECTION_ORDER:
+        if expert in first_tokens:
+            return (first_tokens[expert] - started) * 1000.0
+    return None
+
+
+def _turn_latency_ms(state: State) -> float | None:
+    started = state.get("turn_started_at")
+    return (time.time() - started) * 1000.0 if started else None
+
+
+def _first_expert_ttft_ms(state: State) -> float | None:
+    # TTFT of the expert call that started first: the one that finds the
+    # prefix exactly as warm (or cold) as the router left it.
+    ttft = state.get("ttft_ms_by_expert") or {}
+    first_tokens = state.get("first_token_at_by_expert") or {}
+    started = {
+        expert: first_tokens[expert] - ttft[expert] / 1000.0
+        for expert in ttft if expert in first_tokens
+    }
+    if not started:
+        return None
+    return ttft[min(started, key=started.__getitem__)]
+
+
+def _router_overlap_ms_saved(state: State) -> float | None:
+    # Without early dispatch every expert would start when routing finished;
+    # with it, expert i started `lead_i` earlier. Compare the two end times.
+    leads = state.get("router_lead_ms_by_expert") or {}
+    latencies = state.get("latency_ms_by_expert") or {}
+    if not leads or not latencies:
+        return None
+    sequential_end = max(latencies.values())
+    overlapped_end = max(latency - leads.get(expert, 0.0)
+                         for expert, latency in latencies.items())
+    return max(0.0, sequential_end - overlapped_end)
+
+
 def _finalize(state: State) -> dict[str, object]:
-    ordered: list[Expert] = [
-        "compliance_auditor",
-        "technical_specialist",
-        "support_concierge",
-    ]
     parts = []
-    for expert in ordered:
+    for expert in SECTION_ORDER:
         text = state.get("expert_outputs", {}).get(expert)
         if text:
             parts.append(text)
-    response = "\n\n".join(parts).strip()
+    response = SECTION_SEPARATOR.join(parts).strip()
+    summary = deadline_summary(state)
+    if summary is not None:
+        # Cut-off sections keep what they streamed; the notice names them.
+        notice = partial_notice(summary)
+        stream_writer()(partial_event(notice))
+        response = SECTION_SEPARATOR.join(filter(None, [response, notice]))
     if not response:
         response = "No expert produced an output."
-    return {"response": response, "messages": [AIMessage(content=response)]}
+    first_visible_ms = _first_visible_token_ms(state)
+    update: dict[str, object] = {
+        "response": response,
+        "messages": [AIMessage(content=response)],
+        "first_visible_token_ms": first_visible_ms,
+        "router_overlap_ms_saved": _router_overlap_ms_saved(state),
+        "first_expert_ttft_ms": _first_expert_ttft_ms(state),
+        "turn_latency_ms": _turn_latency_ms(state),
+        "partial_response": summary is not None,
+        "deadline": summary,
+    }
+    decision = state.get("execution_decision")
+    if decision is not None:
+        # Adaptive mode: feed the outcome back into the estimates.
+        update["execution_decision"] = get_adaptive_execution().record(
+            decision, ttft_ms=first_visible_ms, partial=summary is not None)
+    return update
 
 
 def get_expert_execution_mode() -> ExpertExecutionMode:
     value = (get_env("CACHE_LM_EXPERT_EXECUTION") or "").strip().lower()
-    if value in ("sequential", "parallel"):
+    if value in ("sequential", "parallel", "leader", "adaptive"):
         return value  # type: ignore[return-value]
     return "sequential"
 
 
-def _fanout_to_experts(state: State):
+def _fanout_to_experts(state: State, mode: ExpertExecutionMode | None = None):
+    mode = mode or get_expert_execution_mode()
     tasks = list(state.get("pending_tasks", []))
     if not tasks:
         return "finalize"
     # In parallel execution, `Send(...)` passes a per-task input dict to each
     # expert node. Expert nodes still need access to conversation history to
-    # build prompts correctly, so we include `messages` explicitly.
+    # build prompts correctly, so we include `messages` explicitly, plus the
+    # manual (id and version) this turn is pinned to and the turn deadline.
     messages = list(state.get("messages", []))
+    # Leader mode: all experts are sent together, but followers hold their
+    # backend call until the first task's expert has its first token.
+    leader: dict[str, object] = {}
+    if mode == "leader" and len(tasks) > 1 and get_mode() == "llm":
+        leader = {
+            "leader_expert": tasks[0]["expert"],
+            "prime_gate_id": expert_nodes.create_prime_gate(len(tasks)),
+        }
     return [
-        Send(task["expert"], {
-            "task": task,
-            "messages": messages
-        }) for task in tasks
+        Send(
+            task["expert"], {
+                "task": task,
+                "messages": messages,
+                "manual_id": state.get("manual_id"),
+                "manual_sha256": state.get("manual_sha256"),
+                "early_dispatch_id": state.get("early_dispatch_id"),
+                "turn_deadline_at": state.get("turn_deadline_at"),
+                **leader,
+            }) for task in tasks
     ]
 
 
+def _router_runnable() -> RunnableLambda:
+    # Nodes carry both implementations: `graph.invoke` runs the sync function,
+    # `graph.ainvoke` awaits the async one (`astream`/`ainvoke` model calls).
+    return RunnableLambda(router_node, afunc=arouter_node, name="router")
+
+
+def _parallel_router_runnable() -> RunnableLambda:
+    # Experts can only start before routing finishes when they run in
+    # parallel; the sequential chain keeps the blocking router. Speculation
+    # takes precedence over streaming when both are enabled.
+    if router_speculation_enabled():
+        return RunnableLambda(speculative_router_node,
+                              afunc=aspeculative_router_node,
+                              name="router")
+    if router_streaming_enabled():
+        return RunnableLambda(streaming_router_node,
+                              afunc=astreaming_router_node,
+                              name="router")
+    return _router_runnable()
+
+
+def _add_expert_nodes(graph: StateGraph) -> None:
+    graph.add_node(
+        "technical_specialist",
+        RunnableLambda(
+            expert_nodes.technical_specialist_node,
+            afunc=expert_nodes.atechnical_specialist_node,
+            name="technical_specialist",
+        ),
+    )
+    graph.add_node(
+        "compliance_auditor",
+        RunnableLambda(
+            expert_nodes.compliance_auditor_node,
+            afunc=expert_nodes.acompliance_auditor_node,
+            name="compliance_auditor",
+        ),
+    )
+    graph.add_node(
+        "support_concierge",
+        RunnableLambda(
+            expert_nodes.support_concierge_node,
+            afunc=expert_nodes.asupport_concierge_node,
+            name="support_concierge",
+        ),
+    )
+
+
 def _create_sequential_graph() -> StateGraph:
     graph = StateGraph(State)
 
     graph.add_node("init", _initialize_debug_metadata)
-    graph.add_node("router", router_node)
+    graph.add_node("router", _router_runnable())
     graph.add_node("next_task", _select_next_task)
 
-    graph.add_node("technical_specialist",
-                   expert_nodes.technical_specialist_node)
-    graph.add_node("compliance_auditor", expert_nodes.compliance_auditor_node)
-    graph.add_node("support_concierge", expert_nodes.support_concierge_node)
+    _add_expert_nodes(graph)
 
     graph.add_node("finalize", _finalize)
 
@@ -126,16 +334,17 @@ def _create_sequential_graph() -> StateGraph:
     return graph
 
 
-def _create_parallel_graph() -> StateGraph:
+def _create_parallel_graph(*, leader: bool = False) -> StateGraph:
     graph = StateGraph(State)
 
     graph.add_node("init", _initialize_debug_metadata)
-    graph.add_node("router", router_node)
+    # Early dispatch would start followers before the leader; leader mode
+    # keeps the blocking router.
+    graph.add_node(
+        "router",
+        _router_runnable() if leader else _parallel_router_runnable())
 
-    graph.add_node("technical_specialist",
-                   expert_nodes.technical_specialist_node)
-    graph.add_node("compliance_auditor", expert_nodes.compliance_auditor_node)
-    graph.add_node("support_concierge", expert_nodes.support_concierge_node)
+    _add_expert_nodes(graph)
 
     graph.add_node("finalize", _finalize)
 
@@ -161,9 +370,78 @@ def _create_parallel_graph() -> StateGraph:
     return graph
 
 
+def _choose_execution(state: State) -> dict[str, object]:
+    tasks = state.get("pending_tasks") or []
+    return {"execution_decision": get_adaptive_execution().choose(len(tasks))}
+
+
+def _adaptive_dispatch(state: State):
+    mode = state["execution_decision"]["mode"]
+    if mode == "sequential":
+        return "next_task"
+    return _fanout_to_experts(state, mode)
+
+
+def _after_expert(state: State) -> str:
+    decision = state.get("execution_decision") or {}
+    if decision.get("mode") == "sequential":
+        return "next_task"
+    return "finalize"
+
+
+def _create_adaptive_graph() -> StateGraph:
+    # Both shapes in one graph: after routing, `choose_execution` picks the
+    # mode for this turn, then either the `next_task` loop or a `Send`
+    # fan-out (optionally leader-gated) runs the experts.
+    graph = StateGraph(State)
+
+    graph.add_node("init", _initialize_debug_metadata)
+    graph.add_node("router", _router_runnable())
+    graph.add_node("choose_execution", _choose_execution)
+    graph.add_node("next_task", _select_next_task)
+
+    _add_expert_nodes(graph)
+
+    graph.add_node("finalize", _finalize)
+
+    graph.add_edge(START, "init")
+    graph.add_edge("init", "router")
+    graph.add_edge("router", "choose_execution")
+
+    experts = [
+        "technical_specialist", "compliance_auditor", "support_concierge"
+    ]
+    graph.add_conditional_edges(
+        "choose_execution",
+        _adaptive_dispatch,
+        ["next_task", *experts, "finalize"],
+    )
+    graph.add_conditional_edges(
+        "next_task",
+        _dispatch,
+        {
+            "technical_specialist": "technical_specialist",
+            "compliance_auditor": "compliance_auditor",
+            "support_concierge": "support_concierge",
+            "finalize": "finalize",
+        },
+    )
+    for expert in experts:
+        graph.add_conditional_edges(expert, _after_expert,
+                                    ["next_task", "finalize"])
+
+    graph.add_edge("finalize", END)
+    return graph
+
+
 def create_graph() -> StateGraph:
-    if get_expert_execution_mode() == "parallel":
+    mode = get_expert_execution_mode()
+    if mode == "adaptive":
+        return _create_adaptive_graph()
+    if mode == "parallel":
         return _create_parallel_graph()
+    if mode == "leader":
+        return _create_parallel_graph(leader=True)
     return _create_sequential_graph()
 
 
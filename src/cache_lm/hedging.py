@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from collections.abc import AsyncIterator
+from collections.abc import Callable
+from collections.abc import Iterator
+from dataclasses import dataclass
+import math
+import queue
+import threading
+import time
+from typing import Literal
+
+from cache_lm.deadline import remaining_s
+from cache_lm.env import get_env
+from cache_lm.state import Expert
+
+HedgeWinner = Literal["primary", "hedge"]
+
+# Until enough TTFT samples exist for a per-expert p95, auto mode uses this.
+_DEFAULT_DELAY_MS = 2000.0
+_MIN_SAMPLES_FOR_P95 = 20
+_HISTORY_SIZE = 500
+
+_END = object()
+
+
+@dataclass
+class HedgeInfo:
+    delay_ms: float
+    fired: bool = False
+    winner: HedgeWinner = "primary"
+
+    def as_state(self) -> dict[str, object]:
+        return {
+            "fired": self.fired,
+            "winner": self.winner,
+            "delay_ms": self.delay_ms,
+        }
+
+
+def hedging_enabled() -> bool:
+    return (get_env("CACHE_LM_HEDGE", "0") or "0").lower() in ("1", "true")
+
+
+class TtftHistory:
+
+    def __init__(self, *, size: int = _HISTORY_SIZE) -> None:
+        self._size = size
+        self._samples: dict[Expert, deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, expert: Expert, ttft_ms: float) -> None:
+        with self._lock:
+            samples = self._samples.setdefault(expert,
+                                               deque(maxlen=self._size))
+            samples.append(ttft_ms)
+
+    def p95(self, expert: Expert) -> float | None:
+        with self._lock:
+            samples = sorted(self._samples.get(expert, ()))
+        if len(samples) < _MIN_SAMPLES_FOR_P95:
+            return None
+        index = min(len(samples) - 1, math.ceil(0.95 * len(samples)) - 1)
+        return samples[index]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._samples.clear()
+
+
+TTFT_HISTORY = TtftHistory()
+
+
+def hedge_delay_ms(expert: Expert) -> float:
+    value = (get_env("CACHE_LM_HEDGE_DELAY_MS", "auto") or "auto").lower()
+    if value != "auto":
+        return float(value)
+    learned = TTFT_HISTORY.p95(expert)
+    return learned if learned is not None else _DEFAULT_DELAY_MS
+
+
+def _has_text(chunk) -> bool:
+    content = getattr(chunk, "content", None)
+    return isinstance(content, str) and bool(content)
+
+
+class _StreamPump:
+    # Drains one model stream on a worker thread into a shared queue. A sync
+    # generator cannot be interrupted while it blocks on the socket, so a
+    # cancelled pump closes its stream at the next chunk boundary.
+
+    def __init__(self, name: HedgeWinner, make_stream: Callable[[], Iterator],
+                 out: queue.Queue) -> None:
+        self.name = name
+        self._make_stream = make_stream
+        self._out = out
+        self._cancelled = threading.Event()
+        self.thread = threading.Thread(target=self._run,
+                                       name=f"cache-lm-hedge-{name}",
+                                       daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def _run(self) -> None:
+        stream = None
+        try:
+            stream = self._make_stream()
+            for chunk in stream:
+                if self._cancelled.is_set():
+                    break
+                self._out.put((self.name, chunk))
+            self._out.put((self.name, _END))
+        except Exception as e:
+            self._out.put((self.name, e))
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+
+
+def hedged_stream(
+    make_stream: Callable[[], Iterator],
+    *,
+    info: HedgeInfo,
+) -> Iterator:
+    out: queue.Queue = queue.Queue()
+    pumps = {"primary": _StreamPump("primary", make_stream, out)}
+    pumps["primary"].start()
+    deadline = time.perf_counter() + info.delay_ms / 1000.0
+    failed: set[str] = set()
+
+    winner: str | None = None
+    first = None
+    try:
+        while winner is None:
+            timeout = None
+            if "hedge" not in pumps:
+                timeout = max(0.0, deadline - time.perf_counter())
+            try:
+                name, item = out.get(timeout=timeout)
+            except queue.Empty:
+                info.fired = True
+                pumps["hedge"] = _StreamPump("hedge", make_stream, out)
+                pumps["hedge"].start()
+                continue
+            if isinstance(item, Exception):
+                failed.add(name)
+                if failed == set(pumps):
+                    raise item
+                continue
+            if item is _END or _has_text(item):
+                winner = name
+                first = item
+
+        info.winner = winner  # type: ignore[assignment]
+        for name, pump in pumps.items():
+            if name != winner:
+                pump.cancel()
+        if first is _END:
+            return
+        yield first
+        while True:
+            name, item = out.get()
+            if name != winner:
+                continue
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        for pump in pumps.values():
+            pump.cancel()
+
+
+def bounded_stream(make_stream: Callable[[], Iterator], *,
+                   deadline_at: float) -> Iterator:
+    # Yields a sync stream's chunks until `deadline_at` and raises
+    # TimeoutError if the next one has not arrived by then. The stream is
+    # drained on a worker thread, so a stalled prefill cannot hold the caller
+    # past the deadline; the abandoned pump closes it at its next chunk.
+    out: queue.Queue = queue.Queue()
+    pump = _StreamPump("primary", make_stream, out)
+    pump.start()
+    try:
+        while True:
+            try:
+                _, item = out.get(timeout=remaining_s(deadline_at))
+            except queue.Empty:
+                raise TimeoutError from None
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        pump.cancel()
+
+
+async def _apump(name: HedgeWinner, make_stream: Callable[[], AsyncIterator],
+                 out: asyncio.Queue) -> None:
+    try:
+        async for chunk in make_stream():
+            await out.put((name, chunk))
+        await out.put((name, _END))
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        await out.put((name, e))
+
+
+async def ahedged_stream(
+    make_stream: Callable[[], AsyncIterator],
+    *,
+    info: HedgeInfo,
+) -> AsyncIterator:
+    out: asyncio.Queue = asyncio.Queue()
+    tasks = {
+        "primary": asyncio.create_task(_apump("primary", make_stream, out))
+    }
+    deadline = time.perf_counter() + info.delay_ms / 1000.0
+    failed: set[str] = set()
+
+    winner: str | None = None
+    first = None
+    try:
+        while winner is None:
+            timeout = None
+            if "hedge" not in tasks:
+                timeout = max(0.0, deadline - time.perf_counter())
+            try:
+                name, item = await asyncio.wait_for(out.get(), timeout)
+            except asyncio.TimeoutError:
+                info.fired = True
+                tasks["hedge"] = asyncio.create_task(
+                    _apump("hedge", make_stream, out))
+                continue
+            if isinstance(item, Exception):
+                failed.add(name)
+                if failed == set(tasks):
+                    raise item
+                continue
+            if item is _END or _has_text(item):
+                winner = name
+                first = item
+
+        info.winner = winner  # type: ignore[assignment]
+        for name, task in tasks.items():
+            if name != winner:
+                task.cancel()
+        if first is _END:
+            return
+        yield first
+        while True:
+            name, item = await out.get()
+            if name != winner:
+                continue
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        for task in tasks.values():
+            task.cancel()
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from itertools import accumulate
+import math
+
+from cache_lm.env import get_env
+from cache_lm.prompts import ChatMessage
+from cache_lm.prompts import PromptLayout
+from cache_lm.state import Expert
+
+# Rough size of English text in BPE tokens, plus the chat template's
+# per-message framing. Only used for budgets and estimates, never for limits
+# the backend enforces.
+_CHARS_PER_TOKEN = 4
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / _CHARS_PER_TOKEN)
+
+
+def message_tokens(message: ChatMessage) -> int:
+    return estimate_tokens(message["content"]) + _MESSAGE_OVERHEAD_TOKENS
+
+
+def history_token_budget(expert: Expert) -> int | None:
+    # CACHE_LM_HISTORY_TOKEN_BUDGET_<EXPERT> overrides the shared
+    # CACHE_LM_HISTORY_TOKEN_BUDGET; unset or 0 sends the full history.
+    value = get_env(f"CACHE_LM_HISTORY_TOKEN_BUDGET_{expert.upper()}")
+    if not value:
+        value = get_env("CACHE_LM_HISTORY_TOKEN_BUDGET", "0") or "0"
+    budget = int(value)
+    return budget if budget > 0 else None
+
+
+def window_history(history: list[ChatMessage],
+                   budget: int | None) -> tuple[list[ChatMessage], int]:
+    # Returns the newest messages that fit `budget` and how many were
+    # dropped. The cut never slides one message per turn: it only lands on
+    # the first user message at or after a multiple of budget/2 tokens,
+    # counted from the start of the thread. Those cut points never move as
+    # the thread grows, so the window keeps its start (and the prompt stays
+    # a byte-identical extension of the previous turn's) until the tail
+    # outgrows the budget, and then drops about half the budget at once.
+    if budget is None or not history:
+        return history, 0
+    sizes = [message_tokens(m) for m in history]
+    offsets = [0, *accumulate(sizes)]
+    total = offsets[-1]
+    if total <= budget:
+        return history, 0
+    quantum = max(budget // 2, 1)
+    # Smallest grid step whose tail can fit; tails from there on only shrink.
+    step = max(math.ceil((total - budget) / quantum), 1)
+    while True:
+        start = bisect_left(offsets, step * quantum, hi=len(history))
+        while start < len(history) and history[start]["role"] != "user":
+            start += 1
+        if total - offsets[start] <= budget:
+            return history[start:], start
+        step += 1
+
+
+def _common_prefix_tokens(previous: list[ChatMessage],
+                          current: list[ChatMessage]) -> int:
+    tokens = 0
+    for old, new in zip(previous, current):
+        if old != new:
+            break
+        tokens += message_tokens(old)
+    return tokens
+
+
+def _layout_messages(layout: PromptLayout, prefix: ChatMessage,
+                     suffix: ChatMessage, window: list[ChatMessage],
+                     query: ChatMessage) -> list[ChatMessage]:
+    # Mirrors `prompts.build_messages(...)`.
+    if layout == "shared_history":
+        return [prefix, *window, suffix, query]
+    return [prefix, suffix, *window, query]
+
+
+def prompt_usage(*,
+                 prefix: ChatMessage,
+                 suffix: ChatMessage,
+                 history: list[ChatMessage],
+                 query: str,
+                 budget: int | None,
+                 layout: PromptLayout = "expert_first") -> dict[str, object]:
+    # Estimated prompt size of this call, and how much of it the backend can
+    # serve from its prefix cache: the part shared with this expert's prompt
+    # on the previous turn, rebuilt from the history (that turn's query and
+    # answer are the last two messages). Prefixes shared with other experts'
+    # prompts of the same turn are not counted.
+    window, dropped = window_history(history, budget)
+    current = _layout_messages(layout, prefix, suffix, window, {
+        "role": "user",
+        "content": query
+    })
+    cached = 0
+    if len(history) >= 2 and history[-2]["role"] == "user":
+        previous_window, _ = window_history(history[:-2], budget)
+        cached = _common_prefix_tokens(
+            _layout_messages(layout, prefix, suffix, previous_window,
+                             history[-2]), current)
+    return {
+        "window": window,
+        "prompt_tokens": sum(message_tokens(m) for m in current),
+        "cached_tokens": cached,
+        "history_messages": len(window),
+        "history_dropped": dropped,
+        "history_budget": budget,
+        "layout": layout,
+    }
@@ -1,7 +1,12 @@
 from __future__ import annotations
 
+import asyncio
+import contextlib
 from dataclasses import dataclass
+from dataclasses import replace
+import threading
 
+import httpx
 from langchain_openai import ChatOpenAI
 
 from cache_lm.env import get_env
@@ -33,13 +38,196 @@ def load_llm_config() -> LlmConfig:
     )
 
 
-def create_chat_model(*, streaming: bool) -> ChatOpenAI:
+def get_max_connections() -> int:
+    return int(get_env("CACHE_LM_LLM_MAX_CONNECTIONS", "32") or "32")
+
+
+class _ConnectionCounter:
+    # Counts requests and newly opened TCP connections via httpx's `trace`
+    # request extension, so the pool can report how often keep-alive
+    # connections were actually reused.
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+
+    def _record(self, event_name: str) -> None:
+        if event_name.endswith("connect_tcp.complete"):
+            with self._lock:
+                self.connections_opened += 1
+
+    def _count_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def on_request(self, request: httpx.Request) -> None:
+        self._count_request()
+        request.extensions["trace"] = lambda name, info: self._record(name)
+
+    async def aon_request(self, request: httpx.Request) -> None:
+        self._count_request()
+
+        async def trace(name: str, info: dict) -> None:
+            self._record(name)
+
+        request.extensions["trace"] = trace
+
+
+@dataclass
+class _HttpClients:
+    sync: httpx.Client
+    async_: httpx.AsyncClient
+
+
+class ChatModelPool:
+
+    def __init__(self, *, max_connections: int) -> None:
+        self._lock = threading.Lock()
+        self._max_connections = max_connections
+        self._models: dict[tuple[LlmConfig, bool], ChatOpenAI] = {}
+        self._http: dict[str, _HttpClients] = {}
+        self._counter = _ConnectionCounter()
+        self.hits = 0
+        self.misses = 0
+
+    def _http_clients(self, base_url: str) -> _HttpClients:
+        clients = self._http.get(base_url)
+        if clients is None:
+            limits = httpx.Limits(
+                max_connections=self._max_connections,
+                max_keepalive_connections=self._max_connections,
+            )
+            clients = _HttpClients(
+                sync=httpx.Client(
+                    limits=limits,
+                    event_hooks={"request": [self._counter.on_request]},
+                ),
+                async_=httpx.AsyncClient(
+                    limits=limits,
+                    event_hooks={"request": [self._counter.aon_request]},
+                ),
+            )
+            self._http[base_url] = clients
+        return clients
+
+    def get(self, cfg: LlmConfig, *, streaming: bool) -> ChatOpenAI:
+        key = (cfg, streaming)
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self.hits += 1
+                return model
+            self.misses += 1
+            clients = self._http_clients(cfg.base_url)
+            model = ChatOpenAI(
+                model=cfg.model,
+                api_key=cfg.api_key,
+                base_url=cfg.base_url,
+                temperature=cfg.temperature,
+                max_tokens=cfg.max_tokens,
+                streaming=streaming,
+                http_client=clients.sync,
+                http_async_client=clients.async_,
+            )
+            self._models[key] = model
+            return model
+
+    def stats(self) -> dict[str, float | int]:
+        with self._lock:
+            requests = self._counter.requests
+            opened = self._counter.connections_opened
+            lookups = self.hits + self.misses
+            hit_ratio = self.hits / lookups if lookups else 0.0
+            reuse_ratio = (1.0 - opened / requests) if requests else 0.0
+            return {
+                "models": len(self._models),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": hit_ratio,
+                "requests": requests,
+                "connections_opened": opened,
+                "connection_reuse_ratio": reuse_ratio,
+                "max_connections": self._max_connections,
+            }
+
+    def _take_clients(self) -> list[_HttpClients]:
+        with self._lock:
+            clients = list(self._http.values())
+            self._http.clear()
+            self._models.clear()
+        for pair in clients:
+            pair.sync.close()
+        return clients
+
+    def close(self) -> None:
+        clients = self._take_clients()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is None:
+            asyncio.run(_aclose_all([pair.async_ for pair in clients]))
+        else:
+            # Called from async code: close on the running loop rather than
+            # blocking it (prefer `await pool.aclose()` there).
+            task = loop.create_task(
+                _aclose_all([pair.async_ for pair in clients]))
+            _CLOSING.add(task)
+            task.add_done_callback(_CLOSING.discard)
+
+    async def aclose(self) -> None:
+        await _aclose_all([pair.async_ for pair in self._take_clients()])
+
+
+# Close tasks scheduled by `close()` on a running loop (kept referenced).
+_CLOSING: set[asyncio.Task] = set()
+
+
+async def _aclose_all(clients: list[httpx.AsyncClient]) -> None:
+    for client in clients:
+        # Connections opened on an event loop that has since closed cannot be
+        # shut down cleanly; the client is dropped either way.
+        with contextlib.suppress(Exception):
+            await client.aclose()
+
+
+_POOL: ChatModelPool | None = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_chat_model_pool() -> ChatModelPool:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ChatModelPool(max_connections=get_max_connections())
+        return _POOL
+
+
+def reset_chat_model_pool() -> None:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.close()
+        _POOL = None
+
+
+async def areset_chat_model_pool() -> None:
+    global _POOL
+    with _POOL_LOCK:
+        pool, _POOL = _POOL, None
+    if pool is not None:
+        await pool.aclose()
+
+
+def chat_model_pool_stats() -> dict[str, float | int]:
+    return get_chat_model_pool().stats()
+
+
+def create_chat_model(*,
+                      streaming: bool,
+                      max_tokens: int | None = None) -> ChatOpenAI:
     cfg = load_llm_config()
-    return ChatOpenAI(
-        model=cfg.model,
-        api_key=cfg.api_key,
-        base_url=cfg.base_url,
-        temperature=cfg.temperature,
-        max_tokens=cfg.max_tokens,
-        streaming=streaming,
-    )
+    if max_tokens is not None:
+        cfg = replace(cfg, max_tokens=max_tokens)
+    return get_chat_model_pool().get(cfg, streaming=streaming)
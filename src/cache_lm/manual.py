@@ -1,7 +1,9 @@
 from __future__ import annotations
 
+from collections import OrderedDict
 from dataclasses import dataclass
 from pathlib import Path
+import threading
 
 from cache_lm.hashing import sha256_bytes
 
@@ -17,28 +19,46 @@ def default_manual_path() -> Path:
 
 @dataclass(frozen=True)
 class Manual:
+    # Decoded once at load; the raw bytes are only kept long enough to hash
+    # them, so a resident manual holds its text once.
     path: Path
-    bytes: bytes
     text: str
     sha256: str
+    # Size of the file that was read.
+    size_bytes: int
+
+    @property
+    def bytes(self) -> bytes:
+        # Re-encoded on each access; not used on the request path.
+        return self.text.encode("utf-8")
 
 
 _CACHED_MANUAL: Manual | None = None
+_LOCK = threading.Lock()
+# Recently served versions by sha256, so a turn pinned to a manual that has
+# since been reloaded can finish on the prefix it started with.
+_MAX_RECENT_MANUALS = 4
+_RECENT_MANUALS: OrderedDict[str, Manual] = OrderedDict()
 
 
 def load_manual(*, path: Path | None = None) -> Manual:
     manual_path = (path or default_manual_path()).resolve()
     manual_bytes = manual_path.read_bytes()
-    manual_text = manual_bytes.decode("utf-8")
-    manual_sha256 = sha256_bytes(manual_bytes)
     return Manual(
         path=manual_path,
-        bytes=manual_bytes,
-        text=manual_text,
-        sha256=manual_sha256,
+        text=manual_bytes.decode("utf-8"),
+        sha256=sha256_bytes(manual_bytes),
+        size_bytes=len(manual_bytes),
     )
 
 
+def _remember(manual: Manual) -> None:
+    _RECENT_MANUALS[manual.sha256] = manual
+    _RECENT_MANUALS.move_to_end(manual.sha256)
+    while len(_RECENT_MANUALS) > _MAX_RECENT_MANUALS:
+        _RECENT_MANUALS.popitem(last=False)
+
+
 def get_manual(*, path: Path | None = None, use_cache: bool = True) -> Manual:
     global _CACHED_MANUAL
 
@@ -47,10 +67,25 @@ def get_manual(*, path: Path | None = None, use_cache: bool = True) -> Manual:
 
     requested_path = (path or default_manual_path()).resolve()
 
-    if _CACHED_MANUAL is None:
-        _CACHED_MANUAL = load_manual(path=requested_path)
+    with _LOCK:
+        if _CACHED_MANUAL is None or _CACHED_MANUAL.path != requested_path:
+            _CACHED_MANUAL = load_manual(path=requested_path)
+            _remember(_CACHED_MANUAL)
+        return _CACHED_MANUAL
+
+
+def set_current_manual(manual: Manual) -> Manual | None:
+    # Single reference swap: turns that already read the previous manual keep
+    # it, the next `get_manual()` sees the new one.
+    global _CACHED_MANUAL
+
+    with _LOCK:
+        previous = _CACHED_MANUAL
+        _CACHED_MANUAL = manual
+        _remember(manual)
+        return previous
 
-    if _CACHED_MANUAL.path != requested_path:
-        _CACHED_MANUAL = load_manual(path=requested_path)
 
-    return _CACHED_MANUAL
+def get_manual_by_sha256(sha256: str) -> Manual | None:
+    with _LOCK:
+        return _RECENT_MANUALS.get(sha256)
@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+import sys
+import threading
+
+from cache_lm.env import get_env
+from cache_lm.manual import get_manual
+from cache_lm.manual import get_manual_by_sha256
+from cache_lm.manual import load_manual
+from cache_lm.manual import Manual
+from cache_lm.prompts import build_prompt_artifacts
+from cache_lm.prompts import prompt_artifacts
+from cache_lm.prompts import PromptArtifacts
+
+# The process-wide manual from `manual.get_manual()` (and its hot reload).
+DEFAULT_MANUAL_ID = "default"
+
+
+@dataclass(frozen=True)
+class RegisteredManual:
+    manual_id: str
+    manual: Manual
+    artifacts: PromptArtifacts
+
+    @property
+    def size_bytes(self) -> int:
+        # What stays resident: the manual's text and the System #1 prefix
+        # built from it (which embeds another copy of the text).
+        return (sys.getsizeof(self.manual.text) +
+                sys.getsizeof(self.artifacts.system_prefix))
+
+
+@dataclass
+class _ManualMetrics:
+    loads: int = 0
+    evictions: int = 0
+    turns: int = 0
+    sha256: str | None = None
+    system_prefix_hash: str | None = None
+
+    def as_stats(self, *, resident: bool) -> dict[str, object]:
+        return {
+            "resident": resident,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "turns": self.turns,
+            "manual_sha256": self.sha256,
+            "system_prefix_hash": self.system_prefix_hash,
+        }
+
+
+def manual_id_from_config(config: dict | None) -> str:
+    configurable = (config or {}).get("configurable") or {}
+    return str(configurable.get("manual_id") or DEFAULT_MANUAL_ID)
+
+
+def _manual_dir() -> Path | None:
+    value = get_env("CACHE_LM_MANUAL_DIR")
+    return Path(value) if value else None
+
+
+def _max_bytes() -> int:
+    max_mb = float(get_env("CACHE_LM_MANUAL_CACHE_MB", "256") or "256")
+    return int(max_mb * 1024 * 1024)
+
+
+class ManualRegistry:
+    # Manuals addressed by id, loaded on first use and kept in an LRU bounded
+    # by `max_bytes`. The default manual is owned by `cache_lm.manual` and is
+    # always resident, so it is not counted against the budget.
+
+    def __init__(
+        self,
+        *,
+        sources: dict[str, Path] | None = None,
+        manual_dir: Path | None = None,
+        max_bytes: int,
+    ) -> None:
+        self._sources = dict(sources or {})
+        self._manual_dir = manual_dir
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, RegisteredManual] = OrderedDict()
+        self._resident_bytes = 0
+        self._metrics: dict[str, _ManualMetrics] = {}
+
+    def register(self, manual_id: str, path: Path) -> None:
+        with self._lock:
+            self._sources[manual_id] = Path(path)
+            self._drop(manual_id)
+
+    def _path_for(self, manual_id: str) -> Path:
+        path = self._sources.get(manual_id)
+        if path is None and self._manual_dir is not None:
+            candidate = self._manual_dir / f"{manual_id}.md"
+            # Ids come from request config; never let one escape the dir.
+            if (candidate.resolve().parent == self._manual_dir.resolve()
+                    and candidate.is_file()):
+                path = candidate
+        if path is None:
+            raise ValueError(f"Unknown manual_id: {manual_id!r}")
+        return path
+
+    def _metrics_for(self, manual_id: str) -> _ManualMetrics:
+        return self._metrics.setdefault(manual_id, _ManualMetrics())
+
+    def _drop(self, manual_id: str) -> None:
+        entry = self._entries.pop(manual_id, None)
+        if entry is not None:
+            self._resident_bytes -= entry.size_bytes
+
+    def _evict_over_budget(self) -> None:
+        # The most recently used entry stays even if it alone is over budget.
+        while self._resident_bytes > self._max_bytes and len(
+                self._entries) > 1:
+            manual_id, entry = self._entries.popitem(last=False)
+            self._resident_bytes -= entry.size_bytes
+            self._metrics_for(manual_id).evictions += 1
+
+    def get(self, manual_id: str = DEFAULT_MANUAL_ID) -> RegisteredManual:
+        if manual_id == DEFAULT_MANUAL_ID:
+            manual = get_manual()
+            registered = RegisteredManual(manual_id, manual,
+                                          prompt_artifacts(manual))
+            with self._lock:
+                self._note(registered, loaded=False)
+            return registered
+
+        with self._lock:
+            entry = self._entries.get(manual_id)
+            if entry is not None:
+                self._entries.move_to_end(manual_id)
+                return entry
+            path = self._path_for(manual_id)
+
+        # Load and build artifacts outside the lock; a racing duplicate load
+        # of the same id is harmless (last writer wins).
+        manual = load_manual(path=path)
+        entry = RegisteredManual(manual_id, manual,
+                                 build_prompt_artifacts(manual))
+        with self._lock:
+            self._drop(manual_id)
+            self._entries[manual_id] = entry
+            self._resident_bytes += entry.size_bytes
+            self._note(entry, loaded=True)
+            self._evict_over_budget()
+        return entry
+
+    def _note(self, entry: RegisteredManual, *, loaded: bool) -> None:
+        metrics = self._metrics_for(entry.manual_id)
+        if loaded:
+            metrics.loads += 1
+        metrics.sha256 = entry.manual.sha256
+        metrics.system_prefix_hash = entry.artifacts.system_prefix_hash
+
+    def for_turn(self, *, manual_id: str | None,
+                 manual_sha256: str | None) -> RegisteredManual:
+        # Resolve the exact version a turn was pinned to, if it is still
+        # around; otherwise fall back to the current version of that id.
+        manual_id = manual_id or DEFAULT_MANUAL_ID
+        if manual_sha256:
+            with self._lock:
+                entry = self._entries.get(manual_id)
+            if entry is not None and entry.manual.sha256 == manual_sha256:
+                return entry
+            if manual_id == DEFAULT_MANUAL_ID:
+                manual = get_manual_by_sha256(manual_sha256)
+                if manual is not None:
+                    return RegisteredManual(manual_id, manual,
+                                            prompt_artifacts(manual))
+        return self.get(manual_id)
+
+    def is_resident(self, manual_sha256: str) -> bool:
+        # Registry entries, plus the default manual's recent versions (those
+        # `for_turn` can still resolve after a hot reload).
+        with self._lock:
+            if any(entry.manual.sha256 == manual_sha256
+                   for entry in self._entries.values()):
+                return True
+        return get_manual_by_sha256(manual_sha256) is not None
+
+    def record_turn(self, manual_id: str) -> None:
+        with self._lock:
+            self._metrics_for(manual_id).turns += 1
+
+    def stats(self) -> dict[str, object]:
+        with self._lock:
+            return {
+                "resident": len(self._entries),
+                "resident_bytes": self._resident_bytes,
+                "max_bytes": self._max_bytes,
+                "manuals": {
+                    manual_id: metrics.as_stats(
+                        resident=(manual_id in self._entries
+                                  or manual_id == DEFAULT_MANUAL_ID))
+                    for manual_id, metrics in self._metrics.items()
+                },
+            }
+
+
+_REGISTRY: ManualRegistry | None = None
+_REGISTRY_LOCK = threading.Lock()
+
+
+def get_manual_registry() -> ManualRegistry:
+    global _REGISTRY
+    with _REGISTRY_LOCK:
+        if _REGISTRY is None:
+            _REGISTRY = ManualRegistry(manual_dir=_manual_dir(),
+                                       max_bytes=_max_bytes())
+        return _REGISTRY
+
+
+def reset_manual_registry() -> None:
+    global _REGISTRY
+    with _REGISTRY_LOCK:
+        _REGISTRY = None
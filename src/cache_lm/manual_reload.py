@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+import threading
+import time
+
+from cache_lm.env import get_env
+from cache_lm.manual import default_manual_path
+from cache_lm.manual import get_manual
+from cache_lm.manual import load_manual
+from cache_lm.manual import Manual
+from cache_lm.manual import set_current_manual
+from cache_lm.mode import get_mode
+from cache_lm.prompts import prompt_artifacts
+from cache_lm.warmup import warm_prefix
+from cache_lm.warmup import warmup_enabled
+
+
+@dataclass(frozen=True)
+class ManualReload:
+    previous_sha256: str | None
+    sha256: str
+    latency_ms: float
+    warmed: bool
+
+
+_LOCK = threading.Lock()
+_TURNS_BY_MANUAL: Counter[str] = Counter()
+_RELOADS: list[ManualReload] = []
+_FAILURES = 0
+_LAST_ERROR: str | None = None
+
+
+def manual_reload_interval_s() -> float:
+    return float(get_env("CACHE_LM_MANUAL_RELOAD_S", "0") or "0")
+
+
+def record_manual_turn(sha256: str) -> None:
+    with _LOCK:
+        _TURNS_BY_MANUAL[sha256] += 1
+
+
+def _record_failure(error: Exception) -> None:
+    global _FAILURES, _LAST_ERROR
+    with _LOCK:
+        _FAILURES += 1
+        _LAST_ERROR = f"{type(error).__name__}: {error}"
+
+
+def manual_reload_stats() -> dict[str, object]:
+    with _LOCK:
+        return {
+            "reloads": len(_RELOADS),
+            "failures": _FAILURES,
+            "last_error": _LAST_ERROR,
+            "reload_latency_ms": [r.latency_ms for r in _RELOADS],
+            "turns_by_manual": dict(_TURNS_BY_MANUAL),
+        }
+
+
+def reset_manual_reload_stats() -> None:
+    global _FAILURES, _LAST_ERROR
+    with _LOCK:
+        _TURNS_BY_MANUAL.clear()
+        _RELOADS.clear()
+        _FAILURES = 0
+        _LAST_ERROR = None
+
+
+def _signature(path: Path) -> tuple[int, int]:
+    stat = path.stat()
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _load_verified(path: Path) -> Manual:
+    # Editors and deploy tools often write in several steps; only accept the
+    # file if it did not change while it was being read.
+    before = _signature(path)
+    manual = load_manual(path=path)
+    if _signature(path) != before:
+        raise ValueError(f"Manual changed while reading: {path}")
+    if manual.size_bytes != before[1]:
+        raise ValueError(f"Short read of manual: {path}")
+    if not manual.text.strip():
+        raise ValueError(f"Manual is empty: {path}")
+    return manual
+
+
+class ManualWatcher:
+    # Polls the manual's mtime/size. A changed file is loaded and verified
+    # off the request path, its prompt artifacts are built (and optionally the
+    # new prefix is warmed), and only then is the current manual swapped.
+
+    def __init__(
+        self,
+        path: Path | None = None,
+        *,
+        interval_s: float = 1.0,
+        warm: bool | None = None,
+    ) -> None:
+        self.path = (path or default_manual_path()).resolve()
+        self.interval_s = interval_s
+        self._warm = warm
+        self._signature: tuple[int, int] | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _should_warm(self) -> bool:
+        if self._warm is not None:
+            return self._warm
+        return warmup_enabled() and get_mode() == "llm"
+
+    def check(self) -> ManualReload | None:
+        try:
+            signature = _signature(self.path)
+        except OSError as e:
+            # Mid-rename or briefly missing; keep serving the current manual.
+            _record_failure(e)
+            return None
+        if signature == self._signature:
+            return None
+
+        start = time.perf_counter()
+        current = get_manual(path=self.path)
+        try:
+            manual = _load_verified(self.path)
+        except (OSError, ValueError) as e:
+            _record_failure(e)
+            return None
+        self._signature = signature
+        if manual.sha256 == current.sha256:
+            return None
+
+        prompt_artifacts(manual)
+        warmed = False
+        if self._should_warm():
+            try:
+                warm_prefix(manual=manual)
+                warmed = True
+            except Exception as e:
+                # Warm-up is best effort; switch over cold rather than keep
+                # serving a stale manual.
+                _record_failure(e)
+        previous = set_current_manual(manual)
+        reload = ManualReload(
+            previous_sha256=previous.sha256 if previous else None,
+            sha256=manual.sha256,
+            latency_ms=(time.perf_counter() - start) * 1000.0,
+            warmed=warmed,
+        )
+        with _LOCK:
+            _RELOADS.append(reload)
+        return reload
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            self.check()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        # The manual currently being served is the baseline, not a change.
+        self._signature = _signature(self.path)
+        self._thread = threading.Thread(target=self._run,
+                                        name="cache-lm-manual-watcher",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+_WATCHER: ManualWatcher | None = None
+
+
+def start_manual_watcher() -> ManualWatcher | None:
+    global _WATCHER
+    interval_s = manual_reload_interval_s()
+    if interval_s <= 0:
+        return None
+    with _LOCK:
+        if _WATCHER is None:
+            _WATCHER = ManualWatcher(interval_s=interval_s)
+            _WATCHER.start()
+        return _WATCHER
+
+
+def stop_manual_watcher() -> None:
+    global _WATCHER
+    with _LOCK:
+        watcher, _WATCHER = _WATCHER, None
+    if watcher is not None:
+        watcher.stop()
@@ -1,9 +1,16 @@
 from __future__ import annotations
 
-from typing import Literal, TypedDict
-
+from collections import OrderedDict
+from collections.abc import Mapping
+from dataclasses import dataclass
+import threading
+from types import MappingProxyType
+from typing import Any, Literal, TypedDict
+
+from cache_lm.env import get_env
 from cache_lm.hashing import sha256_text
 from cache_lm.manual import get_manual
+from cache_lm.manual import Manual
 
 Expert = Literal["technical_specialist", "compliance_auditor",
                  "support_concierge"]
@@ -14,6 +21,21 @@ class ChatMessage(TypedDict):
     content: str
 
 
+# `expert_first`: System #1, System #2, history, query; the experts' prompts
+# diverge right after the manual, so each one prefills the history itself.
+# `shared_history`: System #1, history, System #2, query; every expert of a
+# turn shares manual + history as one prefix and only prefills its
+# instructions and the query.
+PromptLayout = Literal["expert_first", "shared_history"]
+
+
+def get_prompt_layout() -> PromptLayout:
+    value = (get_env("CACHE_LM_PROMPT_LAYOUT") or "").strip().lower()
+    if value in ("expert_first", "shared_history"):
+        return value  # type: ignore[return-value]
+    return "expert_first"
+
+
 def to_langchain_messages(messages: list[ChatMessage]):
     from langchain_core.messages import AIMessage
     from langchain_core.messages import BaseMessage
@@ -45,16 +67,19 @@ MANUAL_END = "===== END INTERNAL OPERATIONS & COMPLIANCE MANUAL ====="
 
 
 def system_prefix_text(*, manual_text: str | None = None) -> str:
-    manual = manual_text if manual_text is not None else get_manual().text
+    if manual_text is None:
+        return prompt_artifacts().system_prefix
     return "\n\n".join([
         GLOBAL_SYSTEM_INSTRUCTIONS,
         MANUAL_BEGIN,
-        manual,
+        manual_text,
         MANUAL_END,
     ])
 
 
 def system_prefix_hash(*, manual_text: str | None = None) -> str:
+    if manual_text is None:
+        return prompt_artifacts().system_prefix_hash
     return sha256_text(system_prefix_text(manual_text=manual_text))
 
 
@@ -72,6 +97,8 @@ _EXPERT_SYSTEM_SUFFIX: dict[Expert, str] = {
      "step-by-step guides for non-technical staff. Prefer numbered steps."),
 }
 
+EXPERT_NAMES: tuple[Expert, ...] = tuple(_EXPERT_SYSTEM_SUFFIX)
+
 
 def expert_system_suffix_text(expert: Expert) -> str:
     return _EXPERT_SYSTEM_SUFFIX[expert]
@@ -83,20 +110,104 @@ def build_messages(
     user_input: str,
     history: list[ChatMessage] | None = None,
     manual_text: str | None = None,
+    layout: PromptLayout | None = None,
 ) -> list[ChatMessage]:
-    messages: list[ChatMessage] = [
-        {
-            "role": "system",
-            "content": system_prefix_text(manual_text=manual_text)
-        },
-        {
-            "role": "system",
-            "content": expert_system_suffix_text(expert)
-        },
-    ]
-
-    if history:
-        messages.extend(history)
+    prefix: ChatMessage = {
+        "role": "system",
+        "content": system_prefix_text(manual_text=manual_text)
+    }
+    suffix: ChatMessage = {
+        "role": "system",
+        "content": expert_system_suffix_text(expert)
+    }
+    if (layout or get_prompt_layout()) == "shared_history":
+        messages = [prefix, *(history or []), suffix]
+    else:
+        messages = [prefix, suffix, *(history or [])]
 
     messages.append({"role": "user", "content": user_input})
     return messages
+
+
+@dataclass(frozen=True)
+class PromptArtifacts:
+    # Everything about the prompt that only depends on the manual. Built once
+    # per `manual_sha256` and shared by every call; the LangChain messages
+    # inside must be treated as read-only.
+    manual_sha256: str
+    system_prefix: str
+    system_prefix_hash: str
+    # System #1 as a LangChain message; every expert (and the router, in the
+    # `shared_prefix` layout) sends this same object first.
+    system_prefix_message: Any
+    expert_system_messages: Mapping[Expert, tuple[Any, Any]]
+
+
+# A few versions are kept so in-flight turns can finish on the previous manual.
+_MAX_CACHED_ARTIFACTS = 4
+_ARTIFACTS: OrderedDict[str, PromptArtifacts] = OrderedDict()
+_ARTIFACTS_LOCK = threading.Lock()
+
+
+def build_prompt_artifacts(manual: Manual) -> PromptArtifacts:
+    from langchain_core.messages import SystemMessage
+
+    prefix = system_prefix_text(manual_text=manual.text)
+    prefix_message = SystemMessage(content=prefix)
+    return PromptArtifacts(
+        manual_sha256=manual.sha256,
+        system_prefix=prefix,
+        system_prefix_hash=sha256_text(prefix),
+        system_prefix_message=prefix_message,
+        expert_system_messages=MappingProxyType({
+            expert: (
+                prefix_message,
+                SystemMessage(content=expert_system_suffix_text(expert)),
+            )
+            for expert in EXPERT_NAMES
+        }),
+    )
+
+
+def prompt_artifacts(manual: Manual | None = None) -> PromptArtifacts:
+    manual = manual or get_manual()
+    with _ARTIFACTS_LOCK:
+        artifacts = _ARTIFACTS.get(manual.sha256)
+        if artifacts is not None:
+            _ARTIFACTS.move_to_end(manual.sha256)
+            return artifacts
+    artifacts = build_prompt_artifacts(manual)
+    with _ARTIFACTS_LOCK:
+        artifacts = _ARTIFACTS.setdefault(manual.sha256, artifacts)
+        _ARTIFACTS.move_to_end(manual.sha256)
+        while len(_ARTIFACTS) > _MAX_CACHED_ARTIFACTS:
+            _ARTIFACTS.popitem(last=False)
+    return artifacts
+
+
+def clear_prompt_artifacts() -> None:
+    with _ARTIFACTS_LOCK:
+        _ARTIFACTS.clear()
+
+
+def build_langchain_messages(
+    *,
+    expert: Expert,
+    user_input: str,
+    history: list[ChatMessage] | None = None,
+    artifacts: PromptArtifacts | None = None,
+    layout: PromptLayout | None = None,
+) -> list:
+    # Same layout as `build_messages(...)`, but reuses the prebuilt system
+    # messages instead of rebuilding the ~91 KB prefix on every call.
+    from langchain_core.messages import HumanMessage
+
+    artifacts = artifacts or prompt_artifacts()
+    prefix, suffix = artifacts.expert_system_messages[expert]
+    converted = to_langchain_messages(history) if history else []
+    if (layout or get_prompt_layout()) == "shared_history":
+        messages = [prefix, *converted, suffix]
+    else:
+        messages = [prefix, suffix, *converted]
+    messages.append(HumanMessage(content=user_input))
+    return messages
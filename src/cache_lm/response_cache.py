@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+from collections.abc import AsyncIterator
+from collections.abc import Iterator
+import json
+import re
+import threading
+from typing import Literal
+
+from langchain_core.messages import AIMessageChunk
+
+from cache_lm.cache_store import MemoryLru
+from cache_lm.cache_store import SqliteStore
+from cache_lm.cache_store import TieredCache
+from cache_lm.env import get_env
+from cache_lm.hashing import sha256_text
+from cache_lm.llm import LlmConfig
+from cache_lm.manual_registry import get_manual_registry
+from cache_lm.prompts import ChatMessage
+from cache_lm.prompts import PromptLayout
+from cache_lm.state import Expert
+
+ResponseCacheMode = Literal["off", "memory", "sqlite"]
+
+_WHITESPACE = re.compile(r"\s+")
+_REPLAY_PIECES = re.compile(r"\S+\s*|\s+")
+
+
+def get_response_cache_mode() -> ResponseCacheMode:
+    value = (get_env("CACHE_LM_RESPONSE_CACHE") or "").strip().lower()
+    if value in ("off", "memory", "sqlite"):
+        return value  # type: ignore[return-value]
+    return "off"
+
+
+def _normalize_text(text: str) -> str:
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def response_cache_key(
+    *,
+    system_prefix_hash: str,
+    expert: Expert,
+    history: list[ChatMessage],
+    query: str,
+    llm_config: LlmConfig,
+    layout: PromptLayout = "expert_first",
+) -> str:
+    payload = {
+        "system_prefix_hash": system_prefix_hash,
+        "expert": expert,
+        "history":
+        [[m["role"], _normalize_text(m["content"])] for m in history],
+        "query": _normalize_text(query),
+        # Answers from a different model or sampling setup are not the same
+        # answer.
+        "model": llm_config.model,
+        "temperature": llm_config.temperature,
+        "max_tokens": llm_config.max_tokens,
+    }
+    if layout != "expert_first":
+        # Keys of the original layout stay valid across upgrades.
+        payload["layout"] = layout
+    return sha256_text(
+        json.dumps(payload, ensure_ascii=False, separators=(",", ":")))
+
+
+_CACHE: TieredCache | None = None
+_CACHE_SETTINGS: tuple | None = None
+_CACHE_LOCK = threading.Lock()
+
+
+def _settings() -> tuple:
+    ttl = float(get_env("CACHE_LM_RESPONSE_CACHE_TTL_S", "86400") or "86400")
+    return (
+        get_response_cache_mode(),
+        get_env("CACHE_LM_RESPONSE_CACHE_DB", ".cache_lm/responses.sqlite"),
+        ttl if ttl > 0 else None,
+        int(get_env("CACHE_LM_RESPONSE_CACHE_MEMORY_ENTRIES", "256") or "256"),
+        int(
+            get_env("CACHE_LM_RESPONSE_CACHE_MAX_ENTRIES", "10000")
+            or "10000"),
+    )
+
+
+def get_response_cache() -> TieredCache | None:
+    global _CACHE, _CACHE_SETTINGS
+    settings = _settings()
+    mode, db_path, ttl_s, memory_entries, max_entries = settings
+    with _CACHE_LOCK:
+        if settings == _CACHE_SETTINGS:
+            return _CACHE
+        if _CACHE is not None:
+            _CACHE.close()
+        _CACHE = None
+        if mode != "off":
+            sqlite = None
+            if mode == "sqlite":
+                sqlite = SqliteStore(
+                    db_path,
+                    table="expert_responses",
+                    max_entries=max_entries,
+                    ttl_s=ttl_s,
+                )
+            # Tags are manual_sha256s; answers of manuals that left the
+            # registry are purged.
+            _CACHE = TieredCache(
+                MemoryLru(max_entries=memory_entries, ttl_s=ttl_s),
+                sqlite,
+                is_live=lambda tag: get_manual_registry().is_resident(tag),
+            )
+        _CACHE_SETTINGS = settings
+        return _CACHE
+
+
+def reset_response_cache() -> None:
+    global _CACHE, _CACHE_SETTINGS
+    with _CACHE_LOCK:
+        if _CACHE is not None:
+            _CACHE.close()
+        _CACHE = None
+        _CACHE_SETTINGS = None
+
+
+def replay_chunks(text: str) -> Iterator[AIMessageChunk]:
+    # Cached answers go through the same chunk-consuming code as live streams,
+    # so callers (and TTFT measurement) cannot tell the difference.
+    for piece in _REPLAY_PIECES.findall(text):
+        yield AIMessageChunk(content=piece)
+
+
+async def areplay_chunks(text: str) -> AsyncIterator[AIMessageChunk]:
+    for chunk in replay_chunks(text):
+        yield chunk
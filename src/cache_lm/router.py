@@ -1,80 +1,33 @@
 from __future__ import annotations
 
+import time
 from typing import Literal
+import uuid
 
 from cache_lm.env import get_env
+from cache_lm.experts import astart_early_expert_call
+from cache_lm.experts import cancel_early_expert_call
+from cache_lm.experts import start_early_expert_call
 from cache_lm.message_text import message_to_text
 from cache_lm.mode import get_mode
+from cache_lm.router_keywords import get_keyword_matcher
+from cache_lm.router_llm import allm_route_experts
+from cache_lm.router_llm import astream_route_experts
+from cache_lm.router_llm import get_router_layout
 from cache_lm.router_llm import llm_route_experts
+from cache_lm.router_llm import stream_route_experts
 from cache_lm.state import Expert
 from cache_lm.state import ExpertTask
 from cache_lm.state import RoutingDecision
 from cache_lm.state import State
+from cache_lm.streaming import route_event
+from cache_lm.streaming import stream_writer
 
-RouterMode = Literal["rules", "llm"]
-
-
-def _wants_compliance(text: str) -> bool:
-    keywords = [
-        "policy",
-        "compliance",
-        "regulation",
-        "regulatory",
-        "allowed",
-        "can i",
-        "cannot",
-        "can't",
-        "must",
-        "prohibited",
-        "ban",
-        "approve",
-    ]
-    text_lower = text.lower()
-    return any(k in text_lower for k in keywords)
-
-
-def _wants_technical(text: str) -> bool:
-    keywords = [
-        "api",
-        "limit",
-        "timeout",
-        "error",
-        "exception",
-        "troubleshoot",
-        "spec",
-        "specification",
-        "rate",
-        "latency",
-    ]
-    text_lower = text.lower()
-    return any(k in text_lower for k in keywords)
-
-
-def _wants_support(text: str) -> bool:
-    keywords = [
-        "how do i",
-        "how to",
-        "steps",
-        "step-by-step",
-        "step by step",
-        "guide",
-        "walk me through",
-        "explain",
-        "summarize",
-    ]
-    text_lower = text.lower()
-    return any(k in text_lower for k in keywords)
+RouterMode = Literal["rules", "llm", "local"]
 
 
 def route_experts_rules(user_input: str) -> RoutingDecision:
-    pending: list[Expert] = []
-
-    if _wants_compliance(user_input):
-        pending.append("compliance_auditor")
-    if _wants_technical(user_input):
-        pending.append("technical_specialist")
-    if _wants_support(user_input):
-        pending.append("support_concierge")
+    pending: list[Expert] = get_keyword_matcher().match(user_input)
 
     if not pending:
         pending = ["support_concierge"]
@@ -95,27 +48,220 @@ def route_experts_rules(user_input: str) -> RoutingDecision:
 
 def get_router_mode() -> RouterMode:
     value = (get_env("CACHE_LM_ROUTER_MODE") or "").strip().lower()
-    if value in ("rules", "llm"):
+    if value in ("rules", "llm", "local"):
         return value  # type: ignore[return-value]
     if get_mode() == "llm":
         return "llm"
     return "rules"
 
 
+def router_streaming_enabled() -> bool:
+    value = get_env("CACHE_LM_ROUTER_STREAMING", "0") or "0"
+    return value.lower() in ("1", "true")
+
+
+def router_speculation_enabled() -> bool:
+    value = get_env("CACHE_LM_ROUTER_SPECULATE", "0") or "0"
+    return value.lower() in ("1", "true")
+
+
+def _router_update(decision: RoutingDecision) -> dict[str, object]:
+    stream_writer()(route_event([task["expert"] for task in decision.tasks]))
+    return {
+        "pending_tasks": decision.tasks,
+        "current_task": None,
+        "router_cache_hit": decision.cache_hit,
+        "router_layout":
+        get_router_layout() if decision.ttft_ms is not None else None,
+        "router_ttft_ms": decision.ttft_ms,
+    }
+
+
+def _llm_route_kwargs(state: State) -> dict[str, object]:
+    return {
+        "user_input": message_to_text(state["messages"][-1]),
+        "messages": list(state.get("messages", [])),
+        "manual_id": state.get("manual_id"),
+        "manual_sha256": state.get("manual_sha256"),
+    }
+
+
+def _local_route(
+        user_input: str) -> tuple[RoutingDecision | None, float | None]:
+    # Imported here so NumPy is only needed in `local` mode. Returns no
+    # decision (only the confidence) when the LLM router should decide,
+    # including when NumPy or a readable artifact is missing.
+    try:
+        from cache_lm.router_local import local_route
+        from cache_lm.router_local import local_router_threshold
+        route = local_route(user_input)
+    except Exception:
+        return None, None
+    if route is None:
+        return None, None
+    if route.confidence < local_router_threshold():
+        return None, route.confidence
+    return route.decision(), route.confidence
+
+
 def router_node(state: State) -> dict[str, object]:
     user_input = message_to_text(state["messages"][-1])
-    decision: RoutingDecision
-    if get_router_mode() == "llm":
+    mode = get_router_mode()
+    decision: RoutingDecision | None = None
+    confidence: float | None = None
+    if mode == "local":
+        decision, confidence = _local_route(user_input)
+    if decision is None and mode != "rules":
         try:
-            decision = llm_route_experts(
-                user_input=user_input,
-                messages=list(state.get("messages", [])),
-            )
+            decision = llm_route_experts(**_llm_route_kwargs(state))
         except Exception:
             decision = route_experts_rules(user_input)
-    else:
+    if decision is None:
         decision = route_experts_rules(user_input)
-    return {
-        "pending_tasks": decision.tasks,
-        "current_task": None,
-    }
+    return _router_update(decision) | {"local_router_confidence": confidence}
+
+
+async def arouter_node(state: State) -> dict[str, object]:
+    user_input = message_to_text(state["messages"][-1])
+    mode = get_router_mode()
+    decision: RoutingDecision | None = None
+    confidence: float | None = None
+    if mode == "local":
+        decision, confidence = _local_route(user_input)
+    if decision is None and mode != "rules":
+        try:
+            decision = await allm_route_experts(**_llm_route_kwargs(state))
+        except Exception:
+            decision = route_experts_rules(user_input)
+    if decision is None:
+        decision = route_experts_rules(user_input)
+    return _router_update(decision) | {"local_router_confidence": confidence}
+
+
+class _EarlyDispatch:
+    # Collects the tasks dispatched before the routing decision was final
+    # (streamed or speculative), and when each one started.
+
+    def __init__(self, state: State, start_call) -> None:
+        self.dispatch_id = uuid.uuid4().hex
+        self.tasks: list[ExpertTask] = []
+        self._state = state
+        self._start_call = start_call
+        self._started_at: dict[Expert, float] = {}
+        # Set when the LLM router failed and `fallback` decided instead.
+        self.fell_back = False
+
+    def on_task(self, task: ExpertTask) -> None:
+        self.tasks.append(task)
+        if get_mode() == "llm":
+            self._start_call(self._state, task, dispatch_id=self.dispatch_id)
+            self._started_at[task["expert"]] = time.perf_counter()
+
+    def update(self, decision: RoutingDecision) -> dict[str, object]:
+        # Lead = how long before the routing JSON was complete each expert
+        # was already running; `_finalize` turns it into wall time saved.
+        routed_at = time.perf_counter()
+        update = _router_update(decision)
+        update["early_dispatch_id"] = self.dispatch_id
+        update["router_lead_ms_by_expert"] = {
+            expert: (routed_at - started) * 1000.0
+            for expert, started in self._started_at.items()
+        }
+        return update
+
+    def reconcile(self, decision: RoutingDecision) -> dict[str, object]:
+        # Speculative calls survive only if the LLM router chose the same
+        # expert with the same query; the others are cancelled, and experts
+        # it added start through the normal fan-out.
+        final = {(task["expert"], task["query"]) for task in decision.tasks}
+        kept: list[Expert] = []
+        cancelled: list[Expert] = []
+        wasted_tokens = 0
+        for task in self.tasks:
+            expert = task["expert"]
+            if (expert, task["query"]) in final:
+                kept.append(expert)
+                continue
+            cancelled.append(expert)
+            wasted_tokens += cancel_early_expert_call(self.dispatch_id, expert)
+            self._started_at.pop(expert, None)
+        speculated = [task["expert"] for task in self.tasks]
+        added = [
+            t["expert"] for t in decision.tasks if t["expert"] not in kept
+        ]
+        hit_rate = len(kept) / len(speculated) if speculated else 0.0
+        return {
+            "speculated": speculated,
+            "kept": kept,
+            "cancelled": cancelled,
+            "added": added,
+            # The speculation was never checked against a decision.
+            "hit_rate": None if self.fell_back else hit_rate,
+            "fallback": self.fell_back,
+            "wasted_tokens": wasted_tokens,
+        }
+
+    def fallback(self, user_input: str) -> RoutingDecision:
+        # Tasks already running are kept if the stream broke off later.
+        self.fell_back = True
+        if self.tasks:
+            return RoutingDecision(tasks=list(self.tasks))
+        return route_experts_rules(user_input)
+
+
+def streaming_router_node(state: State) -> dict[str, object]:
+    if get_router_mode() != "llm":
+        return router_node(state)
+    user_input = message_to_text(state["messages"][-1])
+    dispatch = _EarlyDispatch(state, start_early_expert_call)
+    try:
+        decision = stream_route_experts(**_llm_route_kwargs(state),
+                                        on_task=dispatch.on_task)
+    except Exception:
+        decision = dispatch.fallback(user_input)
+    return dispatch.update(decision)
+
+
+async def astreaming_router_node(state: State) -> dict[str, object]:
+    if get_router_mode() != "llm":
+        return await arouter_node(state)
+    user_input = message_to_text(state["messages"][-1])
+    dispatch = _EarlyDispatch(state, astart_early_expert_call)
+    try:
+        decision = await astream_route_experts(**_llm_route_kwargs(state),
+                                               on_task=dispatch.on_task)
+    except Exception:
+        decision = dispatch.fallback(user_input)
+    return dispatch.update(decision)
+
+
+def speculative_router_node(state: State) -> dict[str, object]:
+    # The rules router's guess starts right away; the LLM router's decision
+    # then keeps, cancels or adds experts.
+    if get_router_mode() != "llm":
+        return router_node(state)
+    user_input = message_to_text(state["messages"][-1])
+    dispatch = _EarlyDispatch(state, start_early_expert_call)
+    for task in route_experts_rules(user_input).tasks:
+        dispatch.on_task(task)
+    try:
+        decision = llm_route_experts(**_llm_route_kwargs(state))
+    except Exception:
+        decision = dispatch.fallback(user_input)
+    speculation = dispatch.reconcile(decision)
+    return dispatch.update(decision) | {"speculation": speculation}
+
+
+async def aspeculative_router_node(state: State) -> dict[str, object]:
+    if get_router_mode() != "llm":
+        return await arouter_node(state)
+    user_input = message_to_text(state["messages"][-1])
+    dispatch = _EarlyDispatch(state, astart_early_expert_call)
+    for task in route_experts_rules(user_input).tasks:
+        dispatch.on_task(task)
+    try:
+        decision = await allm_route_experts(**_llm_route_kwargs(state))
+    except Exception:
+        decision = dispatch.fallback(user_input)
+    speculation = dispatch.reconcile(decision)
+    return dispatch.update(decision) | {"speculation": speculation}
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+import threading
+
+from cache_lm.env import get_env
+from cache_lm.state import Expert
+
+# Checked in this order; `route_experts_rules` keeps it for the task list.
+DEFAULT_KEYWORDS: dict[Expert, tuple[str, ...]] = {
+    "compliance_auditor": (
+        "policy",
+        "compliance",
+        "regulation",
+        "regulatory",
+        "allowed",
+        "can i",
+        "cannot",
+        "can't",
+        "must",
+        "prohibited",
+        "ban",
+        "approve",
+    ),
+    "technical_specialist": (
+        "api",
+        "limit",
+        "timeout",
+        "error",
+        "exception",
+        "troubleshoot",
+        "spec",
+        "specification",
+        "rate",
+        "latency",
+    ),
+    "support_concierge": (
+        "how do i",
+        "how to",
+        "steps",
+        "step-by-step",
+        "step by step",
+        "guide",
+        "walk me through",
+        "explain",
+        "summarize",
+    ),
+}
+
+
+def _prune(keywords: tuple[str, ...]) -> tuple[str, ...]:
+    # A keyword that contains a shorter keyword of the same expert can never
+    # change the result ("specification" vs "spec"), so it is not scanned.
+    unique = sorted({k.lower() for k in keywords}, key=len)
+    kept: list[str] = []
+    for keyword in unique:
+        if not any(shorter in keyword for shorter in kept):
+            kept.append(keyword)
+    return tuple(kept)
+
+
+class KeywordMatcher:
+    # Keyword tables compiled once per process: deduplicated, lowercased and
+    # pruned. `match` lowercases the input once and labels every expert from
+    # that copy. Results are identical to `any(k in text.lower())` per expert.
+    #
+    # A single combined regex (even a prefix-trie one) was measured slower
+    # than per-keyword `str.__contains__` on multi-KB inputs in CPython, since
+    # the regex engine visits every position while substring search skips
+    # ahead; see benchmarks/bench_router_keywords.py.
+
+    def __init__(self, tables: dict[Expert, tuple[str, ...]]) -> None:
+        self._tables: tuple[tuple[Expert, tuple[str, ...]], ...] = tuple(
+            (expert, _prune(keywords)) for expert, keywords in tables.items())
+
+    def match(self, text: str) -> list[Expert]:
+        text_lower = text.lower()
+        return [
+            expert for expert, keywords in self._tables
+            if any(k in text_lower for k in keywords)
+        ]
+
+
+def load_keyword_tables(
+        path: Path | None = None) -> dict[Expert, tuple[str, ...]]:
+    # The JSON file maps expert -> extra keywords; they are added to the
+    # defaults, so new terms need no code change.
+    tables = dict(DEFAULT_KEYWORDS)
+    if path is None:
+        return tables
+    data = json.loads(path.read_text(encoding="utf-8"))
+    for expert, keywords in data.items():
+        if expert not in tables:
+            raise ValueError(f"Unknown expert in keyword table: {expert!r}")
+        if not isinstance(keywords, list) or not all(
+                isinstance(k, str) and k for k in keywords):
+            raise ValueError(
+                f"Keywords for {expert} must be non-empty strings")
+        tables[expert] = tables[expert] + tuple(keywords)
+    return tables
+
+
+_LOCK = threading.Lock()
+_MATCHER: KeywordMatcher | None = None
+_MATCHER_SOURCE: str | None = None
+
+
+def get_keyword_matcher() -> KeywordMatcher:
+    global _MATCHER, _MATCHER_SOURCE
+    source = get_env("CACHE_LM_ROUTER_KEYWORDS") or ""
+    with _LOCK:
+        if _MATCHER is None or _MATCHER_SOURCE != source:
+            _MATCHER = KeywordMatcher(
+                load_keyword_tables(Path(source) if source else None))
+            _MATCHER_SOURCE = source
+        return _MATCHER
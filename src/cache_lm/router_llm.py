@@ -1,18 +1,36 @@
 from __future__ import annotations
 
+from dataclasses import dataclass
+from dataclasses import replace
 import json
+from pathlib import Path
 import re
+import threading
+import time
+from typing import Literal
 
 from langchain_core.messages import HumanMessage
 from langchain_core.messages import SystemMessage
 
+from cache_lm.cache_store import TieredCache
+from cache_lm.env import get_env
 from cache_lm.llm import create_chat_model
+from cache_lm.llm import load_llm_config
+from cache_lm.manual_registry import get_manual_registry
 from cache_lm.message_text import message_role
 from cache_lm.message_text import message_to_text
+from cache_lm.routing_cache import decode_decision
+from cache_lm.routing_cache import encode_decision
+from cache_lm.routing_cache import get_routing_cache
+from cache_lm.routing_cache import ROUTER_TIMINGS
+from cache_lm.routing_cache import routing_cache_key
+from cache_lm.routing_cache import routing_cache_tag
 from cache_lm.state import Expert
 from cache_lm.state import ExpertTask
 from cache_lm.state import RoutingDecision
 
+RouterLayout = Literal["standalone", "shared_prefix"]
+
 _ORDERED_EXPERTS: list[Expert] = [
     "compliance_auditor",
     "technical_specialist",
@@ -42,6 +60,33 @@ def _system_router_prompt() -> str:
     ])
 
 
+def get_router_layout() -> RouterLayout:
+    value = (get_env("CACHE_LM_ROUTER_LAYOUT") or "").strip().lower()
+    if value in ("standalone", "shared_prefix"):
+        return value  # type: ignore[return-value]
+    return "standalone"
+
+
+def router_system_messages(layout: RouterLayout,
+                           *,
+                           prefix_message=None) -> list:
+    # `standalone`: a small router-only prompt. `shared_prefix`: System #1
+    # (global instructions + manual) first, then the router prompt in the
+    # slot an expert's System #2 takes; the router's prefill then leaves the
+    # manual's KV blocks warm for the experts that follow, and it can route
+    # on the manual's contents.
+    if layout == "shared_prefix":
+        return [
+            prefix_message,
+            SystemMessage(content="\n".join([
+                _system_router_prompt(),
+                "- Use the manual above to judge whose area the request "
+                "falls in; do not answer it.",
+            ])),
+        ]
+    return [SystemMessage(content=_system_router_prompt())]
+
+
 def _render_history(messages: list, *, max_messages: int) -> str:
     lines: list[str] = []
     for message in messages[-max_messages:]:
@@ -91,6 +136,99 @@ def _normalize_tasks(
     return ordered[:3]
 
 
+class RoutingJsonStream:
+    # Incremental parser for `{"tasks":[{...}, ...]}`: `feed` takes the next
+    # chunk of router text and returns the task objects closed by it, so an
+    # expert can be dispatched before the rest of the JSON has been produced.
+
+    _TASKS_KEY = re.compile(r'"tasks"\s*:\s*\[')
+
+    def __init__(self) -> None:
+        self._buffer = ""
+        self._pos = 0
+        self._in_tasks = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._start = 0
+
+    def feed(self, text: str) -> list[dict]:
+        self._buffer += text
+        if self._done:
+            return []
+        if not self._in_tasks:
+            match = self._TASKS_KEY.search(self._buffer)
+            if match is None:
+                return []
+            self._in_tasks = True
+            self._pos = match.end()
+        closed: list[dict] = []
+        while self._pos < len(self._buffer) and not self._done:
+            ch = self._buffer[self._pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._start = self._pos
+                self._depth += 1
+            elif ch == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    item = self._loads(self._buffer[self._start:self._pos + 1])
+                    if item is not None:
+                        closed.append(item)
+            elif ch == "]" and self._depth == 0:
+                self._done = True
+            self._pos += 1
+        return closed
+
+    @staticmethod
+    def _loads(text: str) -> dict | None:
+        try:
+            item = json.loads(text)
+        except json.JSONDecodeError:
+            return None
+        return item if isinstance(item, dict) else None
+
+
+class _StreamedTasks:
+    # Normalizes tasks as they close. Unlike `_normalize_tasks` (which sees
+    # the whole list), a repeated expert keeps its first task: that one may
+    # already be running.
+
+    def __init__(self, *, user_input: str, on_task) -> None:
+        self._user_input = user_input
+        self._on_task = on_task
+        self._parser = RoutingJsonStream()
+        self.tasks: list[ExpertTask] = []
+
+    def feed(self, text: str) -> None:
+        for item in self._parser.feed(text):
+            normalized = _normalize_tasks([item], user_input=self._user_input)
+            if not normalized or len(self.tasks) >= 3:
+                continue
+            task = normalized[0]
+            if any(t["expert"] == task["expert"] for t in self.tasks):
+                continue
+            self.tasks.append(task)
+            self._on_task(task)
+
+    def decision(self) -> RoutingDecision:
+        if not self.tasks:
+            raise ValueError("Router model did not return valid routing JSON.")
+        order = {expert: i for i, expert in enumerate(_ORDERED_EXPERTS)}
+        ordered = sorted(self.tasks, key=lambda t: order[t["expert"]])
+        return RoutingDecision(tasks=ordered)
+
+
 def parse_routing_json(
     *,
     model_text: str,
@@ -111,23 +249,16 @@ def parse_routing_json(
     return RoutingDecision(tasks=normalized)
 
 
-def llm_route_experts(
-    *,
-    user_input: str,
-    messages: list,
-    max_history_messages: int = 6,
-) -> RoutingDecision:
-    history_text = _render_history(messages, max_messages=max_history_messages)
+def router_messages(*, user_input: str, history_text: str,
+                    system_messages: list) -> list:
     prompt = "\n\n".join([
         f"User input:\n{user_input}",
         f"Recent conversation:\n{history_text}" if history_text else "",
     ]).strip()
+    return [*system_messages, HumanMessage(content=prompt)]
 
-    model = create_chat_model(streaming=False)
-    response = model.invoke([
-        SystemMessage(content=_system_router_prompt()),
-        HumanMessage(content=prompt),
-    ])
+
+def _decision_from_response(response, *, user_input: str) -> RoutingDecision:
     decision = parse_routing_json(
         model_text=message_to_text(response),
         user_input=user_input,
@@ -135,3 +266,243 @@ def llm_route_experts(
     if decision is None:
         raise ValueError("Router model did not return valid routing JSON.")
     return decision
+
+
+@dataclass(frozen=True)
+class _RouterCall:
+    messages: list
+    cache: TieredCache | None
+    cache_key: str
+    cache_tag: str
+
+
+def _prepare_router_call(
+    *,
+    user_input: str,
+    messages: list,
+    max_history_messages: int,
+    manual_id: str | None,
+    manual_sha256: str | None,
+) -> _RouterCall:
+    history_text = _render_history(messages, max_messages=max_history_messages)
+    layout = get_router_layout()
+    prefix_message = None
+    prefix_hash = ""
+    prefix_sha256 = None
+    if layout == "shared_prefix":
+        # Same pinned manual version as the experts of this turn.
+        artifacts = get_manual_registry().for_turn(
+            manual_id=manual_id,
+            manual_sha256=manual_sha256,
+        ).artifacts
+        prefix_message = artifacts.system_prefix_message
+        prefix_hash = artifacts.system_prefix_hash
+        prefix_sha256 = artifacts.manual_sha256
+    system_messages = router_system_messages(layout,
+                                             prefix_message=prefix_message)
+    cache = get_routing_cache()
+    cache_key = cache_tag = ""
+    if cache is not None:
+        cache_key = routing_cache_key(user_input=user_input,
+                                      history_text=history_text)
+        # The manual is part of the router prompt in `shared_prefix`; its
+        # hash stands in for the ~91 KB text.
+        system_prompt = "\n".join(
+            [prefix_hash] +
+            [m.content for m in system_messages if m is not prefix_message])
+        cache_tag = routing_cache_tag(system_prompt=system_prompt,
+                                      llm_config=load_llm_config(),
+                                      manual_sha256=prefix_sha256)
+    return _RouterCall(
+        messages=router_messages(user_input=user_input,
+                                 history_text=history_text,
+                                 system_messages=system_messages),
+        cache=cache,
+        cache_key=cache_key,
+        cache_tag=cache_tag,
+    )
+
+
+def _cached_decision(call: _RouterCall, *,
+                     user_input: str) -> RoutingDecision | None:
+    if call.cache is None:
+        return None
+    value = call.cache.get(call.cache_key, tag=call.cache_tag)
+    if value is None:
+        return None
+    ROUTER_TIMINGS.record_hit()
+    return decode_decision(value, user_input=user_input)
+
+
+_LOG_LOCK = threading.Lock()
+
+
+def _log_decision(decision: RoutingDecision, *, user_input: str) -> None:
+    # Training data for the local router (`cache-lm router-train`): one JSON
+    # line per decision the LLM router actually made.
+    path = get_env("CACHE_LM_ROUTER_LOG")
+    if not path:
+        return
+    line = encode_decision(decision, user_input=user_input)
+    with _LOG_LOCK:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def _record_router_call(
+        call: _RouterCall,
+        decision: RoutingDecision,
+        *,
+        user_input: str,
+        started: float,
+        first_chunk_at: float | None = None) -> RoutingDecision:
+    # TTFT is the first streamed chunk; a blocking call has nothing before
+    # the whole response, so its TTFT is its latency.
+    ended = time.perf_counter()
+    ROUTER_TIMINGS.record_call((ended - started) * 1000.0)
+    _log_decision(decision, user_input=user_input)
+    decision = replace(decision,
+                       ttft_ms=((first_chunk_at or ended) - started) * 1000.0)
+    if call.cache is None:
+        return decision
+    call.cache.set(call.cache_key,
+                   encode_decision(decision, user_input=user_input),
+                   tag=call.cache_tag)
+    return replace(decision, cache_hit=False)
+
+
+def _finish_router_call(call: _RouterCall, response, *, user_input: str,
+                        started: float) -> RoutingDecision:
+    decision = _decision_from_response(response, user_input=user_input)
+    return _record_router_call(call,
+                               decision,
+                               user_input=user_input,
+                               started=started)
+
+
+def llm_route_experts(
+    *,
+    user_input: str,
+    messages: list,
+    max_history_messages: int = 6,
+    manual_id: str | None = None,
+    manual_sha256: str | None = None,
+) -> RoutingDecision:
+    call = _prepare_router_call(
+        user_input=user_input,
+        messages=messages,
+        max_history_messages=max_history_messages,
+        manual_id=manual_id,
+        manual_sha256=manual_sha256,
+    )
+    cached = _cached_decision(call, user_input=user_input)
+    if cached is not None:
+        return cached
+    model = create_chat_model(streaming=False)
+    started = time.perf_counter()
+    response = model.invoke(call.messages)
+    return _finish_router_call(call,
+                               response,
+                               user_input=user_input,
+                               started=started)
+
+
+async def allm_route_experts(
+    *,
+    user_input: str,
+    messages: list,
+    max_history_messages: int = 6,
+    manual_id: str | None = None,
+    manual_sha256: str | None = None,
+) -> RoutingDecision:
+    call = _prepare_router_call(
+        user_input=user_input,
+        messages=messages,
+        max_history_messages=max_history_messages,
+        manual_id=manual_id,
+        manual_sha256=manual_sha256,
+    )
+    cached = _cached_decision(call, user_input=user_input)
+    if cached is not None:
+        return cached
+    model = create_chat_model(streaming=False)
+    started = time.perf_counter()
+    response = await model.ainvoke(call.messages)
+    return _finish_router_call(call,
+                               response,
+                               user_input=user_input,
+                               started=started)
+
+
+def stream_route_experts(
+    *,
+    user_input: str,
+    messages: list,
+    on_task,
+    max_history_messages: int = 6,
+    manual_id: str | None = None,
+    manual_sha256: str | None = None,
+) -> RoutingDecision:
+    # Streaming variant of `llm_route_experts`: `on_task` is called for each
+    # task as soon as its JSON object is complete. Cache hits return without
+    # calling it (there is nothing to overlap with).
+    call = _prepare_router_call(
+        user_input=user_input,
+        messages=messages,
+        max_history_messages=max_history_messages,
+        manual_id=manual_id,
+        manual_sha256=manual_sha256,
+    )
+    cached = _cached_decision(call, user_input=user_input)
+    if cached is not None:
+        return cached
+    model = create_chat_model(streaming=True)
+    started = time.perf_counter()
+    streamed = _StreamedTasks(user_input=user_input, on_task=on_task)
+    first_chunk_at: float | None = None
+    for chunk in model.stream(call.messages):
+        text = message_to_text(chunk)
+        if text and first_chunk_at is None:
+            first_chunk_at = time.perf_counter()
+        streamed.feed(text)
+    return _record_router_call(call,
+                               streamed.decision(),
+                               user_input=user_input,
+                               started=started,
+                               first_chunk_at=first_chunk_at)
+
+
+async def astream_route_experts(
+    *,
+    user_input: str,
+    messages: list,
+    on_task,
+    max_history_messages: int = 6,
+    manual_id: str | None = None,
+    manual_sha256: str | None = None,
+) -> RoutingDecision:
+    call = _prepare_router_call(
+        user_input=user_input,
+        messages=messages,
+        max_history_messages=max_history_messages,
+        manual_id=manual_id,
+        manual_sha256=manual_sha256,
+    )
+    cached = _cached_decision(call, user_input=user_input)
+    if cached is not None:
+        return cached
+    model = create_chat_model(streaming=True)
+    started = time.perf_counter()
+    streamed = _StreamedTasks(user_input=user_input, on_task=on_task)
+    first_chunk_at: float | None = None
+    async for chunk in model.astream(call.messages):
+        text = message_to_text(chunk)
+        if text and first_chunk_at is None:
+            first_chunk_at = time.perf_counter()
+        streamed.feed(text)
+    return _record_router_call(call,
+                               streamed.decision(),
+                               user_input=user_input,
+                               started=started,
+                               first_chunk_at=first_chunk_at)
@@ -0,0 +1,319 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+import json
+from pathlib import Path
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from cache_lm.env import get_env
+from cache_lm.state import Expert
+from cache_lm.state import ExpertTask
+from cache_lm.state import RoutingDecision
+
+# Output order matches the LLM router's deterministic task order.
+LOCAL_ROUTER_EXPERTS: tuple[Expert, ...] = (
+    "compliance_auditor",
+    "technical_specialist",
+    "support_concierge",
+)
+
+_ARTIFACT_VERSION = 1
+_DEFAULT_FEATURES = 1 << 13
+# Routing is decided by the question, not by a pasted log; long inputs are
+# scored on their head and tail only, so latency stays flat.
+_MAX_CHARS = 1024
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+def _grams(text: str) -> set[str]:
+    text = text.lower()
+    if len(text) > _MAX_CHARS:
+        text = text[:_MAX_CHARS // 2] + " " + text[-_MAX_CHARS // 2:]
+    words = _WORD.findall(text)
+    unique = set(words)
+    grams = {f"w:{w}" for w in unique}
+    grams.update(f"b:{a} {b}" for a, b in zip(words, words[1:]))
+    # Character trigrams inside words tolerate inflections and typos
+    # ("regulatory" vs "regulation"). Ids, timestamps and numbers only add
+    # hashing cost, so they get word features only.
+    for word in unique:
+        if not word.isalpha():
+            continue
+        padded = f"<{word}>"
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def hashed_features(text: str, n_features: int) -> np.ndarray:
+    # Unique bucket indices of the input's n-grams; each feature is binary.
+    # crc32 is stable across processes (unlike `hash`, which is salted).
+    buckets = {
+        zlib.crc32(g.encode("utf-8")) % n_features
+        for g in _grams(text)
+    }
+    return np.fromiter(buckets, dtype=np.int64, count=len(buckets))
+
+
+def _sigmoid(z: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-z))
+
+
+@dataclass(frozen=True)
+class LocalRoute:
+    tasks: list[ExpertTask]
+    probabilities: dict[Expert, float]
+    # The least certain label: min over experts of max(p, 1 - p).
+    confidence: float
+
+    def decision(self) -> RoutingDecision:
+        return RoutingDecision(tasks=self.tasks)
+
+
+@dataclass(frozen=True)
+class LocalRouterModel:
+    # One-vs-rest logistic regression over L2-normalized binary hashed
+    # n-grams: one weight row per expert.
+    weights: np.ndarray
+    bias: np.ndarray
+    metadata: dict[str, object]
+
+    @property
+    def n_features(self) -> int:
+        return int(self.weights.shape[1])
+
+    def predict_proba(self, text: str) -> np.ndarray:
+        idx = hashed_features(text, self.n_features)
+        if not len(idx):
+            return _sigmoid(self.bias)
+        scores = self.weights[:, idx].sum(axis=1) / np.sqrt(len(idx))
+        return _sigmoid(scores + self.bias)
+
+    def route(self, user_input: str) -> LocalRoute:
+        probs = self.predict_proba(user_input)
+        tasks: list[ExpertTask] = [{
+            "expert": expert,
+            "query": user_input
+        } for expert, p in zip(LOCAL_ROUTER_EXPERTS, probs) if p >= 0.5]
+        confidence = float(np.maximum(probs, 1.0 - probs).min())
+        # "No expert" is not a routing decision; let the fallback decide.
+        return LocalRoute(
+            tasks=tasks,
+            probabilities=dict(zip(LOCAL_ROUTER_EXPERTS, probs.tolist())),
+            confidence=confidence if tasks else 0.0,
+        )
+
+    def save(self, path: Path) -> int:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("wb") as f:
+            np.savez_compressed(
+                f,
+                weights=self.weights.astype(np.float16),
+                bias=self.bias.astype(np.float32),
+                metadata=np.array(json.dumps(self.metadata)),
+            )
+        return path.stat().st_size
+
+    @classmethod
+    def load(cls, path: Path) -> LocalRouterModel:
+        with np.load(path, allow_pickle=False) as data:
+            metadata = json.loads(str(data["metadata"]))
+            if metadata.get("version") != _ARTIFACT_VERSION:
+                raise ValueError(f"Unsupported local router artifact: {path} "
+                                 f"(version {metadata.get('version')!r})")
+            return cls(
+                weights=data["weights"].astype(np.float32),
+                bias=data["bias"].astype(np.float32),
+                metadata=metadata,
+            )
+
+
+def load_routing_log(path: Path) -> list[tuple[str, set[Expert]]]:
+    # JSONL written by the LLM router (`CACHE_LM_ROUTER_LOG`): one
+    # `{"input": ..., "tasks": [{"expert": ..., "query": ...}]}` per line.
+    examples: list[tuple[str, set[Expert]]] = []
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            experts = {
+                task["expert"]
+                for task in record.get("tasks", [])
+                if task.get("expert") in LOCAL_ROUTER_EXPERTS
+            }
+            if record.get("input") and experts:
+                examples.append((record["input"], experts))
+    return examples
+
+
+def train_local_router(
+    examples: list[tuple[str, set[Expert]]],
+    *,
+    n_features: int = _DEFAULT_FEATURES,
+    epochs: int = 200,
+    learning_rate: float = 0.1,
+    l2: float = 1e-4,
+) -> LocalRouterModel:
+    # Full-batch Adam on a hand-rolled sparse matrix: routing logs are small
+    # (thousands of rows) and this keeps NumPy the only dependency.
+    if not examples:
+        raise ValueError("No routing examples to train on.")
+    rows = [hashed_features(text, n_features) for text, _ in examples]
+    lengths = np.array([len(r) for r in rows])
+    indices = np.concatenate(rows)
+    row_of = np.repeat(np.arange(len(rows)), lengths)
+    values = np.repeat(1.0 / np.sqrt(np.maximum(lengths, 1)), lengths)
+    labels = np.array([[expert in experts for expert in LOCAL_ROUTER_EXPERTS]
+                       for _, experts in examples],
+                      dtype=np.float64).T
+
+    n_experts = len(LOCAL_ROUTER_EXPERTS)
+    weights = np.zeros((n_experts, n_features))
+    bias = np.zeros(n_experts)
+    moments = [np.zeros_like(weights), np.zeros_like(bias)]
+    squares = [np.zeros_like(weights), np.zeros_like(bias)]
+    beta1, beta2, eps = 0.9, 0.999, 1e-8
+    n = len(rows)
+    for step in range(1, epochs + 1):
+        contrib = weights[:, indices] * values
+        scores = np.zeros((n_experts, n))
+        for e in range(n_experts):
+            scores[e] = np.bincount(row_of, weights=contrib[e], minlength=n)
+        error = (_sigmoid(scores + bias[:, None]) - labels) / n
+        grad_w = np.stack([
+            np.bincount(indices,
+                        weights=error[e, row_of] * values,
+                        minlength=n_features) for e in range(n_experts)
+        ]) + l2 * weights
+        grad_b = error.sum(axis=1)
+        for param, grad, m, v in zip((weights, bias), (grad_w, grad_b),
+                                     moments, squares):
+            m *= beta1
+            m += (1 - beta1) * grad
+            v *= beta2
+            v += (1 - beta2) * grad * grad
+            m_hat = m / (1 - beta1**step)
+            v_hat = v / (1 - beta2**step)
+            param -= learning_rate * m_hat / (np.sqrt(v_hat) + eps)
+
+    return LocalRouterModel(
+        weights=weights.astype(np.float32),
+        bias=bias.astype(np.float32),
+        metadata={
+            "version": _ARTIFACT_VERSION,
+            "experts": list(LOCAL_ROUTER_EXPERTS),
+            "samples": n,
+            "epochs": epochs,
+            "trained_at": time.time(),
+        },
+    )
+
+
+def evaluate_local_router(model: LocalRouterModel,
+                          examples: list[tuple[str, set[Expert]]], *,
+                          threshold: float) -> dict[str, float]:
+    # `coverage`: share of inputs the local router would answer itself;
+    # `confident_accuracy`: exact expert-set match on that share.
+    exact = confident = confident_exact = 0
+    for text, experts in examples:
+        route = model.route(text)
+        match = {task["expert"] for task in route.tasks} == experts
+        exact += match
+        if route.confidence >= threshold:
+            confident += 1
+            confident_exact += match
+    n = max(len(examples), 1)
+    return {
+        "accuracy": exact / n,
+        "coverage": confident / n,
+        "confident_accuracy": confident_exact / max(confident, 1),
+    }
+
+
+def local_router_threshold() -> float:
+    return float(get_env("CACHE_LM_LOCAL_ROUTER_THRESHOLD", "0.8") or "0.8")
+
+
+class _LocalRouterStats:
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.decisions = 0
+        self.fallbacks = 0
+        self.total_us = 0.0
+
+    def record(self, *, confident: bool, elapsed_us: float) -> None:
+        with self._lock:
+            self.decisions += int(confident)
+            self.fallbacks += int(not confident)
+            self.total_us += elapsed_us
+
+    def clear(self) -> None:
+        with self._lock:
+            self.decisions = 0
+            self.fallbacks = 0
+            self.total_us = 0.0
+
+    def stats(self) -> dict[str, float | int]:
+        with self._lock:
+            calls = self.decisions + self.fallbacks
+            return {
+                "local_decisions": self.decisions,
+                "llm_fallbacks": self.fallbacks,
+                "avg_predict_us": self.total_us / calls if calls else 0.0,
+            }
+
+
+LOCAL_ROUTER_STATS = _LocalRouterStats()
+
+_LOCK = threading.Lock()
+_MODEL: LocalRouterModel | None = None
+_MODEL_SOURCE: tuple[str, float] | None = None
+
+
+def get_local_router() -> LocalRouterModel | None:
+    # Reloaded when the artifact is replaced (new path or mtime); None when
+    # there is no artifact yet, so `local` mode degrades to the LLM router.
+    path = Path(
+        get_env("CACHE_LM_LOCAL_ROUTER_MODEL", ".cache_lm/router_local.npz")
+        or ".cache_lm/router_local.npz")
+    global _MODEL, _MODEL_SOURCE
+    try:
+        source = (str(path), path.stat().st_mtime)
+    except FileNotFoundError:
+        return None
+    with _LOCK:
+        if _MODEL is None or _MODEL_SOURCE != source:
+            _MODEL = LocalRouterModel.load(path)
+            _MODEL_SOURCE = source
+        return _MODEL
+
+
+def reset_local_router() -> None:
+    global _MODEL, _MODEL_SOURCE
+    with _LOCK:
+        _MODEL = None
+        _MODEL_SOURCE = None
+    LOCAL_ROUTER_STATS.clear()
+
+
+def local_route(user_input: str) -> LocalRoute | None:
+    model = get_local_router()
+    if model is None:
+        return None
+    started = time.perf_counter()
+    route = model.route(user_input)
+    LOCAL_ROUTER_STATS.record(
+        confident=route.confidence >= local_router_threshold(),
+        elapsed_us=(time.perf_counter() - started) * 1e6,
+    )
+    return route
+
+
+def local_router_stats() -> dict[str, float | int]:
+    return LOCAL_ROUTER_STATS.stats()
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import json
+import re
+import threading
+from typing import Literal
+
+from cache_lm.cache_store import MemoryLru
+from cache_lm.cache_store import SqliteStore
+from cache_lm.cache_store import TieredCache
+from cache_lm.env import get_env
+from cache_lm.hashing import sha256_text
+from cache_lm.llm import LlmConfig
+from cache_lm.manual_registry import get_manual_registry
+from cache_lm.state import ExpertTask
+from cache_lm.state import RoutingDecision
+
+RoutingCacheMode = Literal["off", "memory", "sqlite"]
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def get_routing_cache_mode() -> RoutingCacheMode:
+    value = (get_env("CACHE_LM_ROUTING_CACHE") or "").strip().lower()
+    if value in ("off", "memory", "sqlite"):
+        return value  # type: ignore[return-value]
+    return "off"
+
+
+def _normalize_input(text: str) -> str:
+    # Routing does not depend on case or spacing; answers (response cache) do.
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+
+def routing_cache_key(*, user_input: str, history_text: str) -> str:
+    payload = {
+        "input": _normalize_input(user_input),
+        "history": sha256_text(history_text),
+    }
+    return sha256_text(
+        json.dumps(payload, ensure_ascii=False, separators=(",", ":")))
+
+
+def routing_cache_tag(*,
+                      system_prompt: str,
+                      llm_config: LlmConfig,
+                      manual_sha256: str | None = None) -> str:
+    # Entries are tagged with the router prompt + model, so a decision is
+    # never served across prompt edits. When the prompt includes a manual
+    # (`shared_prefix`), the tag starts with its sha256 so entries can be
+    # purged once that manual leaves the registry.
+    tag = sha256_text("\n".join([
+        system_prompt,
+        llm_config.model,
+        str(llm_config.temperature),
+    ]))
+    return f"{manual_sha256}:{tag}" if manual_sha256 else tag
+
+
+def _tag_is_live(tag: str) -> bool:
+    manual_sha256, sep, _ = tag.partition(":")
+    return not sep or get_manual_registry().is_resident(manual_sha256)
+
+
+class _RouterTimings:
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.total_ms = 0.0
+        self.saved_ms = 0.0
+
+    def record_call(self, latency_ms: float) -> None:
+        with self._lock:
+            self.calls += 1
+            self.total_ms += latency_ms
+
+    def record_hit(self) -> None:
+        # A hit saves one router round trip; estimate it with the mean of the
+        # calls actually made.
+        with self._lock:
+            if self.calls:
+                self.saved_ms += self.total_ms / self.calls
+
+    def clear(self) -> None:
+        with self._lock:
+            self.calls = 0
+            self.total_ms = 0.0
+            self.saved_ms = 0.0
+
+    def stats(self) -> dict[str, float | int]:
+        with self._lock:
+            avg_ms = self.total_ms / self.calls if self.calls else 0.0
+            return {
+                "router_calls": self.calls,
+                "avg_router_ms": avg_ms,
+                "router_ms_saved": self.saved_ms,
+            }
+
+
+ROUTER_TIMINGS = _RouterTimings()
+
+_CACHE: TieredCache | None = None
+_CACHE_SETTINGS: tuple | None = None
+_CACHE_LOCK = threading.Lock()
+
+
+def _settings() -> tuple:
+    ttl = float(get_env("CACHE_LM_ROUTING_CACHE_TTL_S", "3600") or "3600")
+    memory = get_env("CACHE_LM_ROUTING_CACHE_MEMORY_ENTRIES", "1024")
+    max_entries = get_env("CACHE_LM_ROUTING_CACHE_MAX_ENTRIES", "10000")
+    return (
+        get_routing_cache_mode(),
+        get_env("CACHE_LM_ROUTING_CACHE_DB", ".cache_lm/routing.sqlite"),
+        ttl if ttl > 0 else None,
+        int(memory or "1024"),
+        int(max_entries or "10000"),
+    )
+
+
+def get_routing_cache() -> TieredCache | None:
+    global _CACHE, _CACHE_SETTINGS
+    settings = _settings()
+    mode, db_path, ttl_s, memory_entries, max_entries = settings
+    with _CACHE_LOCK:
+        if settings == _CACHE_SETTINGS:
+            return _CACHE
+        if _CACHE is not None:
+            _CACHE.close()
+        _CACHE = None
+        if mode != "off":
+            sqlite = None
+            if mode == "sqlite":
+                sqlite = SqliteStore(
+                    db_path,
+                    table="routing_decisions",
+                    max_entries=max_entries,
+                    ttl_s=ttl_s,
+                )
+            _CACHE = TieredCache(
+                MemoryLru(max_entries=memory_entries, ttl_s=ttl_s),
+                sqlite,
+                is_live=_tag_is_live,
+            )
+        _CACHE_SETTINGS = settings
+        return _CACHE
+
+
+def reset_routing_cache() -> None:
+    global _CACHE, _CACHE_SETTINGS
+    with _CACHE_LOCK:
+        if _CACHE is not None:
+            _CACHE.close()
+        _CACHE = None
+        _CACHE_SETTINGS = None
+    ROUTER_TIMINGS.clear()
+
+
+def routing_cache_stats() -> dict[str, float | int]:
+    cache = get_routing_cache()
+    stats: dict[str, float | int] = dict(ROUTER_TIMINGS.stats())
+    if cache is not None:
+        stats.update(cache.stats())
+    return stats
+
+
+def encode_decision(decision: RoutingDecision, *, user_input: str) -> str:
+    payload = {"input": user_input, "tasks": decision.tasks}
+    return json.dumps(payload, ensure_ascii=False)
+
+
+def decode_decision(value: str, *, user_input: str) -> RoutingDecision:
+    data = json.loads(value)
+    tasks: list[ExpertTask] = []
+    for task in data["tasks"]:
+        query = task["query"]
+        # Tasks that just echoed the original input get the current wording.
+        if query == data.get("input"):
+            query = user_input
+        tasks.append({"expert": task["expert"], "query": query})
+    return RoutingDecision(tasks=tasks, cache_hit=True)
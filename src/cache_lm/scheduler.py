@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+import threading
+import time
+from typing import Literal
+
+from cache_lm.env import get_env
+from cache_lm.state import Expert
+
+SchedulerMode = Literal["off", "prefix"]
+
+# (system_prefix_hash, expert): calls with the same key send byte-identical
+# System #1 + System #2, so they share every prompt KV block but the query.
+PrefixKey = tuple[str, Expert]
+
+
+def get_scheduler_mode() -> SchedulerMode:
+    value = (get_env("CACHE_LM_SCHEDULER") or "").strip().lower()
+    if value in ("off", "prefix"):
+        return value  # type: ignore[return-value]
+    return "off"
+
+
+class _Waiter:
+
+    def __init__(self, key: PrefixKey,
+                 loop: asyncio.AbstractEventLoop | None) -> None:
+        self.key = key
+        self.enqueued = time.perf_counter()
+        self.loop = loop
+        self.event = threading.Event()
+        self.future = loop.create_future() if loop is not None else None
+        self.primer = False
+
+    def release(self) -> None:
+        self.event.set()
+        if self.future is not None:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self) -> None:
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class ScheduledCall:
+    # Handle for one released call. `first_token()` tells the scheduler the
+    # prefix is now cached on the backend; `close()` must always follow.
+
+    def __init__(self, scheduler: PrefixScheduler, key: PrefixKey, *,
+                 primer: bool) -> None:
+        self._scheduler = scheduler
+        self.key = key
+        self.primer = primer
+        self._warm = False
+
+    def first_token(self) -> None:
+        if not self._warm:
+            self._warm = True
+            self._scheduler._mark_warm(self.key)
+
+    def close(self) -> None:
+        if self.primer and not self._warm:
+            self._scheduler._abandon(self.key)
+
+
+class PrefixScheduler:
+    # Sits between the expert nodes and the LLM client. The first call for a
+    # prefix that is not known to be cached goes out at once and prefills it
+    # (the primer). Calls for the same prefix that arrive meanwhile are held,
+    # then released together as one wave on the primer's first token, when
+    # the backend has the prefix's KV blocks, instead of each prefilling it
+    # in parallel or landing after other prefixes have evicted it. Nothing
+    # waits longer than `max_delay_ms`.
+
+    def __init__(self, *, max_delay_ms: float, warm_prefixes: int) -> None:
+        self.max_delay_s = max_delay_ms / 1000.0
+        self._warm_capacity = max(warm_prefixes, 1)
+        self._lock = threading.Lock()
+        self._queues: dict[PrefixKey, list[_Waiter]] = {}
+        self._priming: set[PrefixKey] = set()
+        # Prefixes believed to be cached, LRU; the capacity stands in for how
+        # many prefixes the backend's KV cache holds at once.
+        self._warm: OrderedDict[PrefixKey, None] = OrderedDict()
+        self._queue_depth = 0
+        self._max_queue_depth = 0
+        self._released = 0
+        self._hits = 0
+        self._timeouts = 0
+        self._waves = 0
+        self._wave_calls = 0
+        self._max_wave = 0
+        self._waited = 0
+        self._wait_ms_total = 0.0
+
+    def _admit(self, key: PrefixKey,
+               loop: asyncio.AbstractEventLoop | None) -> _Waiter | bool:
+        # Returns a waiter to block on, or whether the call released at once
+        # is the primer for its prefix.
+        with self._lock:
+            if key in self._warm:
+                self._warm.move_to_end(key)
+                self._released += 1
+                self._hits += 1
+                return False
+            if key not in self._priming:
+                self._priming.add(key)
+                self._released += 1
+                return True
+            waiter = _Waiter(key, loop)
+            self._queues.setdefault(key, []).append(waiter)
+            self._queue_depth += 1
+            self._max_queue_depth = max(self._max_queue_depth,
+                                        self._queue_depth)
+            return waiter
+
+    def _dequeue(self, waiters: list[_Waiter], *, hit: bool) -> None:
+        # Caller holds the lock.
+        now = time.perf_counter()
+        self._queue_depth -= len(waiters)
+        self._released += len(waiters)
+        self._hits += len(waiters) if hit else 0
+        self._waited += len(waiters)
+        self._wait_ms_total += sum(
+            (now - waiter.enqueued) * 1000.0 for waiter in waiters)
+
+    def _mark_warm(self, key: PrefixKey) -> None:
+        with self._lock:
+            self._priming.discard(key)
+            self._warm[key] = None
+            self._warm.move_to_end(key)
+            while len(self._warm) > self._warm_capacity:
+                self._warm.popitem(last=False)
+            waiters = self._queues.pop(key, [])
+            if waiters:
+                self._dequeue(waiters, hit=True)
+                self._waves += 1
+                self._wave_calls += len(waiters)
+                self._max_wave = max(self._max_wave, len(waiters))
+        for waiter in waiters:
+            waiter.release()
+
+    def _abandon(self, key: PrefixKey) -> None:
+        # The primer failed or was cancelled before its first token: the
+        # longest-waiting call takes over priming.
+        with self._lock:
+            waiters = self._queues.get(key)
+            if not waiters:
+                self._priming.discard(key)
+                return
+            waiter = waiters.pop(0)
+            if not waiters:
+                del self._queues[key]
+            waiter.primer = True
+            self._dequeue([waiter], hit=False)
+        waiter.release()
+
+    def _expire(self, waiter: _Waiter, *, timed_out: bool) -> bool:
+        # Removes a waiter that stopped waiting; False if it was released in
+        # the meantime.
+        with self._lock:
+            waiters = self._queues.get(waiter.key, [])
+            if waiter not in waiters:
+                return False
+            waiters.remove(waiter)
+            if not waiters:
+                del self._queues[waiter.key]
+            self._dequeue([waiter], hit=False)
+            self._timeouts += int(timed_out)
+            return True
+
+    def _wait_s(self, timeout_s: float | None) -> tuple[float, bool]:
+        # How long to hold a call, and whether that is `max_delay_ms` (a
+        # scheduler timeout) rather than the caller's shorter `timeout_s`.
+        if timeout_s is None or timeout_s >= self.max_delay_s:
+            return self.max_delay_s, True
+        return timeout_s, False
+
+    def acquire(self,
+                key: PrefixKey,
+                timeout_s: float | None = None) -> ScheduledCall:
+        # `timeout_s` (e.g. what is left of the turn budget) shortens the
+        # wait; the caller decides what to do with a call released by it.
+        admitted = self._admit(key, None)
+        if not isinstance(admitted, _Waiter):
+            return ScheduledCall(self, key, primer=admitted)
+        wait_s, capped = self._wait_s(timeout_s)
+        if not admitted.event.wait(wait_s):
+            self._expire(admitted, timed_out=capped)
+        return ScheduledCall(self, key, primer=admitted.primer)
+
+    async def aacquire(self,
+                       key: PrefixKey,
+                       timeout_s: float | None = None) -> ScheduledCall:
+        admitted = self._admit(key, asyncio.get_running_loop())
+        if not isinstance(admitted, _Waiter):
+            return ScheduledCall(self, key, primer=admitted)
+        wait_s, capped = self._wait_s(timeout_s)
+        try:
+            await asyncio.wait_for(asyncio.shield(admitted.future), wait_s)
+        except asyncio.TimeoutError:
+            self._expire(admitted, timed_out=capped)
+        except asyncio.CancelledError:
+            if not self._expire(admitted,
+                                timed_out=False) and (admitted.primer):
+                self._abandon(key)
+            raise
+        return ScheduledCall(self, key, primer=admitted.primer)
+
+    def stats(self) -> dict[str, float | int]:
+        with self._lock:
+            released = self._released
+            return {
+                "queue_depth":
+                self._queue_depth,
+                "max_queue_depth":
+                self._max_queue_depth,
+                "released":
+                released,
+                "hit_rate":
+                self._hits / released if released else 0.0,
+                "waves":
+                self._waves,
+                "avg_wave_size":
+                self._wave_calls / self._waves if self._waves else 0.0,
+                "max_wave_size":
+                self._max_wave,
+                "timeouts":
+                self._timeouts,
+                "avg_wait_ms":
+                self._wait_ms_total / self._waited if self._waited else 0.0,
+            }
+
+
+_SCHEDULER: PrefixScheduler | None = None
+_SCHEDULER_SETTINGS: tuple | None = None
+_SCHEDULER_LOCK = threading.Lock()
+
+
+def _settings() -> tuple:
+    max_delay = get_env("CACHE_LM_SCHEDULER_MAX_DELAY_MS", "250") or "250"
+    warm = get_env("CACHE_LM_SCHEDULER_WARM_PREFIXES", "16") or "16"
+    return (get_scheduler_mode(), float(max_delay), int(warm))
+
+
+def get_scheduler() -> PrefixScheduler | None:
+    global _SCHEDULER, _SCHEDULER_SETTINGS
+    settings = _settings()
+    mode, max_delay_ms, warm_prefixes = settings
+    with _SCHEDULER_LOCK:
+        if settings != _SCHEDULER_SETTINGS:
+            _SCHEDULER = None
+            if mode == "prefix":
+                _SCHEDULER = PrefixScheduler(max_delay_ms=max_delay_ms,
+                                             warm_prefixes=warm_prefixes)
+            _SCHEDULER_SETTINGS = settings
+        return _SCHEDULER
+
+
+def reset_scheduler() -> None:
+    global _SCHEDULER, _SCHEDULER_SETTINGS
+    with _SCHEDULER_LOCK:
+        _SCHEDULER = None
+        _SCHEDULER_SETTINGS = None
+
+
+def scheduler_stats() -> dict[str, float | int] | None:
+    scheduler = get_scheduler()
+    return scheduler.stats() if scheduler is not None else None
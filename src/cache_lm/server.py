@@ -1,5 +1,17 @@
 from __future__ import annotations
 
 from cache_lm.graph import create_graph
+from cache_lm.manual_reload import start_manual_watcher
+from cache_lm.mode import get_mode
+from cache_lm.warmup import ensure_prefix_warm
+from cache_lm.warmup import warmup_enabled
 
 graph = create_graph().compile()
+
+if warmup_enabled() and get_mode() == "llm":
+    # Runs in a background thread so server startup is not blocked on the
+    # manual prefill.
+    ensure_prefix_warm()
+
+# No-op unless CACHE_LM_MANUAL_RELOAD_S > 0.
+start_manual_watcher()
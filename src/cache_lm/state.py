@@ -20,12 +20,40 @@ class State(MessagesState):
     current_task: ExpertTask | None
     expert_outputs: Annotated[dict[Expert, str], operator.or_]
     response: str
+    manual_id: str
     manual_sha256: str
     system_prefix_hash: str
     ttft_ms_by_expert: Annotated[dict[Expert, float], operator.or_]
     latency_ms_by_expert: Annotated[dict[Expert, float], operator.or_]
+    cache_hit_by_expert: Annotated[dict[Expert, bool], operator.or_]
+    hedge_by_expert: Annotated[dict[Expert, dict[str, object]], operator.or_]
+    turn_started_at: float
+    first_token_at_by_expert: Annotated[dict[Expert, float], operator.or_]
+    first_visible_token_ms: float | None
+    router_cache_hit: bool | None
+    local_router_confidence: float | None
+    early_dispatch_id: str | None
+    router_lead_ms_by_expert: dict[Expert, float]
+    router_overlap_ms_saved: float | None
+    speculation: dict[str, object] | None
+    router_layout: str | None
+    router_ttft_ms: float | None
+    first_expert_ttft_ms: float | None
+    leader_expert: Expert | None
+    turn_latency_ms: float | None
+    execution_decision: dict[str, object] | None
+    turn_budget_ms: float | None
+    turn_deadline_at: float | None
+    cutoff_by_expert: Annotated[dict[Expert, dict[str, object]], operator.or_]
+    partial_response: bool
+    deadline: dict[str, object] | None
+    prompt_by_expert: Annotated[dict[Expert, dict[str, object]], operator.or_]
 
 
 @dataclass(frozen=True)
 class RoutingDecision:
     tasks: list[ExpertTask]
+    # LLM router only: whether the decision came from the routing cache.
+    cache_hit: bool | None = None
+    # LLM router only, None on cache hits: time to the router's first chunk.
+    ttft_ms: float | None = None
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+from collections.abc import Callable
+
+from cache_lm.state import Expert
+
+# Same order `_finalize` uses to assemble the response.
+SECTION_ORDER: list[Expert] = [
+    "compliance_auditor",
+    "technical_specialist",
+    "support_concierge",
+]
+SECTION_SEPARATOR = "\n\n"
+
+
+def _noop_writer(event: dict) -> None:
+    pass
+
+
+def stream_writer() -> Callable[[dict], None]:
+    # Expert helpers are also called outside a graph run (tests, warm-up), where
+    # LangGraph has no writer to hand out.
+    from langgraph.config import get_stream_writer
+    try:
+        return get_stream_writer()
+    except RuntimeError:
+        return _noop_writer
+
+
+def route_event(experts: list[Expert]) -> dict[str, object]:
+    return {"event": "route", "experts": list(experts)}
+
+
+def token_event(expert: Expert,
+                text: str,
+                call_id: str | None = None) -> dict[str, object]:
+    # Tokens of calls started before routing finished carry their call id,
+    # so a later `cancel` event can retract them.
+    event: dict[str, object] = {
+        "event": "token",
+        "expert": expert,
+        "text": text
+    }
+    if call_id is not None:
+        event["call"] = call_id
+    return event
+
+
+def cancel_event(expert: Expert, call_id: str) -> dict[str, object]:
+    return {"event": "cancel", "expert": expert, "call": call_id}
+
+
+def end_event(expert: Expert) -> dict[str, object]:
+    return {"event": "end", "expert": expert}
+
+
+def partial_event(text: str) -> dict[str, object]:
+    return {"event": "partial", "text": text}
+
+
+class SectionOrderer:
+    # Turns the `custom` stream events of one turn into text in `_finalize`
+    # order. Tokens of the section currently being printed pass straight
+    # through; tokens of later sections are buffered until it ends. Cancelled
+    # speculative calls are reconciled before the `route` event, so their
+    # tokens are still buffered when the `cancel` event drops them.
+
+    def __init__(self) -> None:
+        self._sections: list[Expert] = []
+        # expert -> [(call id, text)]
+        self._buffers: dict[Expert, list[tuple[str | None, str]]] = {}
+        self._cancelled: set[str] = set()
+        self._done: set[Expert] = set()
+        self._opened: set[Expert] = set()
+        self._index = 0
+
+    def feed(self, event: dict) -> list[str]:
+        kind = event.get("event")
+        if kind == "route":
+            routed = set(event.get("experts") or [])
+            self._sections = [e for e in SECTION_ORDER if e in routed]
+            return self._flush_current()
+        if kind == "partial":
+            # Emitted by `_finalize` after every section has ended.
+            text = event.get("text") or ""
+            return [SECTION_SEPARATOR + text if self._opened else text]
+        expert = event.get("expert")
+        if expert not in SECTION_ORDER:
+            return []
+        if kind == "cancel":
+            call_id = event.get("call")
+            self._cancelled.add(call_id)
+            self._buffers[expert] = [
+                part for part in self._buffers.get(expert, [])
+                if part[0] != call_id
+            ]
+            return []
+        if kind == "token":
+            call_id = event.get("call")
+            if call_id in self._cancelled:
+                return []
+            self._buffers.setdefault(expert, []).append(
+                (call_id, event.get("text") or ""))
+            if self._current() == expert:
+                return self._flush_current()
+            return []
+        if kind == "end":
+            self._done.add(expert)
+            return self._advance()
+        return []
+
+    def _current(self) -> Expert | None:
+        if self._index < len(self._sections):
+            return self._sections[self._index]
+        return None
+
+    def _flush_current(self) -> list[str]:
+        expert = self._current()
+        if expert is None:
+            return []
+        text = "".join(part for _, part in self._buffers.pop(expert, []))
+        if expert not in self._opened:
+            # Sections are stripped and joined with a blank line in
+            # `_finalize`; mirror that for the streamed text.
+            text = text.lstrip()
+            if not text:
+                return []
+            if self._opened:
+                text = SECTION_SEPARATOR + text
+            self._opened.add(expert)
+        return [text] if text else []
+
+    def _advance(self) -> list[str]:
+        out: list[str] = []
+        while True:
+            current = self._current()
+            if current is None or current not in self._done:
+                return out
+            self._index += 1
+            out.extend(self._flush_current())
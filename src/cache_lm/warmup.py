@@ -0,0 +1,289 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+import json
+from pathlib import Path
+import statistics
+import threading
+import time
+import uuid
+
+from langchain_core.messages import HumanMessage
+from langchain_core.messages import SystemMessage
+
+from cache_lm.env import get_env
+from cache_lm.llm import create_chat_model
+from cache_lm.llm import load_llm_config
+from cache_lm.manual import get_manual
+from cache_lm.manual import Manual
+from cache_lm.prompts import build_langchain_messages
+from cache_lm.prompts import EXPERT_NAMES
+from cache_lm.prompts import expert_system_suffix_text
+from cache_lm.prompts import prompt_artifacts
+from cache_lm.router_keywords import get_keyword_matcher
+from cache_lm.router_llm import router_messages
+from cache_lm.router_llm import router_system_messages
+from cache_lm.router_llm import RouterLayout
+from cache_lm.state import Expert
+
+# A short, fixed query: the point is to prefill System #1 + System #2, not to
+# generate anything useful.
+WARMUP_QUERY = "Reply with OK."
+WARMUP_MAX_TOKENS = 1
+
+
+@dataclass(frozen=True)
+class WarmupResult:
+    expert: Expert
+    cold_ttft_ms: float
+    warm_ttft_ms: float
+
+
+@dataclass(frozen=True)
+class RouterLayoutTiming:
+    layout: RouterLayout
+    first_expert: Expert
+    router_ttft_ms: float
+    first_expert_ttft_ms: float
+
+
+@dataclass(frozen=True)
+class WarmupReport:
+    system_prefix_hash: str
+    skipped: bool
+    results: tuple[WarmupResult, ...] = ()
+
+
+_LOCK = threading.Lock()
+_WARMED: dict[tuple[str, str, str], WarmupReport] = {}
+_IN_FLIGHT: set[tuple[str, str, str]] = set()
+
+
+def warmup_enabled() -> bool:
+    return (get_env("CACHE_LM_WARMUP", "0") or "0").lower() in ("1", "true")
+
+
+def _state_file() -> Path | None:
+    value = get_env("CACHE_LM_WARMUP_STATE")
+    return Path(value) if value else None
+
+
+def _state_ttl_s() -> float | None:
+    # The backend evicts KV blocks and loses them on restart, so a persisted
+    # "warm" only holds for a while; 0 trusts it forever.
+    ttl = float(get_env("CACHE_LM_WARMUP_STATE_TTL_S", "600") or "600")
+    return ttl if ttl > 0 else None
+
+
+def _warmup_key(prefix_hash: str) -> tuple[str, str, str]:
+    # KV blocks live on a specific backend/model, so "already warmed" is scoped
+    # to the endpoint as well as the prefix.
+    cfg = load_llm_config()
+    return (cfg.base_url, cfg.model, prefix_hash)
+
+
+def _read_state(path: Path) -> dict[str, float]:
+    # key -> when it was warmed (epoch seconds); expired entries are left
+    # out. Files without timestamps (older format) count as expired.
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return {}
+    warmed = data.get("warmed")
+    if not isinstance(warmed, dict):
+        return {}
+    ttl_s = _state_ttl_s()
+    now = time.time()
+    return {
+        str(key): float(at)
+        for key, at in warmed.items()
+        if ttl_s is None or float(at) + ttl_s > now
+    }
+
+
+def _write_state(path: Path, key: tuple[str, str, str]) -> None:
+    warmed = _read_state(path)
+    warmed["|".join(key)] = time.time()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({"warmed": dict(sorted(warmed.items()))},
+                               indent=2),
+                    encoding="utf-8")
+
+
+def _measure_ttft_ms(model, lc_messages: list) -> float:
+    start = time.perf_counter()
+    first_token_time: float | None = None
+    for chunk in model.stream(lc_messages):
+        if first_token_time is None and chunk.content:
+            first_token_time = time.perf_counter()
+    end = time.perf_counter()
+    return ((first_token_time or end) - start) * 1000.0
+
+
+def _warm_expert(expert: Expert, *, manual: Manual) -> WarmupResult:
+    lc_messages = build_langchain_messages(
+        expert=expert,
+        user_input=WARMUP_QUERY,
+        artifacts=prompt_artifacts(manual),
+    )
+    model = create_chat_model(streaming=True, max_tokens=WARMUP_MAX_TOKENS)
+    cold_ttft_ms = _measure_ttft_ms(model, lc_messages)
+    warm_ttft_ms = _measure_ttft_ms(model, lc_messages)
+    return WarmupResult(
+        expert=expert,
+        cold_ttft_ms=cold_ttft_ms,
+        warm_ttft_ms=warm_ttft_ms,
+    )
+
+
+def is_prefix_warm(*, manual: Manual | None = None) -> bool:
+    manual = manual or get_manual()
+    key = _warmup_key(prompt_artifacts(manual).system_prefix_hash)
+    with _LOCK:
+        return key in _WARMED
+
+
+def warm_prefix(*,
+                manual: Manual | None = None,
+                force: bool = False,
+                use_state_file: bool = True) -> WarmupReport:
+    # `use_state_file=False` only skips hashes warmed by this process; the
+    # result is still recorded in the state file.
+    manual = manual or get_manual()
+    prefix_hash = prompt_artifacts(manual).system_prefix_hash
+    key = _warmup_key(prefix_hash)
+    state_file = _state_file()
+
+    if not force:
+        with _LOCK:
+            if key in _WARMED:
+                return WarmupReport(system_prefix_hash=prefix_hash,
+                                    skipped=True)
+        if (use_state_file and state_file
+                and "|".join(key) in _read_state(state_file)):
+            report = WarmupReport(system_prefix_hash=prefix_hash, skipped=True)
+            with _LOCK:
+                _WARMED.setdefault(key, report)
+            return report
+
+    results = tuple(
+        _warm_expert(expert, manual=manual) for expert in EXPERT_NAMES)
+    report = WarmupReport(
+        system_prefix_hash=prefix_hash,
+        skipped=False,
+        results=results,
+    )
+    with _LOCK:
+        _WARMED[key] = report
+    if state_file:
+        _write_state(state_file, key)
+    return report
+
+
+def _warm_in_background(manual: Manual, key: tuple[str, str, str]) -> None:
+    # Runs at process start-up (server, first graph build): the backend may
+    # have restarted since another process recorded the hash as warm.
+    try:
+        warm_prefix(manual=manual, use_state_file=False)
+    except Exception:
+        # Warm-up is best effort; the first real turn simply stays cold.
+        pass
+    finally:
+        with _LOCK:
+            _IN_FLIGHT.discard(key)
+
+
+def ensure_prefix_warm(*,
+                       manual: Manual | None = None
+                       ) -> threading.Thread | None:
+    manual = manual or get_manual()
+    key = _warmup_key(prompt_artifacts(manual).system_prefix_hash)
+    with _LOCK:
+        if key in _WARMED or key in _IN_FLIGHT:
+            return None
+        _IN_FLIGHT.add(key)
+    thread = threading.Thread(
+        target=_warm_in_background,
+        args=(manual, key),
+        name="cache-lm-warmup",
+        daemon=True,
+    )
+    thread.start()
+    return thread
+
+
+def warmup_reports() -> list[WarmupReport]:
+    with _LOCK:
+        return list(_WARMED.values())
+
+
+def reset_warmup_state() -> None:
+    with _LOCK:
+        _WARMED.clear()
+        _IN_FLIGHT.clear()
+
+
+def _measure_router_layout(layout: RouterLayout, *, user_input: str,
+                           expert: Expert,
+                           manual: Manual) -> RouterLayoutTiming:
+    # A fresh nonce at the very start of System #1 gives every run a prefix
+    # the backend has never cached, so each layout starts cold: the router
+    # call pays the prefill (or not), and the expert call after it shows
+    # what that left behind.
+    prefix_message = SystemMessage(content=f"[run {uuid.uuid4().hex}]\n\n" +
+                                   prompt_artifacts(manual).system_prefix)
+    model = create_chat_model(streaming=True, max_tokens=WARMUP_MAX_TOKENS)
+    router_ttft_ms = _measure_ttft_ms(
+        model,
+        router_messages(
+            user_input=user_input,
+            history_text="",
+            system_messages=router_system_messages(
+                layout, prefix_message=prefix_message),
+        ),
+    )
+    first_expert_ttft_ms = _measure_ttft_ms(model, [
+        prefix_message,
+        SystemMessage(content=expert_system_suffix_text(expert)),
+        HumanMessage(content=user_input),
+    ])
+    return RouterLayoutTiming(
+        layout=layout,
+        first_expert=expert,
+        router_ttft_ms=router_ttft_ms,
+        first_expert_ttft_ms=first_expert_ttft_ms,
+    )
+
+
+def compare_router_layouts(*,
+                           user_input: str,
+                           repeats: int = 3,
+                           manual: Manual | None = None
+                           ) -> dict[RouterLayout, RouterLayoutTiming]:
+    # Median router TTFT + first-expert TTFT per router layout, runs
+    # interleaved so backend load drifts affect both layouts alike.
+    manual = manual or get_manual()
+    matched = get_keyword_matcher().match(user_input)
+    expert: Expert = matched[0] if matched else "support_concierge"
+    layouts: tuple[RouterLayout, ...] = ("standalone", "shared_prefix")
+    runs: dict[RouterLayout,
+               list[RouterLayoutTiming]] = {layout: []
+                                            for layout in layouts}
+    for _ in range(max(repeats, 1)):
+        for layout in layouts:
+            runs[layout].append(
+                _measure_router_layout(layout,
+                                       user_input=user_input,
+                                       expert=expert,
+                                       manual=manual))
+    return {
+        layout: RouterLayoutTiming(
+            layout=layout,
+            first_expert=expert,
+            router_ttft_ms=statistics.median(r.router_ttft_ms
+                                             for r in timings),
+            first_expert_ttft_ms=statistics.median(r.first_expert_ttft_ms
+                                                   for r in timings),
+        )
+        for layout, timings in runs.items()
+    }
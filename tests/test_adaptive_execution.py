@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import asyncio
+import random
+
+from langchain_core.messages import HumanMessage
+import pytest
+
+from cache_lm.adaptive import adaptive_stats
+from cache_lm.adaptive import AdaptiveExecution
+from cache_lm.adaptive import reset_adaptive_execution
+from cache_lm.graph import create_graph
+
+# The rules router sends this to all three experts.
+_QUERY = ("Can I do this under policy, what are the API limits, and "
+          "summarize in steps?")
+_LATENCY_MS = {"sequential": 300.0, "parallel": 120.0, "leader": 90.0}
+
+
+@pytest.fixture(autouse=True)
+def _adaptive_env(monkeypatch):
+    monkeypatch.setenv("CACHE_LM_ADAPTIVE_MIN_SAMPLES", "2")
+    monkeypatch.setenv("CACHE_LM_ADAPTIVE_EXPLORE", "0")
+    reset_adaptive_execution(rng=random.Random(0))
+    yield
+    reset_adaptive_execution()
+
+
+def _finish(adaptive: AdaptiveExecution, decision: dict) -> dict:
+    # Backdate the start so the measured latency is the mode's fixed cost.
+    decision["started_at"] -= _LATENCY_MS[decision["mode"]] / 1000.0
+    return adaptive.record(decision, ttft_ms=None)
+
+
+def test_tries_every_mode_then_picks_the_fastest() -> None:
+    adaptive = AdaptiveExecution(rng=random.Random(0))
+    first = [_finish(adaptive, adaptive.choose(3)) for _ in range(6)]
+    assert sorted(d["mode"] for d in first) == sorted(
+        ["sequential", "parallel", "leader"] * 2)
+    assert all(d["explored"] for d in first)
+
+    decision = _finish(adaptive, adaptive.choose(3))
+    assert decision["mode"] == "leader" and not decision["explored"]
+    assert decision["predicted_ms"] == pytest.approx(90.0, abs=5.0)
+    assert decision["actual_ms"] == pytest.approx(90.0, abs=5.0)
+    # Estimates are per expert count: two experts start exploring afresh.
+    assert adaptive.choose(2)["explored"]
+    assert adaptive.stats()["leader/3"]["turns"] == 3
+
+
+def test_exploration_budget_keeps_sampling_other_modes(monkeypatch) -> None:
+    adaptive = AdaptiveExecution(rng=random.Random(0))
+    for _ in range(6):
+        _finish(adaptive, adaptive.choose(3))
+    monkeypatch.setenv("CACHE_LM_ADAPTIVE_EXPLORE", "0.5")
+    decisions = [_finish(adaptive, adaptive.choose(3)) for _ in range(40)]
+    explored = sum(d["explored"] for d in decisions)
+    assert 10 <= explored <= 30
+    assert {d["mode"]
+            for d in decisions} == {"sequential", "parallel", "leader"}
+
+
+def test_budget_cut_turns_are_not_sampled() -> None:
+    adaptive = AdaptiveExecution(rng=random.Random(0))
+    decision = adaptive.choose(3)
+    decision["started_at"] -= 5.0
+    cut = adaptive.record(decision, ttft_ms=None, partial=True)
+    assert cut["actual_ms"] == pytest.approx(5000.0, abs=50.0)
+    assert not cut["sampled"] and adaptive.stats() == {}
+
+    done = _finish(adaptive, adaptive.choose(3))
+    assert done["sampled"]
+    assert sum(s["turns"] for s in adaptive.stats().values()) == 1
+
+
+def test_single_expert_turns_run_sequentially() -> None:
+    decision = AdaptiveExecution().choose(1)
+    assert decision["mode"] == "sequential" and not decision["explored"]
+    assert decision["predicted_ms"] is None
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_adaptive_graph_records_each_turns_decision(monkeypatch,
+                                                    use_async) -> None:
+    monkeypatch.setenv("CACHE_LM_EXPERT_EXECUTION", "adaptive")
+    graph = create_graph().compile()
+    inputs = {"messages": [HumanMessage(content=_QUERY)]}
+
+    results = []
+    for _ in range(7):
+        if use_async:
+            results.append(asyncio.run(graph.ainvoke(inputs)))
+        else:
+            results.append(graph.invoke(inputs))
+
+    for result in results:
+        assert len(result["expert_outputs"]) == 3
+        assert len(result["messages"]) == 2
+        decision = result["execution_decision"]
+        assert decision["experts"] == 3 and decision["actual_ms"] > 0
+    modes = [r["execution_decision"]["mode"] for r in results]
+    assert sorted(modes[:6]) == sorted(["sequential", "parallel", "leader"] *
+                                       2)
+    stats = adaptive_stats()
+    assert sum(s["turns"] for s in stats.values()) == 7
+    # The seventh turn exploits, predicting from two samples of its mode.
+    last = results[-1]["execution_decision"]
+    assert not last["explored"] and last["predicted_ms"] is not None
+    assert stats[f"{last['mode']}/3"]["turns"] == 3
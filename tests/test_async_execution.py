@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import asyncio
+
+from langchain_core.messages import AIMessage
+from langchain_core.messages import HumanMessage
+import pytest
+
+from cache_lm.checkpointing import async_sqlite_checkpointer
+from cache_lm.graph import create_graph
+from cache_lm.router import arouter_node
+
+
+class _FakeChunk:
+
+    def __init__(self, content: str):
+        self.content = content
+
+
+class _FakeChatModel:
+
+    def __init__(self, calls: list[str]):
+        self.calls = calls
+
+    def stream(self, messages):
+        self.calls.append("stream")
+        yield _FakeChunk("sync")
+
+    async def astream(self, messages):
+        self.calls.append("astream")
+        await asyncio.sleep(0)
+        yield _FakeChunk("async")
+
+    async def ainvoke(self, messages):
+        self.calls.append("ainvoke")
+        return AIMessage(
+            content='{"tasks":[{"expert":"compliance_auditor","query":""}]}')
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    calls: list[str] = []
+    model = _FakeChatModel(calls)
+    monkeypatch.setenv("CACHE_LM_MODE", "llm")
+    monkeypatch.setattr("cache_lm.experts.create_chat_model",
+                        lambda streaming: model)
+    monkeypatch.setattr("cache_lm.router_llm.create_chat_model",
+                        lambda streaming: model)
+    return calls
+
+
+@pytest.mark.parametrize("execution", ["sequential", "parallel"])
+def test_ainvoke_uses_async_expert_nodes(fake_model, monkeypatch,
+                                         execution) -> None:
+    monkeypatch.setenv("CACHE_LM_EXPERT_EXECUTION", execution)
+    graph = create_graph().compile()
+    result = asyncio.run(
+        graph.ainvoke({
+            "messages": [
+                HumanMessage(
+                    content=
+                    "Can I do this under policy, and what are the API limits?")
+            ]
+        }))
+
+    assert fake_model == ["astream", "astream"]
+    assert result["expert_outputs"] == {
+        "compliance_auditor": "async",
+        "technical_specialist": "async",
+    }
+    for expert in ("compliance_auditor", "technical_specialist"):
+        ttft = result["ttft_ms_by_expert"][expert]
+        assert result["latency_ms_by_expert"][expert] >= ttft >= 0
+
+
+def test_invoke_still_uses_sync_expert_nodes(fake_model) -> None:
+    graph = create_graph().compile()
+    result = graph.invoke(
+        {"messages": [HumanMessage(content="What is the API limit?")]})
+
+    assert fake_model == ["stream"]
+    assert result["expert_outputs"] == {"technical_specialist": "sync"}
+
+
+def test_async_router_node_uses_ainvoke(fake_model, monkeypatch) -> None:
+    monkeypatch.setenv("CACHE_LM_ROUTER_MODE", "llm")
+    result = asyncio.run(
+        arouter_node({"messages": [HumanMessage(content="Is this allowed?")]
+                      }))  # type: ignore[arg-type]
+
+    assert fake_model == ["ainvoke"]
+    assert [t["expert"]
+            for t in result["pending_tasks"]] == ["compliance_auditor"]
+
+
+def test_async_sqlite_checkpointer_persists_threads(tmp_path) -> None:
+
+    async def run_two_turns() -> dict:
+        config = {"configurable": {"thread_id": "t1"}}
+        db_path = str(tmp_path / "checkpoints.sqlite")
+        async with async_sqlite_checkpointer(db_path) as checkpointer:
+            graph = create_graph().compile(checkpointer=checkpointer)
+            await graph.ainvoke(
+                {"messages": [HumanMessage(content="What is the API limit?")]},
+                config=config)
+        async with async_sqlite_checkpointer(db_path) as checkpointer:
+            graph = create_graph().compile(checkpointer=checkpointer)
+            return await graph.ainvoke(
+                {"messages": [HumanMessage(content="Summarize in steps.")]},
+                config=config)
+
+    result = asyncio.run(run_two_turns())
+    assert len(result["messages"]) == 4
@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+from langchain_core.messages import HumanMessage
+import pytest
+
+from cache_lm.deadline import COMPLETION_HISTORY
+from cache_lm.graph import create_graph
+from cache_lm.prompts import prompt_artifacts
+from cache_lm.scheduler import PrefixScheduler
+from cache_lm.streaming import SectionOrderer
+
+# The rules router sends this to all three experts.
+_QUERY = ("Can I do this under policy, what are the API limits, and "
+          "summarize in steps?")
+_CHUNK_S = 0.02
+
+
+class _FakeChunk:
+
+    def __init__(self, content: str):
+        self.content = content
+
+
+class _PacedModel:
+    # Streams `chunks[expert]` tokens, one every `_CHUNK_S`, after a
+    # `stall_s` prefill.
+
+    def __init__(self, chunks: dict[str, int]) -> None:
+        self.chunks = chunks
+        self.calls: list[str] = []
+        self.stall_s = 0.0
+
+    def _count(self, messages) -> int:
+        system = messages[1].content
+        for expert, label in (("technical_specialist", "Technical"),
+                              ("compliance_auditor", "Compliance"),
+                              ("support_concierge", "Support")):
+            if system.startswith(f"You are the {label}"):
+                self.calls.append(expert)
+                return self.chunks[expert]
+        raise AssertionError(system[:40])
+
+    def stream(self, messages):
+        count = self._count(messages)
+        time.sleep(self.stall_s)
+        for i in range(count):
+            time.sleep(_CHUNK_S)
+            yield _FakeChunk(f"t{i} ")
+
+    async def astream(self, messages):
+        count = self._count(messages)
+        await asyncio.sleep(self.stall_s)
+        for i in range(count):
+            await asyncio.sleep(_CHUNK_S)
+            yield _FakeChunk(f"t{i} ")
+
+
+def _use_model(monkeypatch, chunks: dict[str, int]) -> _PacedModel:
+    model = _PacedModel(chunks)
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("CACHE_LM_MODE", "llm")
+    monkeypatch.setattr("cache_lm.experts.create_chat_model",
+                        lambda streaming: model)
+    return model
+
+
+@pytest.fixture(autouse=True)
+def _history():
+    COMPLETION_HISTORY.clear()
+    yield
+    COMPLETION_HISTORY.clear()
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_budget_cancels_running_streams_and_keeps_streamed_text(
+        monkeypatch, use_async) -> None:
+    _use_model(
+        monkeypatch, {
+            "compliance_auditor": 2,
+            "technical_specialist": 40,
+            "support_concierge": 3,
+        })
+    monkeypatch.setenv("CACHE_LM_EXPERT_EXECUTION", "parallel")
+    # A previous complete call: what the technical answer usually costs.
+    COMPLETION_HISTORY.record("technical_specialist",
+                              latency_ms=800.0,
+                              tokens=40)
+    graph = create_graph().compile()
+    inputs = {"messages": [HumanMessage(content=_QUERY)]}
+    config = {"configurable": {"turn_budget_ms": 250}}
+    started = time.perf_counter()
+    if use_async:
+        result = asyncio.run(graph.ainvoke(inputs, config=config))
+    else:
+        result = graph.invoke(inputs, config=config)
+    elapsed_ms = (time.perf_counter() - started) * 1000.0
+
+    assert elapsed_ms < 600
+    assert result["partial_response"]
+    outputs = result["expert_outputs"]
+    assert set(outputs) == {
+        "compliance_auditor", "technical_specialist", "support_concierge"
+    }
+    # The cut-off section keeps the tokens it streamed, and no more.
+    partial = outputs["technical_specialist"]
+    assert partial.startswith("t0 t1") and "t39" not in partial
+    assert partial in result["response"]
+    assert result["response"].endswith(
+        "[Partial response: the 250 ms turn budget ran out before "
+        "technical_specialist finished.]")
+    assert "t0 t1" in result["response"]
+    cut = result["cutoff_by_expert"]["technical_specialist"]
+    assert cut["started"] and 0 < cut["streamed_tokens"] < 40
+    assert len(partial.split()) == cut["streamed_tokens"]
+    deadline = result["deadline"]
+    assert deadline["cut_off"] == ["technical_specialist"]
+    assert deadline["skipped"] == []
+    assert deadline["tokens_saved"] == 40 - cut["streamed_tokens"]
+    assert deadline["ms_saved"] == pytest.approx(800.0 - cut["elapsed_ms"])
+    # The partial answer did not become the usual cost.
+    assert COMPLETION_HISTORY.estimate("technical_specialist") == (800.0, 40)
+
+
+def test_sequential_turn_skips_experts_that_had_not_started(
+        monkeypatch) -> None:
+    model = _use_model(
+        monkeypatch, {
+            "compliance_auditor": 10,
+            "technical_specialist": 10,
+            "support_concierge": 10,
+        })
+    monkeypatch.setenv("CACHE_LM_EXPERT_EXECUTION", "sequential")
+    monkeypatch.setenv("CACHE_LM_TURN_BUDGET_MS", "100")
+    graph = create_graph().compile()
+
+    orderer = SectionOrderer()
+    streamed: list[str] = []
+    result: dict = {}
+    for mode, chunk in graph.stream(
+        {"messages": [HumanMessage(content=_QUERY)]},
+            stream_mode=["custom", "values"]):
+        if mode == "custom":
+            streamed.extend(orderer.feed(chunk))
+        else:
+            result = chunk
+
+    # Only the first expert ever reached the backend.
+    assert len(model.calls) == 1
+    deadline = result["deadline"]
+    assert len(deadline["cut_off"]) == 3 and len(deadline["skipped"]) == 2
+    assert model.calls[0] not in deadline["skipped"]
+    # No completed call to compare with yet: nothing is claimed as saved.
+    assert deadline["ms_saved"] == 0.0 and deadline["tokens_saved"] == 0.0
+    # The one started call keeps what it streamed before the budget ran out.
+    assert list(result["expert_outputs"]) == model.calls
+    assert result["response"].startswith("t0 ")
+    assert "[Partial response: the 100 ms" in result["response"]
+    # Same words as streamed (sections are stripped in the response).
+    assert "".join(streamed).split() == result["response"].split()
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_stalled_prefill_is_cut_off_at_the_budget(monkeypatch,
+                                                  use_async) -> None:
+    model = _use_model(monkeypatch, {"compliance_auditor": 3})
+    model.stall_s = 1.0
+    graph = create_graph().compile()
+    inputs = {"messages": [HumanMessage(content="Can I approve in chat?")]}
+    config = {"configurable": {"turn_budget_ms": 100}}
+    started = time.perf_counter()
+    if use_async:
+        result = asyncio.run(graph.ainvoke(inputs, config=config))
+    else:
+        result = graph.invoke(inputs, config=config)
+    elapsed_ms = (time.perf_counter() - started) * 1000.0
+
+    # Returned at the budget, not after the backend's first chunk.
+    assert elapsed_ms < 600
+    assert result["deadline"]["cut_off"] == ["compliance_auditor"]
+    cut = result["cutoff_by_expert"]["compliance_auditor"]
+    assert cut["started"] and cut["streamed_tokens"] == 0
+
+
+def test_turns_without_a_budget_are_not_partial(monkeypatch) -> None:
+    _use_model(
+        monkeypatch, {
+            "compliance_auditor": 1,
+            "technical_specialist": 1,
+            "support_concierge": 1,
+        })
+    result = create_graph().compile().invoke(
+        {"messages": [HumanMessage(content=_QUERY)]})
+    assert not result["partial_response"] and result["deadline"] is None
+    assert len(result["expert_outputs"]) == 3
+    assert COMPLETION_HISTORY.estimate("support_concierge")[1] == 1
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_scheduler_wait_is_capped_by_the_budget(monkeypatch,
+                                                use_async) -> None:
+    model = _use_model(monkeypatch, {"compliance_auditor": 3})
+    # Another call is priming this prefix and never gets its first token.
+    scheduler = PrefixScheduler(max_delay_ms=5000, warm_prefixes=4)
+    primer = scheduler.acquire(
+        (prompt_artifacts().system_prefix_hash, "compliance_auditor"))
+    monkeypatch.setattr("cache_lm.experts.get_scheduler", lambda: scheduler)
+    graph = create_graph().compile()
+    inputs = {"messages": [HumanMessage(content="Can I approve in chat?")]}
+    config = {"configurable": {"turn_budget_ms": 100}}
+    started = time.perf_counter()
+    if use_async:
+        result = asyncio.run(graph.ainvoke(inputs, config=config))
+    else:
+        result = graph.invoke(inputs, config=config)
+    elapsed_ms = (time.perf_counter() - started) * 1000.0
+    primer.close()
+
+    assert elapsed_ms < 1000
+    assert model.calls == []
+    assert result["deadline"]["skipped"] == ["compliance_auditor"]
+    # Released by the budget, not by the scheduler's own cap.
+    assert scheduler.stats()["timeouts"] == 0
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+
+from langchain_core.messages import AIMessage
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+import pytest
+
+from cache_lm.checkpoint_sqlite import close_shared_checkpointers
+from cache_lm.checkpoint_sqlite import CompressingSerializer
+from cache_lm.checkpoint_sqlite import prune_checkpoints
+from cache_lm.checkpoint_sqlite import shared_sqlite_checkpointer
+from cache_lm.checkpointing import async_sqlite_checkpointer
+from cache_lm.checkpointing import sqlite_checkpointer
+from cache_lm.graph import create_graph
+
+_QUERIES = [
+    "What is the API limit?",
+    "Can I do this under policy?",
+    "Summarize that in steps.",
+    "What about retries?",
+]
+
+
+@pytest.fixture
+def checkpoint_mode(monkeypatch):
+
+    def set_mode(mode: str) -> None:
+        close_shared_checkpointers()
+        monkeypatch.setenv("CACHE_LM_CHECKPOINT_MODE", mode)
+
+    yield set_mode
+    close_shared_checkpointers()
+
+
+def _turn(db_path: str, thread_id: str, text: str, **configurable) -> dict:
+    with sqlite_checkpointer(db_path) as checkpointer:
+        graph = create_graph().compile(checkpointer=checkpointer)
+        return graph.invoke(
+            {"messages": [HumanMessage(content=text)]},
+            config={"configurable": {
+                "thread_id": thread_id,
+                **configurable
+            }},
+        )
+
+
+def _blob_bytes(db_path: str) -> int:
+    conn = sqlite3.connect(db_path)
+    try:
+        total = conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(checkpoint) + LENGTH(metadata)), 0) "
+            "FROM checkpoints").fetchone()[0]
+        has_deltas = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'message_deltas'"
+        ).fetchone()
+        if has_deltas:
+            total += conn.execute("SELECT COALESCE(SUM(LENGTH(messages)), 0) "
+                                  "FROM message_deltas").fetchone()[0]
+        return total
+    finally:
+        conn.close()
+
+
+def _contents(result: dict) -> list[str]:
+    return [m.content for m in result["messages"]]
+
+
+def test_delta_mode_round_trips_with_fewer_bytes(checkpoint_mode,
+                                                 tmp_path) -> None:
+    results = {}
+    for mode in ("tuned", "delta"):
+        checkpoint_mode(mode)
+        db_path = str(tmp_path / f"{mode}.sqlite")
+        for query in _QUERIES:
+            results[mode] = _turn(db_path, "t1", query)
+        close_shared_checkpointers()
+    assert _contents(results["delta"]) == _contents(results["tuned"])
+    assert len(results["delta"]["messages"]) == 2 * len(_QUERIES)
+    assert _blob_bytes(str(tmp_path / "delta.sqlite")) < _blob_bytes(
+        str(tmp_path / "tuned.sqlite"))
+
+    # A fresh saver (no caches) restores the thread from the chain.
+    checkpoint_mode("delta")
+    saver = shared_sqlite_checkpointer(str(tmp_path / "delta.sqlite"),
+                                       delta=True)
+    state = saver.get_tuple({"configurable": {"thread_id": "t1"}})
+    assert [m.content for m in state.checkpoint["channel_values"]["messages"]
+            ] == _contents(results["tuned"])
+    history = list(saver.list({"configurable": {"thread_id": "t1"}}))
+    assert all(
+        isinstance(t.checkpoint["channel_values"].get("messages", []), list)
+        for t in history)
+
+
+def test_fork_from_an_earlier_checkpoint_keeps_both_branches(
+        checkpoint_mode, tmp_path) -> None:
+    checkpoint_mode("delta")
+    db_path = str(tmp_path / "delta.sqlite")
+    first = _turn(db_path, "t1", _QUERIES[0])
+    saver = shared_sqlite_checkpointer(db_path, delta=True)
+    fork_from = saver.get_tuple({"configurable": {"thread_id": "t1"}})
+    main = _turn(db_path, "t1", _QUERIES[1])
+    fork = _turn(
+        db_path,
+        "t1",
+        _QUERIES[2],
+        checkpoint_id=fork_from.config["configurable"]["checkpoint_id"])
+
+    assert _contents(main)[:2] == _contents(first)
+    assert _contents(fork)[:2] == _contents(first)
+    assert _contents(fork)[2] == _QUERIES[2]
+    assert _contents(main)[2] == _QUERIES[1]
+
+    close_shared_checkpointers()
+    saver = shared_sqlite_checkpointer(db_path, delta=True)
+    contents = {
+        tuple(m.content
+              for m in t.checkpoint["channel_values"].get("messages", []))
+        for t in saver.list({"configurable": {
+            "thread_id": "t1"
+        }})
+    }
+    assert tuple(_contents(main)) in contents
+    assert tuple(_contents(fork)) in contents
+
+
+def test_compressing_serializer_round_trips() -> None:
+    serde = CompressingSerializer(JsonPlusSerializer(), min_bytes=512)
+    small = [HumanMessage(content="hi")]
+    large = [AIMessage(content="policy " * 200)]
+    small_type, _ = serde.dumps_typed(small)
+    large_type, large_data = serde.dumps_typed(large)
+    assert not small_type.endswith("+zlib")
+    assert large_type.endswith("+zlib") and len(large_data) < 1400
+    assert serde.loads_typed(serde.dumps_typed(small)) == small
+    assert serde.loads_typed((large_type, large_data)) == large
+
+
+def test_prune_drops_the_deltas_of_abandoned_branches(checkpoint_mode,
+                                                      tmp_path) -> None:
+    checkpoint_mode("delta")
+    db_path = str(tmp_path / "delta.sqlite")
+    _turn(db_path, "t1", _QUERIES[0])
+    saver = shared_sqlite_checkpointer(db_path, delta=True)
+    fork_from = saver.get_tuple({"configurable": {"thread_id": "t1"}})
+    _turn(db_path, "t1", _QUERIES[1])
+    expected = _turn(
+        db_path,
+        "t1",
+        _QUERIES[2],
+        checkpoint_id=fork_from.config["configurable"]["checkpoint_id"])
+    close_shared_checkpointers()
+
+    # The newest checkpoint is on the fork; the first branch's second turn
+    # is reachable from no remaining checkpoint.
+    report = prune_checkpoints(db_path, keep_last=1)
+    assert report.checkpoints_deleted > 0
+    assert report.deltas_deleted > 0
+
+    saver = shared_sqlite_checkpointer(db_path, delta=True)
+    state = saver.get_tuple({"configurable": {"thread_id": "t1"}})
+    assert [m.content for m in state.checkpoint["channel_values"]["messages"]
+            ] == _contents(expected)
+
+    saver.delete_thread("t1")
+    assert saver.get_tuple({"configurable": {"thread_id": "t1"}}) is None
+    assert saver.conn.execute(
+        "SELECT COUNT(*) FROM message_deltas").fetchone()[0] == 0
+
+
+def test_async_runs_share_the_delta_saver(checkpoint_mode, tmp_path) -> None:
+    checkpoint_mode("delta")
+    db_path = str(tmp_path / "delta.sqlite")
+
+    async def turn(text: str) -> dict:
+        async with async_sqlite_checkpointer(db_path) as checkpointer:
+            graph = create_graph().compile(checkpointer=checkpointer)
+            return await graph.ainvoke(
+                {"messages": [HumanMessage(content=text)]},
+                config={"configurable": {
+                    "thread_id": "t1"
+                }},
+            )
+
+    asyncio.run(turn(_QUERIES[0]))
+    result = asyncio.run(turn(_QUERIES[1]))
+    assert _contents(result)[::2] == _QUERIES[:2]
+    assert _turn(db_path, "t1",
+                 _QUERIES[2])["messages"][4].content == (_QUERIES[2])
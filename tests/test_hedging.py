@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+
+from langchain_core.messages import HumanMessage
+import pytest
+
+from cache_lm.graph import create_graph
+from cache_lm.hedging import ahedged_stream
+from cache_lm.hedging import hedge_delay_ms
+from cache_lm.hedging import hedged_stream
+from cache_lm.hedging import HedgeInfo
+from cache_lm.hedging import TTFT_HISTORY
+
+
+class _FakeChunk:
+
+    def __init__(self, content: str):
+        self.content = content
+
+
+class _SlowFirstChatModel:
+    # The first request stalls before its first token; later requests are fast.
+
+    def __init__(self, *, stall_s: float):
+        self.stall_s = stall_s
+        self.calls = 0
+        self.closed = threading.Event()
+
+    def stream(self, messages):
+        self.calls += 1
+        label = "primary" if self.calls == 1 else "hedge"
+        try:
+            if label == "primary":
+                time.sleep(self.stall_s)
+            yield _FakeChunk(label)
+            yield _FakeChunk(" done")
+        finally:
+            if label == "primary":
+                self.closed.set()
+
+
+@pytest.fixture(autouse=True)
+def _clear_ttft_history():
+    TTFT_HISTORY.clear()
+    yield
+    TTFT_HISTORY.clear()
+
+
+def test_hedge_fires_and_faster_stream_wins() -> None:
+    model = _SlowFirstChatModel(stall_s=0.3)
+    info = HedgeInfo(delay_ms=20)
+
+    chunks = list(hedged_stream(lambda: model.stream([]), info=info))
+
+    assert [c.content for c in chunks] == ["hedge", " done"]
+    assert info.fired
+    assert info.winner == "hedge"
+    # The losing stream is closed once it unblocks.
+    assert model.closed.wait(timeout=2)
+
+
+def test_fast_primary_does_not_hedge() -> None:
+    model = _SlowFirstChatModel(stall_s=0.0)
+    info = HedgeInfo(delay_ms=500)
+
+    chunks = list(hedged_stream(lambda: model.stream([]), info=info))
+
+    assert [c.content for c in chunks] == ["primary", " done"]
+    assert not info.fired
+    assert info.winner == "primary"
+    assert model.calls == 1
+
+
+def test_async_hedge_cancels_losing_stream() -> None:
+    cancelled: list[str] = []
+    calls: list[int] = []
+
+    async def astream():
+        calls.append(1)
+        label = "primary" if len(calls) == 1 else "hedge"
+        try:
+            if label == "primary":
+                await asyncio.sleep(5)
+            yield _FakeChunk(label)
+        except asyncio.CancelledError:
+            cancelled.append(label)
+            raise
+
+    async def run() -> list[str]:
+        info = HedgeInfo(delay_ms=20)
+        chunks = [c.content async for c in ahedged_stream(astream, info=info)]
+        await asyncio.sleep(0)
+        assert info.fired and info.winner == "hedge"
+        return chunks
+
+    assert asyncio.run(run()) == ["hedge"]
+    assert cancelled == ["primary"]
+
+
+def test_auto_delay_uses_learned_p95(monkeypatch) -> None:
+    monkeypatch.setenv("CACHE_LM_HEDGE_DELAY_MS", "auto")
+    assert hedge_delay_ms("compliance_auditor") == 2000.0
+
+    for ms in range(1, 101):
+        TTFT_HISTORY.record("compliance_auditor", float(ms))
+    assert hedge_delay_ms("compliance_auditor") == 95.0
+
+    monkeypatch.setenv("CACHE_LM_HEDGE_DELAY_MS", "250")
+    assert hedge_delay_ms("compliance_auditor") == 250.0
+
+
+def test_graph_records_hedge_outcome_in_state(monkeypatch) -> None:
+    model = _SlowFirstChatModel(stall_s=0.3)
+    monkeypatch.setenv("CACHE_LM_MODE", "llm")
+    monkeypatch.setenv("CACHE_LM_HEDGE", "1")
+    monkeypatch.setenv("CACHE_LM_HEDGE_DELAY_MS", "20")
+    monkeypatch.setattr("cache_lm.experts.create_chat_model",
+                        lambda streaming: model)
+
+    result = create_graph().compile().invoke(
+        {"messages": [HumanMessage(content="What is the API limit?")]})
+
+    assert result["expert_outputs"] == {"technical_specialist": "hedge done"}
+    hedge = result["hedge_by_expert"]["technical_specialist"]
+    assert hedge == {"fired": True, "winner": "hedge", "delay_ms": 20.0}
+
+
+def test_learned_ttft_excludes_leader_gate_waits(monkeypatch) -> None:
+    recorded: dict[str, float] = {}
+    monkeypatch.setattr(TTFT_HISTORY, "record",
+                        lambda expert, ms: recorded.__setitem__(expert, ms))
+
+    class _ColdPrefixModel:
+        # The first call prefills for 0.2 s; followers answer immediately.
+        def __init__(self) -> None:
+            self.calls = 0
+
+        def stream(self, messages):
+            self.calls += 1
+            if self.calls == 1:
+                time.sleep(0.2)
+            yield _FakeChunk("answer")
+
+    model = _ColdPrefixModel()
+    monkeypatch.setenv("CACHE_LM_MODE", "llm")
+    monkeypatch.setenv("CACHE_LM_EXPERT_EXECUTION", "leader")
+    monkeypatch.setattr("cache_lm.experts.create_chat_model",
+                        lambda streaming: model)
+
+    result = create_graph().compile().invoke({
+        "messages": [
+            HumanMessage(content=("Can I do this under policy, what are the "
+                                  "API limits, and summarize in steps?"))
+        ]
+    })
+
+    ttft = result["ttft_ms_by_expert"]
+    leader = result["leader_expert"]
+    followers = [e for e in ttft if e != leader]
+    assert len(followers) == 2
+    assert recorded[leader] > 150
+    for expert in followers:
+        # Their TTFT includes waiting for the leader; the learned one does
+        # not.
+        assert ttft[expert] > 150
+        assert recorded[expert] < 100
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+from langchain_core.messages import HumanMessage
+import pytest
+
+from cache_lm.checkpointing import inmemory_checkpointer
+from cache_lm.graph import create_graph
+from cache_lm.history import message_tokens
+from cache_lm.history import window_history
+
+_BUDGET = 400
+# The rules router sends this to the technical specialist only.
+_QUERY = "What is the API rate limit for turn {turn}?"
+
+
+class _FakeChunk:
+
+    def __init__(self, content: str):
+        self.content = content
+
+
+class _RecordingModel:
+
+    def __init__(self) -> None:
+        self.calls: list[list] = []
+
+    def stream(self, messages):
+        self.calls.append(list(messages))
+        yield _FakeChunk("The limit is 100 requests per minute per client; "
+                         "see the API limits section for burst rules.")
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    model = _RecordingModel()
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("CACHE_LM_MODE", "llm")
+    monkeypatch.setattr("cache_lm.experts.create_chat_model",
+                        lambda streaming: model)
+    return model
+
+
+def _thread(turns: int) -> list[dict]:
+    history = []
+    for turn in range(turns):
+        history.append({"role": "user", "content": _QUERY.format(turn=turn)})
+        history.append({
+            "role": "assistant",
+            "content": f"answer {turn} " * 12
+        })
+    return history
+
+
+def test_window_keeps_its_start_and_drops_in_large_steps() -> None:
+    previous = None
+    jumps = 0
+    for turns in range(1, 60):
+        window, dropped = window_history(_thread(turns), _BUDGET)
+        assert sum(message_tokens(m) for m in window) <= _BUDGET
+        assert window[0]["role"] == "user"
+        if previous is not None:
+            if window[:len(previous)] != previous:
+                jumps += 1
+                # A jump frees about half the budget, not one message.
+                assert dropped - previous_dropped >= 4
+            else:
+                assert dropped == previous_dropped
+        previous, previous_dropped = window, dropped
+    assert 0 < jumps <= 20
+    assert window_history(_thread(3), None) == (_thread(3), 0)
+
+
+def test_experts_get_a_budgeted_history_and_report_cached_tokens(
+        fake_model, monkeypatch) -> None:
+    monkeypatch.setenv("CACHE_LM_HISTORY_TOKEN_BUDGET", str(_BUDGET))
+    graph = create_graph().compile(checkpointer=inmemory_checkpointer())
+    config = {"configurable": {"thread_id": "t1"}}
+    reports = []
+    for turn in range(12):
+        result = graph.invoke(
+            {"messages": [HumanMessage(content=_QUERY.format(turn=turn))]},
+            config=config)
+        reports.append(result["prompt_by_expert"]["technical_specialist"])
+
+    # System #1, System #2, the window, the query.
+    sent = fake_model.calls[-1]
+    assert sent[-1].content == _QUERY.format(turn=11)
+    history = [{"role": "user", "content": m.content} for m in sent[2:-1]]
+    assert sum(message_tokens(m) for m in history) <= _BUDGET
+    assert len(result["messages"]) == 24 and len(sent) - 3 < 22
+
+    assert reports[0]["cached_tokens"] == 0
+    assert reports[-1]["history_dropped"] > 0
+    steady = [
+        r for previous, r in zip(reports, reports[1:])
+        if r["history_dropped"] == previous["history_dropped"]
+    ]
+    assert steady
+    # Without a jump, everything but the new answer and query is cached.
+    for report in steady:
+        assert 0 < report["prompt_tokens"] - report["cached_tokens"] < 100
+    # The manual alone is thousands of tokens, always cached after turn 1.
+    assert min(r["cached_tokens"] for r in reports[1:]) > 1000
+
+
+def test_per_expert_budget_overrides_the_shared_one(fake_model,
+                                                    monkeypatch) -> None:
+    monkeypatch.setenv("CACHE_LM_HISTORY_TOKEN_BUDGET", "50")
+    monkeypatch.setenv("CACHE_LM_HISTORY_TOKEN_BUDGET_TECHNICAL_SPECIALIST",
+                       "0")
+    graph = create_graph().compile(checkpointer=inmemory_checkpointer())
+    config = {"configurable": {"thread_id": "t1"}}
+    for turn in range(4):
+        result = graph.invoke(
+            {"messages": [HumanMessage(content=_QUERY.format(turn=turn))]},
+            config=config)
+    report = result["prompt_by_expert"]["technical_specialist"]
+    assert report["history_budget"] is None
+    assert report["history_messages"] == 6 and report["history_dropped"] == 0
+    assert len(fake_model.calls[-1]) == 2 + 6 + 1
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+
+from langchain_core.messages import HumanMessage
+import pytest
+
+from cache_lm.graph import create_graph
+
+# The rules router sends this to all three experts.
+_QUERY = ("Can I do this under policy, what are the API limits, and "
+          "summarize in steps?")
+_COLD_PREFILL_S = 0.08
+_DECODE_S = 0.05
+
+
+class _FakeChunk:
+
+    def __init__(self, content: str):
+        self.content = content
+
+
+class _SharedPrefixModel:
+    # Prefill of System #1 is slow until one call has finished prefilling
+    # it; calls that start while it is cold all pay for it.
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.warm = False
+        self.cold_calls: list[str] = []
+
+    def _start(self, messages) -> bool:
+        with self._lock:
+            if not self.warm:
+                self.cold_calls.append(messages[1].content)
+            return not self.warm
+
+    def _warmed(self) -> None:
+        with self._lock:
+            self.warm = True
+
+    def stream(self, messages):
+        if self._start(messages):
+            time.sleep(_COLD_PREFILL_S)
+            self._warmed()
+        yield _FakeChunk("answer")
+        time.sleep(_DECODE_S)
+
+    async def astream(self, messages):
+        if self._start(messages):
+            await asyncio.sleep(_COLD_PREFILL_S)
+            self._warmed()
+        yield _FakeChunk("answer")
+        await asyncio.sleep(_DECODE_S)
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    model = _SharedPrefixModel()
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("CACHE_LM_MODE", "llm")
+    monkeypatch.setattr("cache_lm.experts.create_chat_model",
+                        lambda streaming: model)
+    return model
+
+
+def _run(monkeypatch, execution: str, *, use_async: bool = False) -> dict:
+    monkeypatch.setenv("CACHE_LM_EXPERT_EXECUTION", execution)
+    graph = create_graph().compile()
+    inputs = {"messages": [HumanMessage(content=_QUERY)]}
+    if use_async:
+        return asyncio.run(graph.ainvoke(inputs))
+    return graph.invoke(inputs)
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_followers_start_on_the_leaders_first_token(fake_model, monkeypatch,
+                                                    use_async) -> None:
+    result = _run(monkeypatch, "leader", use_async=use_async)
+
+    assert len(result["expert_outputs"]) == 3
+    # Only the leader prefilled the manual; followers found it cached.
+    assert len(fake_model.cold_calls) == 1
+    assert fake_model.cold_calls[0].startswith("You are the Compliance")
+    assert result["leader_expert"] == "compliance_auditor"
+    ttft = result["ttft_ms_by_expert"]
+    assert set(ttft) == {
+        "compliance_auditor",
+        "technical_specialist",
+        "support_concierge",
+    }
+    # Follower TTFT includes waiting for the leader.
+    assert ttft["technical_specialist"] > _COLD_PREFILL_S * 1000.0 / 2
+    # Followers decode alongside the leader: less than two calls' worth.
+    assert result["turn_latency_ms"] < (2 * _COLD_PREFILL_S +
+                                        2 * _DECODE_S) * 1000.0
+
+
+def test_parallel_mode_prefills_in_every_expert(fake_model,
+                                                monkeypatch) -> None:
+    result = _run(monkeypatch, "parallel")
+    assert len(fake_model.cold_calls) == 3
+    assert result["leader_expert"] is None
+    assert result["turn_latency_ms"] is not None
+
+
+def test_leader_mode_beats_sequential_wall_time(fake_model,
+                                                monkeypatch) -> None:
+    sequential = _run(monkeypatch, "sequential")
+    assert len(fake_model.cold_calls) == 1
+    fake_model.warm = False
+    fake_model.cold_calls.clear()
+    leader = _run(monkeypatch, "leader")
+    assert len(fake_model.cold_calls) == 1
+    assert leader["turn_latency_ms"] < sequential["turn_latency_ms"]
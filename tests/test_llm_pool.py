@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import asyncio
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import threading
+
+import pytest
+
+from cache_lm.llm import areset_chat_model_pool
+from cache_lm.llm import chat_model_pool_stats
+from cache_lm.llm import create_chat_model
+from cache_lm.llm import get_chat_model_pool
+from cache_lm.llm import reset_chat_model_pool
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def llm_env(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("OPENAI_BASE_URL", "http://127.0.0.1:9/v1")
+    monkeypatch.setenv("OPENAI_MODEL", "test-model")
+    monkeypatch.setenv("CACHE_LM_LLM_MAX_CONNECTIONS", "4")
+    reset_chat_model_pool()
+    yield
+    reset_chat_model_pool()
+
+
+def test_create_chat_model_reuses_pooled_clients(llm_env) -> None:
+    first = create_chat_model(streaming=True)
+    second = create_chat_model(streaming=True)
+    router = create_chat_model(streaming=False)
+
+    assert first is second
+    assert router is not first
+    assert router.http_client is first.http_client
+
+    stats = chat_model_pool_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+    assert stats["max_connections"] == 4
+
+
+def test_pool_keys_models_by_config(llm_env, monkeypatch) -> None:
+    first = create_chat_model(streaming=True)
+    assert create_chat_model(streaming=True, max_tokens=1) is not first
+
+    monkeypatch.setenv("OPENAI_MODEL", "other-model")
+    assert create_chat_model(streaming=True) is not first
+
+
+def test_pool_reports_connection_reuse(llm_env) -> None:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        client = create_chat_model(streaming=True).http_client
+        url = f"http://127.0.0.1:{server.server_address[1]}/"
+        for _ in range(3):
+            assert client.get(url).text == "ok"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    stats = chat_model_pool_stats()
+    assert stats["requests"] == 3
+    assert stats["connections_opened"] == 1
+    assert stats["connection_reuse_ratio"] == pytest.approx(2 / 3)
+
+
+def test_close_also_closes_the_async_clients(llm_env) -> None:
+    model = create_chat_model(streaming=True)
+    sync_client, async_client = model.http_client, model.http_async_client
+    reset_chat_model_pool()
+    assert sync_client.is_closed and async_client.is_closed
+
+    async def close_on_the_loop():
+        model = create_chat_model(streaming=True)
+        # `close()` from async code schedules the close on the running loop.
+        get_chat_model_pool().close()
+        await asyncio.sleep(0)
+        scheduled = model.http_async_client.is_closed
+        second = create_chat_model(streaming=True)
+        await areset_chat_model_pool()
+        return scheduled, second.http_async_client.is_closed
+
+    assert asyncio.run(close_on_the_loop()) == (True, True)
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+from dataclasses import fields
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+import pytest
+
+from cache_lm.graph import create_graph
+from cache_lm.manual import get_manual
+from cache_lm.manual import Manual
+from cache_lm.manual_registry import DEFAULT_MANUAL_ID
+from cache_lm.manual_registry import get_manual_registry
+from cache_lm.manual_registry import ManualRegistry
+from cache_lm.manual_registry import reset_manual_registry
+from cache_lm.prompts import system_prefix_hash
+from cache_lm.prompts import system_prefix_text
+from cache_lm.response_cache import reset_response_cache
+
+
+class _FakeChunk:
+
+    def __init__(self, content: str):
+        self.content = content
+
+
+class _RecordingChatModel:
+
+    def __init__(self):
+        self.prefixes: list[str] = []
+
+    def stream(self, messages):
+        self.prefixes.append(messages[0].content)
+        yield _FakeChunk("ok")
+
+
+@pytest.fixture
+def manual_dir(tmp_path, monkeypatch):
+    (tmp_path / "retail.md").write_text("# Retail manual\nCards only.\n",
+                                        encoding="utf-8")
+    (tmp_path / "treasury.md").write_text("# Treasury manual\nWires only.\n",
+                                          encoding="utf-8")
+    monkeypatch.setenv("CACHE_LM_MANUAL_DIR", str(tmp_path))
+    reset_manual_registry()
+    yield tmp_path
+    reset_manual_registry()
+
+
+def test_manual_keeps_its_text_once() -> None:
+    manual = get_manual()
+    assert [f.name for f in fields(Manual)
+            ] == ["path", "text", "sha256", "size_bytes"]
+    # The decoded text is stored, not rebuilt on every access.
+    assert manual.text is manual.text
+    assert manual.size_bytes == manual.path.stat().st_size
+
+
+def test_threads_select_their_manual_through_config(manual_dir,
+                                                    monkeypatch) -> None:
+    model = _RecordingChatModel()
+    monkeypatch.setenv("CACHE_LM_MODE", "llm")
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr("cache_lm.experts.create_chat_model",
+                        lambda streaming: model)
+    graph = create_graph().compile(checkpointer=InMemorySaver())
+    inputs = {"messages": [HumanMessage(content="Can I approve in chat?")]}
+
+    threads = [("t1", "retail"), ("t2", "treasury"), ("t3", None)]
+    results = {}
+    for thread_id, manual_id in threads:
+        configurable = {"thread_id": thread_id}
+        if manual_id:
+            configurable["manual_id"] = manual_id
+        results[thread_id] = graph.invoke(
+            inputs, config={"configurable": configurable})
+
+    retail = (manual_dir / "retail.md").read_text(encoding="utf-8")
+    treasury = (manual_dir / "treasury.md").read_text(encoding="utf-8")
+    assert model.prefixes == [
+        system_prefix_text(manual_text=retail),
+        system_prefix_text(manual_text=treasury),
+        system_prefix_text(manual_text=get_manual().text),
+    ]
+    assert results["t1"]["manual_id"] == "retail"
+    assert results["t1"]["system_prefix_hash"] == system_prefix_hash(
+        manual_text=retail)
+    assert results["t3"]["manual_id"] == DEFAULT_MANUAL_ID
+    assert len({r["system_prefix_hash"] for r in results.values()}) == 3
+
+    stats = get_manual_registry().stats()["manuals"]
+    assert stats["retail"]["turns"] == 1
+    assert stats["treasury"]["system_prefix_hash"] == system_prefix_hash(
+        manual_text=treasury)
+
+
+def test_alternating_manuals_keep_their_cached_responses(
+        manual_dir, monkeypatch) -> None:
+    model = _RecordingChatModel()
+    monkeypatch.setenv("CACHE_LM_MODE", "llm")
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("CACHE_LM_RESPONSE_CACHE", "memory")
+    monkeypatch.setattr("cache_lm.experts.create_chat_model",
+                        lambda streaming: model)
+    reset_response_cache()
+    graph = create_graph().compile()
+    inputs = {"messages": [HumanMessage(content="Can I approve in chat?")]}
+
+    try:
+        hits = [
+            graph.invoke(inputs,
+                         config={"configurable": {
+                             "manual_id": manual_id
+                         }})["cache_hit_by_expert"]["compliance_auditor"]
+            for manual_id in ["retail", "treasury"] * 3
+        ]
+    finally:
+        reset_response_cache()
+
+    assert len(model.prefixes) == 2
+    assert hits == [False, False, True, True, True, True]
+
+
+def test_registry_evicts_least_recently_used_over_budget(tmp_path) -> None:
+    for name in ("a", "b", "c"):
+        (tmp_path / f"{name}.md").write_text(name * 1000, encoding="utf-8")
+    one_entry = ManualRegistry(manual_dir=tmp_path,
+                               max_bytes=10**6).get("a").size_bytes
+    registry = ManualRegistry(manual_dir=tmp_path, max_bytes=2 * one_entry)
+
+    first_a = registry.get("a")
+    registry.get("b")
+    assert registry.get("a") is first_a
+    registry.get("c")
+
+    stats = registry.stats()
+    assert stats["resident"] == 2
+    assert stats["resident_bytes"] <= stats["max_bytes"]
+    assert stats["manuals"]["b"]["evictions"] == 1
+    assert not stats["manuals"]["b"]["resident"]
+    assert registry.get("a") is first_a
+    registry.get("b")
+    assert registry.stats()["manuals"]["b"]["loads"] == 2
+
+
+def test_unknown_or_escaping_manual_id_is_rejected(manual_dir) -> None:
+    (manual_dir.parent / "secret.md").write_text("nope", encoding="utf-8")
+    registry = get_manual_registry()
+    with pytest.raises(ValueError):
+        registry.get("missing")
+    with pytest.raises(ValueError):
+        registry.get("../secret")
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import os
+
+from langchain_core.messages import HumanMessage
+import pytest
+
+from cache_lm.graph import create_graph
+from cache_lm.manual import get_manual
+from cache_lm.manual import get_manual_by_sha256
+from cache_lm.manual import set_current_manual
+from cache_lm.manual_reload import manual_reload_stats
+from cache_lm.manual_reload import ManualWatcher
+from cache_lm.manual_reload import reset_manual_reload_stats
+from cache_lm.prompts import system_prefix_text
+
+# Routes to all three experts (sequential: one after another).
+_ALL_EXPERTS = ("Can I approve in chat, what is the API rate limit, "
+                "and summarize the steps?")
+
+
+class _FakeChunk:
+
+    def __init__(self, content: str):
+        self.content = content
+
+
+class _RecordingChatModel:
+
+    def __init__(self, on_call=None):
+        self.prefixes: list[str] = []
+        self._on_call = on_call
+
+    def stream(self, messages):
+        self.prefixes.append(messages[0].content)
+        if self._on_call is not None:
+            self._on_call()
+        yield _FakeChunk("ok")
+
+
+@pytest.fixture
+def manual_file(tmp_path, monkeypatch):
+    original = get_manual()
+    path = tmp_path / "manual.md"
+    path.write_text("# Manual v1\nApprovals go through tickets.\n",
+                    encoding="utf-8")
+    monkeypatch.setattr("cache_lm.manual.default_manual_path", lambda: path)
+    reset_manual_reload_stats()
+    yield path
+    set_current_manual(original)
+    reset_manual_reload_stats()
+
+
+def _rewrite(path, text: str) -> None:
+    path.write_text(text, encoding="utf-8")
+    # Make sure the mtime moves even on coarse-grained filesystems.
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_watcher_swaps_manual_and_keeps_previous_version(manual_file) -> None:
+    watcher = ManualWatcher(manual_file, warm=False)
+    old = get_manual()
+    assert watcher.check() is None
+
+    _rewrite(manual_file, "# Manual v2\nApprovals need two reviewers.\n")
+    reload = watcher.check()
+
+    assert reload is not None
+    assert reload.previous_sha256 == old.sha256
+    assert get_manual().sha256 == reload.sha256 != old.sha256
+    assert "two reviewers" in get_manual().text
+    assert get_manual_by_sha256(old.sha256) is old
+    assert watcher.check() is None
+    assert manual_reload_stats()["reloads"] == 1
+    assert manual_reload_stats()["reload_latency_ms"][0] >= 0.0
+
+
+def test_invalid_manual_is_rejected_and_current_kept(manual_file) -> None:
+    watcher = ManualWatcher(manual_file, warm=False)
+    old = get_manual()
+
+    manual_file.write_bytes(b"\xff\xfe not utf-8")
+    assert watcher.check() is None
+    _rewrite(manual_file, "   \n")
+    assert watcher.check() is None
+
+    assert get_manual() is old
+    stats = manual_reload_stats()
+    assert stats["reloads"] == 0
+    assert stats["failures"] == 2
+
+
+def test_new_prefix_is_warmed_before_switching(manual_file,
+                                               monkeypatch) -> None:
+    watcher = ManualWatcher(manual_file, warm=True)
+    old = get_manual()
+    served_while_warming: list[str] = []
+
+    def warm(*, manual):
+        served_while_warming.append(get_manual().sha256)
+
+    monkeypatch.setattr("cache_lm.manual_reload.warm_prefix", warm)
+    _rewrite(manual_file, "# Manual v2\n")
+    reload = watcher.check()
+
+    assert reload is not None and reload.warmed
+    assert served_while_warming == [old.sha256]
+    assert get_manual().sha256 == reload.sha256
+
+
+def test_in_flight_turn_finishes_on_its_manual(manual_file,
+                                               monkeypatch) -> None:
+    watcher = ManualWatcher(manual_file, warm=False)
+    old = get_manual()
+    swapped = []
+
+    def reload_after_first_expert():
+        if not swapped:
+            _rewrite(manual_file, "# Manual v2\n")
+            swapped.append(watcher.check())
+
+    model = _RecordingChatModel(on_call=reload_after_first_expert)
+    monkeypatch.setenv("CACHE_LM_MODE", "llm")
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr("cache_lm.experts.create_chat_model",
+                        lambda streaming: model)
+    graph = create_graph().compile()
+    inputs = {"messages": [HumanMessage(content=_ALL_EXPERTS)]}
+
+    first = graph.invoke(inputs)
+    assert swapped[0] is not None
+    assert first["manual_sha256"] == old.sha256
+    assert len(model.prefixes) == 3
+    assert set(model.prefixes) == {system_prefix_text(manual_text=old.text)}
+
+    model.prefixes.clear()
+    second = graph.invoke(inputs)
+    new = get_manual()
+    assert second["manual_sha256"] == new.sha256
+    assert set(model.prefixes) == {system_prefix_text(manual_text=new.text)}
+    assert manual_reload_stats()["turns_by_manual"] == {
+        old.sha256: 1,
+        new.sha256: 1,
+    }
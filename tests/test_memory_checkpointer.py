@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import asyncio
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+
+from cache_lm.checkpoint_memory import BoundedInMemorySaver
+from cache_lm.checkpointing import inmemory_checkpointer
+from cache_lm.graph import create_graph
+
+
+def _turn(graph, thread_id: str, text: str = "What is the API limit?"):
+    return graph.invoke(
+        {"messages": [HumanMessage(content=text)]},
+        config={"configurable": {
+            "thread_id": thread_id
+        }},
+    )
+
+
+def _actual_bytes(saver: InMemorySaver) -> int:
+    total = sum(
+        len(c[0]) + len(c[1]) + len(m[0]) + len(m[1])
+        for namespaces in saver.storage.values()
+        for by_id in namespaces.values() for c, m, _ in by_id.values())
+    total += sum(
+        len(w[2][0]) + len(w[2][1]) for by_task in saver.writes.values()
+        for w in by_task.values())
+    total += sum(len(b[0]) + len(b[1]) for b in saver.blobs.values())
+    return total
+
+
+def test_lru_threads_spill_to_sqlite_and_reload(tmp_path) -> None:
+    saver = inmemory_checkpointer(max_threads=2,
+                                  spill_path=str(tmp_path / "spill.sqlite"))
+    assert isinstance(saver, BoundedInMemorySaver)
+    graph = create_graph().compile(checkpointer=saver)
+    for thread_id in ("t1", "t2", "t3"):
+        _turn(graph, thread_id)
+
+    stats = saver.memory_stats()
+    assert stats["resident_threads"] == 2
+    assert stats["evictions"] == 1 and stats["spilled_threads"] == 1
+    assert "t1" not in saver.storage
+    assert stats["resident_bytes"] == _actual_bytes(saver)
+
+    # t1 comes back from disk with its history; t2 is now the LRU thread.
+    result = _turn(graph, "t1", "Summarize that in steps.")
+    assert len(result["messages"]) == 4
+    stats = saver.memory_stats()
+    assert stats["reloads"] == 1 and stats["avg_reload_ms"] is not None
+    assert stats["evictions"] == 2 and "t2" not in saver.storage
+    assert stats["resident_bytes"] == _actual_bytes(saver)
+    saver.close()
+
+    # A new process finds the spilled threads.
+    reopened = inmemory_checkpointer(max_threads=2,
+                                     spill_path=str(tmp_path / "spill.sqlite"))
+    state = create_graph().compile(checkpointer=reopened).get_state(
+        {"configurable": {
+            "thread_id": "t2"
+        }})
+    assert len(state.values["messages"]) == 2
+
+
+def test_without_spill_evicted_threads_are_forgotten() -> None:
+    saver = inmemory_checkpointer(max_threads=1)
+    graph = create_graph().compile(checkpointer=saver)
+    _turn(graph, "t1")
+    _turn(graph, "t2")
+    result = _turn(graph, "t1", "Summarize that in steps.")
+    assert len(result["messages"]) == 2
+    stats = saver.memory_stats()
+    assert stats["dropped"] == 2 and stats["resident_threads"] == 1
+
+
+def test_byte_limit_keeps_memory_flat_under_sustained_traffic(
+        tmp_path) -> None:
+    saver = inmemory_checkpointer(max_bytes=60_000,
+                                  spill_path=str(tmp_path / "spill.sqlite"))
+    graph = create_graph().compile(checkpointer=saver)
+    peak = 0
+    for i in range(12):
+        _turn(graph, f"t{i}")
+        peak = max(peak, saver.memory_stats()["resident_bytes"])
+    stats = saver.memory_stats()
+    assert stats["evictions"] > 0
+    assert peak <= 60_000
+    assert stats["resident_bytes"] == _actual_bytes(saver)
+    assert stats["resident_threads"] + stats["spilled_threads"] == 12
+
+    async def reload_async():
+        return await graph.ainvoke(
+            {"messages": [HumanMessage(content="And retries?")]},
+            config={"configurable": {
+                "thread_id": "t0"
+            }})
+
+    assert len(asyncio.run(reload_async())["messages"]) == 4
+
+
+def test_limits_come_from_the_environment(monkeypatch) -> None:
+    assert type(inmemory_checkpointer()) is InMemorySaver
+    monkeypatch.setenv("CACHE_LM_CHECKPOINT_MEMORY_MAX_THREADS", "8")
+    saver = inmemory_checkpointer()
+    assert isinstance(saver, BoundedInMemorySaver)
+    assert saver.max_threads == 8 and saver.max_bytes == 0
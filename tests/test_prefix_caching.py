@@ -1,10 +1,16 @@
 from __future__ import annotations
 
 from cache_lm.hashing import sha256_text
+from cache_lm.history import prompt_usage
 from cache_lm.manual import get_manual
+from cache_lm.prompts import build_langchain_messages
 from cache_lm.prompts import build_messages
 from cache_lm.prompts import Expert
+from cache_lm.prompts import EXPERT_NAMES
+from cache_lm.prompts import expert_system_suffix_text
+from cache_lm.prompts import get_prompt_layout
 from cache_lm.prompts import MANUAL_BEGIN
+from cache_lm.prompts import prompt_artifacts
 from cache_lm.prompts import system_prefix_hash
 from cache_lm.prompts import system_prefix_text
 
@@ -61,3 +67,125 @@ def test_expert_suffix_is_after_manual_prefix():
         manual_text=manual.text)
     assert "Compliance Auditor" in messages[1]["content"]
     assert MANUAL_BEGIN not in messages[1]["content"]
+
+
+_HISTORY = [
+    {
+        "role": "user",
+        "content": "What are the logging rules?"
+    },
+    {
+        "role": "assistant",
+        "content": "Log every approval with its ticket id."
+    },
+]
+
+
+def _common_prefix_length(prompts: list[list]) -> int:
+    length = 0
+    for messages in zip(*prompts):
+        if any(m != messages[0] for m in messages[1:]):
+            break
+        length += 1
+    return length
+
+
+def test_shared_history_layout_puts_history_before_expert_instructions():
+    manual = get_manual()
+    messages = build_messages(
+        expert="compliance_auditor",
+        user_input="Summarize that in steps.",
+        history=_HISTORY,
+        manual_text=manual.text,
+        layout="shared_history",
+    )
+
+    assert messages[0]["content"] == system_prefix_text(
+        manual_text=manual.text)
+    assert messages[1:3] == _HISTORY
+    assert messages[3] == {
+        "role": "system",
+        "content": expert_system_suffix_text("compliance_auditor"),
+    }
+    assert messages[4] == {
+        "role": "user",
+        "content": "Summarize that in steps."
+    }
+
+
+def test_shared_history_layout_shares_manual_and_history_across_experts():
+    manual = get_manual()
+
+    def prompts(layout: str) -> list[list]:
+        return [
+            build_messages(
+                expert=expert,
+                user_input="Summarize that in steps.",
+                history=_HISTORY,
+                manual_text=manual.text,
+                layout=layout,
+            ) for expert in EXPERT_NAMES
+        ]
+
+    # Default layout: the experts diverge right after the manual.
+    assert _common_prefix_length(prompts("expert_first")) == 1
+    assert _common_prefix_length(
+        prompts("shared_history")) == 1 + len(_HISTORY)
+
+    # The memoized builder follows the same layout, and System #1 is still
+    # the one shared object.
+    artifacts = prompt_artifacts(manual)
+    for expert, expected in zip(EXPERT_NAMES, prompts("shared_history")):
+        actual = build_langchain_messages(
+            expert=expert,
+            user_input="Summarize that in steps.",
+            history=_HISTORY,
+            artifacts=artifacts,
+            layout="shared_history",
+        )
+        assert [m.content for m in actual] == [m["content"] for m in expected]
+        assert actual[0] is artifacts.system_prefix_message
+
+
+def test_prompt_layout_comes_from_the_environment(monkeypatch):
+    assert get_prompt_layout() == "expert_first"
+    monkeypatch.setenv("CACHE_LM_PROMPT_LAYOUT", "shared_history")
+    assert get_prompt_layout() == "shared_history"
+    messages = build_messages(expert="support_concierge",
+                              user_input="hello",
+                              history=_HISTORY)
+    assert messages[-2]["content"] == expert_system_suffix_text(
+        "support_concierge")
+
+
+def test_shared_history_keeps_history_cached_from_the_previous_turn():
+    prefix = {"role": "system", "content": system_prefix_text()}
+    suffix = {
+        "role": "system",
+        "content": expert_system_suffix_text("technical_specialist")
+    }
+    history = _HISTORY + [
+        {
+            "role": "user",
+            "content": "And the retention period?"
+        },
+        {
+            "role": "assistant",
+            "content": "Ninety days."
+        },
+    ]
+    usage = {
+        layout: prompt_usage(prefix=prefix,
+                             suffix=suffix,
+                             history=history,
+                             query="Summarize that in steps.",
+                             budget=None,
+                             layout=layout)
+        for layout in ("expert_first", "shared_history")
+    }
+    assert (usage["expert_first"]["prompt_tokens"] == usage["shared_history"]
+            ["prompt_tokens"])
+    # The previous query followed System #2 there; here System #2 follows
+    # the history, so that query is no longer part of the cached prefix.
+    assert 0 < usage["shared_history"]["cached_tokens"] < usage["expert_first"][
+        "cached_tokens"] < usage["expert_first"]["prompt_tokens"]
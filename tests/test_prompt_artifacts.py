@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from dataclasses import replace
+
+from cache_lm.hashing import sha256_text
+from cache_lm.manual import get_manual
+from cache_lm.prompts import build_langchain_messages
+from cache_lm.prompts import build_messages
+from cache_lm.prompts import clear_prompt_artifacts
+from cache_lm.prompts import EXPERT_NAMES
+from cache_lm.prompts import prompt_artifacts
+from cache_lm.prompts import system_prefix_hash
+from cache_lm.prompts import system_prefix_text
+from cache_lm.prompts import to_langchain_messages
+
+
+def test_prompt_artifacts_are_built_once_per_manual_sha256():
+    clear_prompt_artifacts()
+    manual = get_manual()
+
+    first = prompt_artifacts(manual)
+    second = prompt_artifacts(get_manual(use_cache=False))
+
+    assert first is second
+    assert first.manual_sha256 == manual.sha256
+    assert first.system_prefix == system_prefix_text(manual_text=manual.text)
+    assert first.system_prefix_hash == sha256_text(first.system_prefix)
+    assert system_prefix_hash() == first.system_prefix_hash
+
+
+def test_system_prefix_message_is_shared_across_experts():
+    artifacts = prompt_artifacts(get_manual())
+    prefixes = [artifacts.expert_system_messages[e][0] for e in EXPERT_NAMES]
+
+    assert prefixes[0] is prefixes[1] is prefixes[2]
+    assert prefixes[0].content == artifacts.system_prefix
+
+
+def test_build_langchain_messages_matches_uncached_layout():
+    manual = get_manual()
+    history = [
+        {
+            "role": "user",
+            "content": "What are the logging rules?"
+        },
+        {
+            "role": "assistant",
+            "content": "Log every approval."
+        },
+    ]
+    for expert in EXPERT_NAMES:
+        expected = to_langchain_messages(
+            build_messages(
+                expert=expert,
+                user_input="Summarize that in steps.",
+                history=history,
+                manual_text=manual.text,
+            ))
+        actual = build_langchain_messages(
+            expert=expert,
+            user_input="Summarize that in steps.",
+            history=history,
+            artifacts=prompt_artifacts(manual),
+        )
+        assert [(type(m), m.content) for m in actual] == [(type(m), m.content)
+                                                          for m in expected]
+
+
+def test_new_manual_sha256_gets_new_artifacts():
+    manual = get_manual()
+    edited = replace(manual,
+                     text=(manual.text + "\nAddendum."),
+                     sha256="0" * 64)
+
+    old = prompt_artifacts(manual)
+    new = prompt_artifacts(edited)
+
+    assert new is not old
+    assert new.system_prefix == system_prefix_text(manual_text=edited.text)
+    assert new.system_prefix_hash != old.system_prefix_hash
+    # The previous version stays cached for turns still running on it.
+    assert prompt_artifacts(manual) is old
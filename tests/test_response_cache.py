@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+from dataclasses import replace
+
+from langchain_core.messages import HumanMessage
+import pytest
+
+from cache_lm.cache_store import MemoryLru
+from cache_lm.cache_store import SqliteStore
+from cache_lm.cache_store import TieredCache
+from cache_lm.graph import create_graph
+from cache_lm.llm import LlmConfig
+from cache_lm.manual import get_manual
+from cache_lm.manual import set_current_manual
+from cache_lm.response_cache import replay_chunks
+from cache_lm.response_cache import reset_response_cache
+from cache_lm.response_cache import response_cache_key
+
+_LLM = LlmConfig(base_url="http://x/v1",
+                 api_key="k",
+                 model="m",
+                 temperature=0.0,
+                 max_tokens=256)
+
+
+class _FakeChunk:
+
+    def __init__(self, content: str):
+        self.content = content
+
+
+class _CountingChatModel:
+
+    def __init__(self):
+        self.calls = 0
+
+    def stream(self, messages):
+        self.calls += 1
+        yield _FakeChunk("Approvals must go ")
+        yield _FakeChunk("through a ticket.")
+
+
+@pytest.fixture
+def cached_llm(monkeypatch, tmp_path):
+    model = _CountingChatModel()
+    monkeypatch.setenv("CACHE_LM_MODE", "llm")
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("CACHE_LM_RESPONSE_CACHE", "sqlite")
+    monkeypatch.setenv("CACHE_LM_RESPONSE_CACHE_DB",
+                       str(tmp_path / "responses.sqlite"))
+    monkeypatch.setattr("cache_lm.experts.create_chat_model",
+                        lambda streaming: model)
+    reset_response_cache()
+    yield model
+    reset_response_cache()
+
+
+def _key(**overrides) -> str:
+    kwargs = {
+        "system_prefix_hash": "p1",
+        "expert": "compliance_auditor",
+        "history": [{
+            "role": "user",
+            "content": "hi"
+        }],
+        "query": "Can I approve in chat?",
+        "llm_config": _LLM,
+    }
+    kwargs.update(overrides)
+    return response_cache_key(**kwargs)
+
+
+def test_response_cache_key_normalizes_whitespace_only() -> None:
+    assert _key() == _key(query="  Can I   approve in chat? ")
+    assert _key() != _key(query="can i approve in chat?")
+    assert _key() != _key(system_prefix_hash="p2")
+    assert _key() != _key(expert="support_concierge")
+    assert _key() != _key(history=[])
+    assert _key() != _key(llm_config=replace(_LLM, model="other"))
+
+
+def test_repeated_query_is_served_from_cache_and_reported(cached_llm) -> None:
+    graph = create_graph().compile()
+    inputs = {"messages": [HumanMessage(content="Can I approve in chat?")]}
+
+    first = graph.invoke(inputs)
+    second = graph.invoke(inputs)
+
+    assert cached_llm.calls == 1
+    assert first["cache_hit_by_expert"] == {"compliance_auditor": False}
+    assert second["cache_hit_by_expert"] == {"compliance_auditor": True}
+    assert second["expert_outputs"] == first["expert_outputs"]
+    assert second["ttft_ms_by_expert"]["compliance_auditor"] >= 0
+
+    # The SQLite tier survives a process-level reset of the memory tier.
+    reset_response_cache()
+    third = graph.invoke(inputs)
+    assert cached_llm.calls == 1
+    assert third["cache_hit_by_expert"] == {"compliance_auditor": True}
+
+
+def test_manual_change_invalidates_cached_responses(cached_llm) -> None:
+    graph = create_graph().compile()
+    inputs = {"messages": [HumanMessage(content="Can I approve in chat?")]}
+    graph.invoke(inputs)
+
+    manual = get_manual()
+    edited = replace(manual, sha256="0" * 64, text=(manual.text + "\nEdit."))
+    set_current_manual(edited)
+    try:
+        result = graph.invoke(inputs)
+    finally:
+        set_current_manual(manual)
+
+    assert cached_llm.calls == 2
+    assert result["cache_hit_by_expert"] == {"compliance_auditor": False}
+
+
+def test_replayed_chunks_rebuild_the_cached_text() -> None:
+    text = "1. Open a ticket.\n2. Attach the approval reference."
+    chunks = list(replay_chunks(text))
+    assert len(chunks) > 1
+    assert "".join(chunk.content for chunk in chunks) == text
+
+
+def test_sqlite_store_evicts_by_size_and_ttl(tmp_path, monkeypatch) -> None:
+    store = SqliteStore(tmp_path / "c.sqlite",
+                        table="t",
+                        max_entries=2,
+                        ttl_s=60.0)
+    now = [1000.0]
+    monkeypatch.setattr("cache_lm.cache_store.time.time", lambda: now[0])
+
+    store.set("a", "1", tag="m1")
+    now[0] += 1
+    store.set("b", "2", tag="m1")
+    now[0] += 1
+    assert store.get("a", tag="m1") == "1"
+    now[0] += 1
+    store.set("c", "3", tag="m1")
+    assert store.get("b", tag="m1") is None
+    assert len(store) == 2
+
+    now[0] += 120
+    assert store.get("a", tag="m1") is None
+
+
+def test_tiered_cache_purges_entries_from_dead_tags(tmp_path) -> None:
+    live = {"m1"}
+    cache = TieredCache(
+        MemoryLru(max_entries=8, ttl_s=None),
+        SqliteStore(tmp_path / "c.sqlite",
+                    table="t",
+                    max_entries=8,
+                    ttl_s=None),
+        is_live=lambda tag: tag in live,
+    )
+    cache.set("k", "old", tag="m1")
+    assert cache.get("k", tag="m1") == "old"
+    live.discard("m1")
+    assert cache.get("k", tag="m2") is None
+    assert len(cache.sqlite) == 0
+    assert len(cache.memory) == 0
+    assert cache.stats()["memory_hits"] == 1
+
+
+def test_tiered_cache_keeps_live_tags_side_by_side(tmp_path) -> None:
+    cache = TieredCache(
+        MemoryLru(max_entries=8, ttl_s=None),
+        SqliteStore(tmp_path / "c.sqlite",
+                    table="t",
+                    max_entries=8,
+                    ttl_s=None),
+        is_live=lambda tag: True,
+    )
+    cache.set("k", "one", tag="m1")
+    cache.set("k", "two", tag="m2")
+    assert cache.get("k", tag="m1") == "one"
+    assert cache.get("k", tag="m2") == "two"
+    assert len(cache.sqlite) == 2
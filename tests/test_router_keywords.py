@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import json
+import random
+
+import pytest
+
+from cache_lm.router import route_experts_rules
+from cache_lm.router_keywords import DEFAULT_KEYWORDS
+from cache_lm.router_keywords import KeywordMatcher
+from cache_lm.router_keywords import load_keyword_tables
+
+
+def _reference(tables, text: str) -> list[str]:
+    # The pre-compiled behavior: one lowercase + substring scan per expert.
+    text_lower = text.lower()
+    return [
+        expert for expert, keywords in tables.items()
+        if any(k in text_lower for k in keywords)
+    ]
+
+
+def test_matcher_agrees_with_substring_scans_on_random_text() -> None:
+    matcher = KeywordMatcher(DEFAULT_KEYWORDS)
+    rng = random.Random(0)
+    fragments = [k for ks in DEFAULT_KEYWORDS.values() for k in ks]
+    fragments += ["x", " ", "Rat", "SPE", "can", "step", "-", "ba", "\n"]
+    for _ in range(500):
+        text = "".join(rng.choice(fragments) for _ in range(rng.randint(0, 8)))
+        assert matcher.match(text) == _reference(DEFAULT_KEYWORDS, text), text
+
+
+def test_overlapping_and_nested_keywords_label_every_expert() -> None:
+    tables = {
+        "compliance_auditor": ("ab", ),
+        "technical_specialist": ("bc", ),
+        "support_concierge": ("abcd", "c"),
+    }
+    matcher = KeywordMatcher(tables)
+    assert matcher.match("xABCx") == [
+        "compliance_auditor",
+        "technical_specialist",
+        "support_concierge",
+    ]
+    assert matcher.match("abd") == ["compliance_auditor"]
+
+
+def test_keyword_tables_load_extra_terms_from_config(tmp_path,
+                                                     monkeypatch) -> None:
+    path = tmp_path / "keywords.json"
+    path.write_text(json.dumps({"technical_specialist": ["webhook"]}),
+                    encoding="utf-8")
+    assert route_experts_rules(
+        "Webhook retries?").tasks[0]["expert"] == "support_concierge"
+
+    monkeypatch.setenv("CACHE_LM_ROUTER_KEYWORDS", str(path))
+    tasks = route_experts_rules("Webhook retries?").tasks
+    assert [t["expert"] for t in tasks] == ["technical_specialist"]
+    # Defaults are kept.
+    assert [t["expert"] for t in route_experts_rules("API policy?").tasks
+            ] == ["compliance_auditor", "technical_specialist"]
+
+
+def test_invalid_keyword_table_is_rejected(tmp_path) -> None:
+    path = tmp_path / "keywords.json"
+    path.write_text(json.dumps({"lawyer": ["contract"]}), encoding="utf-8")
+    with pytest.raises(ValueError):
+        load_keyword_tables(path)
+    path.write_text(json.dumps({"support_concierge": [""]}), encoding="utf-8")
+    with pytest.raises(ValueError):
+        load_keyword_tables(path)
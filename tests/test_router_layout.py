@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import time
+
+from langchain_core.messages import AIMessage
+from langchain_core.messages import HumanMessage
+import pytest
+
+from cache_lm.graph import create_graph
+from cache_lm.manual_registry import reset_manual_registry
+from cache_lm.prompts import prompt_artifacts
+from cache_lm.router_llm import llm_route_experts
+from cache_lm.routing_cache import reset_routing_cache
+from cache_lm.warmup import compare_router_layouts
+
+_COLD_PREFILL_S = 0.05
+
+
+class _FakeChunk:
+
+    def __init__(self, content: str):
+        self.content = content
+
+
+class _PrefixCachingModel:
+    # Prefill of a manual-sized System #1 is slow the first time that prefix
+    # is seen, like a backend with automatic prefix caching.
+
+    def __init__(self):
+        self.router_calls: list[list] = []
+        self.warm_prefixes: set[str] = set()
+
+    def _prefill(self, messages) -> None:
+        prefix = messages[0].content
+        if len(prefix) > 10_000 and prefix not in self.warm_prefixes:
+            time.sleep(_COLD_PREFILL_S)
+            self.warm_prefixes.add(prefix)
+
+    def invoke(self, messages):
+        self.router_calls.append(messages)
+        self._prefill(messages)
+        return AIMessage(
+            content='{"tasks":[{"expert":"compliance_auditor","query":"q"}]}')
+
+    def stream(self, messages):
+        self._prefill(messages)
+        yield _FakeChunk("answer")
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    model = _PrefixCachingModel()
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("CACHE_LM_MODE", "llm")
+    monkeypatch.setenv("CACHE_LM_ROUTER_MODE", "llm")
+    monkeypatch.setattr("cache_lm.experts.create_chat_model",
+                        lambda streaming: model)
+    monkeypatch.setattr("cache_lm.router_llm.create_chat_model",
+                        lambda streaming: model)
+    monkeypatch.setattr("cache_lm.warmup.create_chat_model",
+                        lambda streaming, max_tokens: model)
+    return model
+
+
+def test_standalone_layout_is_the_default(fake_model) -> None:
+    llm_route_experts(user_input="Can I approve in chat?", messages=[])
+    messages = fake_model.router_calls[0]
+    assert len(messages) == 2
+    assert messages[0].content.startswith("You are a router")
+
+
+def test_shared_prefix_router_sends_the_experts_system_prefix(
+        fake_model, monkeypatch) -> None:
+    monkeypatch.setenv("CACHE_LM_ROUTER_LAYOUT", "shared_prefix")
+    result = create_graph().compile().invoke(
+        {"messages": [HumanMessage(content="Can I approve in chat?")]})
+
+    messages = fake_model.router_calls[0]
+    # The very same System #1 object the experts send, then the router.
+    assert messages[0] is prompt_artifacts().system_prefix_message
+    assert messages[1].content.startswith("You are a router")
+    assert result["router_layout"] == "shared_prefix"
+    assert result["router_ttft_ms"] >= _COLD_PREFILL_S * 1000.0
+    # The router paid the prefill; the expert found the prefix warm.
+    assert result["first_expert_ttft_ms"] < _COLD_PREFILL_S * 1000.0
+
+
+def test_layout_is_part_of_the_routing_cache_tag(fake_model,
+                                                 monkeypatch) -> None:
+    monkeypatch.setenv("CACHE_LM_ROUTING_CACHE", "memory")
+    reset_routing_cache()
+    try:
+        llm_route_experts(user_input="Can I approve in chat?", messages=[])
+        monkeypatch.setenv("CACHE_LM_ROUTER_LAYOUT", "shared_prefix")
+        decision = llm_route_experts(user_input="Can I approve in chat?",
+                                     messages=[])
+    finally:
+        reset_routing_cache()
+    assert decision.cache_hit is False
+    assert len(fake_model.router_calls) == 2
+
+
+def test_shared_prefix_cache_keeps_decisions_per_manual(
+        fake_model, monkeypatch, tmp_path) -> None:
+    (tmp_path / "retail.md").write_text("# Retail manual\n", encoding="utf-8")
+    (tmp_path / "treasury.md").write_text("# Treasury manual\n",
+                                          encoding="utf-8")
+    monkeypatch.setenv("CACHE_LM_MANUAL_DIR", str(tmp_path))
+    monkeypatch.setenv("CACHE_LM_ROUTER_LAYOUT", "shared_prefix")
+    monkeypatch.setenv("CACHE_LM_ROUTING_CACHE", "memory")
+    reset_manual_registry()
+    reset_routing_cache()
+    try:
+        hits = [
+            llm_route_experts(user_input="Can I approve in chat?",
+                              messages=[],
+                              manual_id=manual_id).cache_hit
+            for manual_id in ["retail", "treasury"] * 3
+        ]
+    finally:
+        reset_routing_cache()
+        reset_manual_registry()
+    assert hits == [False, False, True, True, True, True]
+    assert len(fake_model.router_calls) == 2
+
+
+def test_compare_router_layouts_reports_both_layouts(fake_model) -> None:
+    timings = compare_router_layouts(user_input="Can I approve in chat?",
+                                     repeats=1)
+    standalone = timings["standalone"]
+    shared = timings["shared_prefix"]
+    assert standalone.first_expert == shared.first_expert == (
+        "compliance_auditor")
+    assert standalone.router_ttft_ms < _COLD_PREFILL_S * 1000.0
+    assert standalone.first_expert_ttft_ms >= _COLD_PREFILL_S * 1000.0
+    assert shared.router_ttft_ms >= _COLD_PREFILL_S * 1000.0
+    assert shared.first_expert_ttft_ms < _COLD_PREFILL_S * 1000.0
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import random
+
+from langchain_core.messages import AIMessage
+from langchain_core.messages import HumanMessage
+import pytest
+
+from cache_lm.cli import main
+from cache_lm.graph import create_graph
+from cache_lm.router import route_experts_rules
+from cache_lm.router_keywords import DEFAULT_KEYWORDS
+from cache_lm.router_llm import llm_route_experts
+from cache_lm.router_local import load_routing_log
+from cache_lm.router_local import LocalRouterModel
+from cache_lm.router_local import reset_local_router
+from cache_lm.router_local import train_local_router
+
+_FILLER = ("please our team in a for today quick question about account "
+           "payments card transfer").split()
+_KEYWORDS = [k for ks in DEFAULT_KEYWORDS.values() for k in ks]
+
+
+def _examples(n: int, seed: int) -> list[tuple[str, set[str]]]:
+    # Synthetic routing log: labels from the rules router.
+    rng = random.Random(seed)
+    examples = []
+    for _ in range(n):
+        words = [rng.choice(_FILLER) for _ in range(rng.randint(3, 10))]
+        for _ in range(rng.randint(0, 2)):
+            words.insert(rng.randint(0, len(words)), rng.choice(_KEYWORDS))
+        text = " ".join(words)
+        experts = {t["expert"] for t in route_experts_rules(text).tasks}
+        examples.append((text, experts))
+    return examples
+
+
+@pytest.fixture(scope="module")
+def model() -> LocalRouterModel:
+    return train_local_router(_examples(1500, seed=0), epochs=150)
+
+
+class _RouterModel:
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, messages):
+        self.calls += 1
+        return AIMessage(
+            content='{"tasks":[{"expert":"technical_specialist","query":""}]}')
+
+
+@pytest.fixture
+def local_mode(monkeypatch, tmp_path, model):
+    router = _RouterModel()
+    path = tmp_path / "router_local.npz"
+    model.save(path)
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("CACHE_LM_ROUTER_MODE", "local")
+    monkeypatch.setenv("CACHE_LM_LOCAL_ROUTER_MODEL", str(path))
+    monkeypatch.setattr("cache_lm.router_llm.create_chat_model",
+                        lambda streaming: router)
+    reset_local_router()
+    yield router
+    reset_local_router()
+
+
+def test_local_router_learns_multi_label_routing(model) -> None:
+    held_out = _examples(300, seed=1)
+    correct = sum({t["expert"]
+                   for t in model.route(text).tasks} == experts
+                  for text, experts in held_out)
+    assert correct / len(held_out) > 0.95
+    route = model.route("Can I approve in chat, and what is the API limit?")
+    assert [t["expert"] for t in route.tasks] == [
+        "compliance_auditor",
+        "technical_specialist",
+    ]
+    assert route.confidence > 0.8
+
+
+def test_artifact_round_trip_is_compact(model, tmp_path) -> None:
+    path = tmp_path / "router.npz"
+    size = model.save(path)
+    loaded = LocalRouterModel.load(path)
+    assert size < 64 * 1024
+    text = "what are the steps for a transfer?"
+    assert loaded.predict_proba(text) == pytest.approx(
+        model.predict_proba(text), abs=1e-3)
+    assert loaded.metadata["samples"] == 1500
+
+
+def test_confident_input_skips_llm_router(local_mode) -> None:
+    graph = create_graph().compile()
+    result = graph.invoke(
+        {"messages": [HumanMessage(content="Can I approve a card transfer?")]})
+    assert local_mode.calls == 0
+    assert result["expert_outputs"].keys() == {"compliance_auditor"}
+    assert result["local_router_confidence"] >= 0.8
+
+
+def test_ambiguous_input_falls_back_to_llm_router(local_mode,
+                                                  monkeypatch) -> None:
+    monkeypatch.setenv("CACHE_LM_LOCAL_ROUTER_THRESHOLD", "0.999999")
+    graph = create_graph().compile()
+    result = graph.invoke(
+        {"messages": [HumanMessage(content="Can I approve a card transfer?")]})
+    assert local_mode.calls == 1
+    assert result["expert_outputs"].keys() == {"technical_specialist"}
+    assert result["local_router_confidence"] < 0.999999
+
+
+def test_missing_artifact_falls_back_to_llm_router(local_mode, monkeypatch,
+                                                   tmp_path) -> None:
+    monkeypatch.setenv("CACHE_LM_LOCAL_ROUTER_MODEL",
+                       str(tmp_path / "missing.npz"))
+    graph = create_graph().compile()
+    result = graph.invoke({"messages": [HumanMessage(content="Hello?")]})
+    assert local_mode.calls == 1
+    assert result["local_router_confidence"] is None
+
+
+def test_unreadable_artifact_falls_back_to_llm_router(local_mode, monkeypatch,
+                                                      tmp_path) -> None:
+    path = tmp_path / "corrupt.npz"
+    path.write_bytes(b"not an npz archive")
+    monkeypatch.setenv("CACHE_LM_LOCAL_ROUTER_MODEL", str(path))
+    graph = create_graph().compile()
+    result = graph.invoke({"messages": [HumanMessage(content="Hello?")]})
+    assert local_mode.calls == 1
+    assert result["expert_outputs"].keys() == {"technical_specialist"}
+    assert result["local_router_confidence"] is None
+
+
+def test_router_log_trains_through_cli(local_mode, monkeypatch, tmp_path,
+                                       capsys) -> None:
+    log = tmp_path / "routing.jsonl"
+    monkeypatch.setenv("CACHE_LM_ROUTER_LOG", str(log))
+    for i in range(20):
+        llm_route_experts(user_input=f"Is error {i} covered?", messages=[])
+    examples = load_routing_log(log)
+    assert examples[0] == ("Is error 0 covered?", {"technical_specialist"})
+
+    output = tmp_path / "trained.npz"
+    assert main([
+        "router-train", "--log",
+        str(log), "--output",
+        str(output), "--epochs", "20"
+    ]) == 0
+    out = capsys.readouterr().out
+    assert "samples: 18" in out and "holdout: 2" in out
+    assert LocalRouterModel.load(output).metadata["samples"] == 18
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+from langchain_core.messages import AIMessage
+from langchain_core.messages import HumanMessage
+import pytest
+
+from cache_lm.graph import create_graph
+from cache_lm.router_llm import allm_route_experts
+from cache_lm.router_llm import llm_route_experts
+from cache_lm.routing_cache import reset_routing_cache
+from cache_lm.routing_cache import routing_cache_key
+from cache_lm.routing_cache import routing_cache_stats
+
+_ROUTE = ('{"tasks":[{"expert":"compliance_auditor","query":"%s"},'
+          '{"expert":"technical_specialist","query":"API limits"}]}')
+
+
+class _FakeChunk:
+
+    def __init__(self, content: str):
+        self.content = content
+
+
+class _RouterModel:
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, messages):
+        self.calls += 1
+        time.sleep(0.005)
+        user_input = messages[-1].content.split("\n")[1]
+        return AIMessage(content=_ROUTE % user_input)
+
+    async def ainvoke(self, messages):
+        return self.invoke(messages)
+
+    def stream(self, messages):
+        yield _FakeChunk("ok")
+
+
+@pytest.fixture
+def router_model(monkeypatch, tmp_path):
+    model = _RouterModel()
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("CACHE_LM_ROUTING_CACHE", "sqlite")
+    monkeypatch.setenv("CACHE_LM_ROUTING_CACHE_DB",
+                       str(tmp_path / "routing.sqlite"))
+    monkeypatch.setattr("cache_lm.router_llm.create_chat_model",
+                        lambda streaming: model)
+    reset_routing_cache()
+    yield model
+    reset_routing_cache()
+
+
+def test_routing_cache_key_uses_normalized_input_and_history() -> None:
+    key = routing_cache_key(user_input="Can I approve in chat?",
+                            history_text="USER: hi")
+    assert key == routing_cache_key(user_input="  can i APPROVE in   chat? ",
+                                    history_text="USER: hi")
+    assert key != routing_cache_key(user_input="Can I approve in chat?",
+                                    history_text="USER: hello")
+
+
+def test_repeated_route_is_served_from_cache(router_model) -> None:
+    first = llm_route_experts(user_input="Can I approve in chat?", messages=[])
+    second = llm_route_experts(user_input="can i approve  in chat?",
+                               messages=[])
+
+    assert router_model.calls == 1
+    assert first.cache_hit is False and second.cache_hit is True
+    assert [t["expert"] for t in second.tasks] == [
+        "compliance_auditor",
+        "technical_specialist",
+    ]
+    # Echoed queries follow the current wording; rewritten ones are kept.
+    assert second.tasks[0]["query"] == "can i approve  in chat?"
+    assert second.tasks[1]["query"] == "API limits"
+    stats = routing_cache_stats()
+    assert stats["memory_hits"] == 1 and stats["misses"] == 1
+    assert stats["router_ms_saved"] > 0
+
+
+def test_different_history_is_routed_again(router_model) -> None:
+    llm_route_experts(user_input="And the limits?", messages=[])
+    asyncio.run(
+        allm_route_experts(
+            user_input="And the limits?",
+            messages=[HumanMessage(content="Tell me about wires.")],
+        ))
+    assert router_model.calls == 2
+
+
+def test_router_prompt_change_never_serves_old_decisions(
+        router_model, monkeypatch) -> None:
+    llm_route_experts(user_input="Can I approve in chat?", messages=[])
+    monkeypatch.setattr("cache_lm.router_llm._system_router_prompt",
+                        lambda: "A new router prompt.")
+    decision = llm_route_experts(user_input="Can I approve in chat?",
+                                 messages=[])
+    assert decision.cache_hit is False
+    assert router_model.calls == 2
+
+
+def test_sqlite_tier_survives_process_restart(router_model) -> None:
+    llm_route_experts(user_input="Can I approve in chat?", messages=[])
+    # Same settings, fresh in-memory tier (as in a new process).
+    reset_routing_cache()
+    decision = llm_route_experts(user_input="Can I approve in chat?",
+                                 messages=[])
+    assert decision.cache_hit is True
+    assert routing_cache_stats()["sqlite_hits"] == 1
+    assert router_model.calls == 1
+
+
+def test_graph_reports_router_cache_hit(router_model, monkeypatch) -> None:
+    monkeypatch.setenv("CACHE_LM_ROUTER_MODE", "llm")
+    graph = create_graph().compile()
+    inputs = {"messages": [HumanMessage(content="Can I approve in chat?")]}
+    assert graph.invoke(inputs)["router_cache_hit"] is False
+    assert graph.invoke(inputs)["router_cache_hit"] is True
+    assert router_model.calls == 1
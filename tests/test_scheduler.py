@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+from langchain_core.messages import HumanMessage
+import pytest
+
+from cache_lm.graph import create_graph
+from cache_lm.scheduler import PrefixScheduler
+from cache_lm.scheduler import reset_scheduler
+from cache_lm.scheduler import scheduler_stats
+
+_KEY = ("prefix-hash", "technical_specialist")
+_COLD_PREFILL_S = 0.05
+
+
+def test_same_prefix_calls_wait_for_the_primer_and_go_out_as_one_wave(
+) -> None:
+    scheduler = PrefixScheduler(max_delay_ms=5000, warm_prefixes=4)
+    primer = scheduler.acquire(_KEY)
+    assert primer.primer
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        followers = [pool.submit(scheduler.acquire, _KEY) for _ in range(3)]
+        time.sleep(0.05)
+        assert not any(f.done() for f in followers)
+        assert scheduler.stats()["queue_depth"] == 3
+        primer.first_token()
+        released = [f.result(timeout=1) for f in followers]
+    primer.close()
+
+    assert not any(call.primer for call in released)
+    stats = scheduler.stats()
+    assert stats["waves"] == 1 and stats["max_wave_size"] == 3
+    assert stats["queue_depth"] == 0 and stats["max_queue_depth"] == 3
+    assert stats["hit_rate"] == 3 / 4
+    # A warm prefix is not held at all.
+    assert not scheduler.acquire(_KEY).primer
+    assert scheduler.stats()["hit_rate"] == 4 / 5
+
+
+def test_no_call_waits_longer_than_max_delay() -> None:
+    scheduler = PrefixScheduler(max_delay_ms=30, warm_prefixes=4)
+    scheduler.acquire(_KEY)
+    started = time.perf_counter()
+    scheduler.acquire(_KEY)
+    assert time.perf_counter() - started < 1.0
+    stats = scheduler.stats()
+    assert stats["timeouts"] == 1 and stats["avg_wait_ms"] >= 30
+
+
+def test_failed_primer_hands_priming_to_the_next_call() -> None:
+    scheduler = PrefixScheduler(max_delay_ms=5000, warm_prefixes=4)
+    primer = scheduler.acquire(_KEY)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        followers = [pool.submit(scheduler.acquire, _KEY) for _ in range(2)]
+        time.sleep(0.05)
+        primer.close()
+        time.sleep(0.05)
+        done = [f for f in followers if f.done()]
+        assert len(done) == 1 and done[0].result().primer
+        done[0].result().first_token()
+        assert all(f.result(timeout=1) for f in followers)
+
+
+class _FakeChunk:
+
+    def __init__(self, content: str):
+        self.content = content
+
+
+class _PrefixCachingModel:
+    # A prompt prefix (System #1 + System #2) costs a slow prefill until a
+    # call for it has finished prefilling; counts the prefills. The n-th
+    # cold call holds its first chunk until the scheduler has admitted
+    # `hold_until_admitted[n]` calls, so waves do not depend on timing.
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.warm: set[str] = set()
+        self.prefills = 0
+        self.hold_until_admitted: list[int] = []
+
+    def _hold(self) -> None:
+        with self._lock:
+            if not self.hold_until_admitted:
+                return
+            target = self.hold_until_admitted.pop(0)
+        deadline = time.perf_counter() + 5
+        while time.perf_counter() < deadline:
+            stats = scheduler_stats()
+            if stats["released"] + stats["queue_depth"] >= target:
+                return
+            time.sleep(0.005)
+
+    def _start(self, messages) -> bool:
+        key = messages[0].content + messages[1].content
+        with self._lock:
+            cold = key not in self.warm
+            self.prefills += int(cold)
+        return cold
+
+    def _warmed(self, messages) -> None:
+        with self._lock:
+            self.warm.add(messages[0].content + messages[1].content)
+
+    def stream(self, messages):
+        if self._start(messages):
+            time.sleep(_COLD_PREFILL_S)
+            self._hold()
+            self._warmed(messages)
+        yield _FakeChunk("answer")
+
+    async def astream(self, messages):
+        if self._start(messages):
+            await asyncio.sleep(_COLD_PREFILL_S)
+            self._warmed(messages)
+        yield _FakeChunk("answer")
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    model = _PrefixCachingModel()
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("CACHE_LM_MODE", "llm")
+    monkeypatch.setenv("CACHE_LM_ROUTER_MODE", "rules")
+    monkeypatch.setenv("CACHE_LM_SCHEDULER", "prefix")
+    monkeypatch.setattr("cache_lm.experts.create_chat_model",
+                        lambda streaming: model)
+    reset_scheduler()
+    yield model
+    reset_scheduler()
+
+
+def _inputs(i: int) -> dict:
+    question = f"Can I approve a card transfer, and what are the API limits? {i}"
+    return {"messages": [HumanMessage(content=question)]}
+
+
+# Calls admitted before each primer's first token: in parallel all 12 reach
+# the scheduler together; in sequential each turn finishes its first expert
+# before it starts the second, so the second prefix sees the other 6 later.
+@pytest.mark.parametrize("execution,admitted", [("sequential", [6, 12]),
+                                                ("parallel", [12, 12])])
+def test_concurrent_turns_prefill_each_prefix_once(fake_model, monkeypatch,
+                                                   execution,
+                                                   admitted) -> None:
+    monkeypatch.setenv("CACHE_LM_EXPERT_EXECUTION", execution)
+    # Followers must outlast the held primers rather than time out.
+    monkeypatch.setenv("CACHE_LM_SCHEDULER_MAX_DELAY_MS", "10000")
+    fake_model.hold_until_admitted = list(admitted)
+    graph = create_graph().compile()
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        results = list(pool.map(lambda i: graph.invoke(_inputs(i)), range(6)))
+
+    assert all(
+        set(r["expert_outputs"]) == {
+            "compliance_auditor",
+            "technical_specialist",
+        } for r in results)
+    # Two prefixes (one per expert), each prefilled by a single call.
+    assert fake_model.prefills == 2
+    stats = scheduler_stats()
+    assert stats["released"] == 12
+    # Each primer's first token released its five followers as one wave.
+    assert stats["waves"] == 2 and stats["max_wave_size"] == 5
+    assert stats["hit_rate"] == 10 / 12
+    assert stats["queue_depth"] == 0
+
+
+def test_async_turns_prefill_each_prefix_once(fake_model, monkeypatch) -> None:
+    monkeypatch.setenv("CACHE_LM_EXPERT_EXECUTION", "parallel")
+    graph = create_graph().compile()
+
+    async def run() -> list[dict]:
+        return await asyncio.gather(*(graph.ainvoke(_inputs(i))
+                                      for i in range(6)))
+
+    results = asyncio.run(run())
+    assert all(len(r["expert_outputs"]) == 2 for r in results)
+    assert fake_model.prefills == 2
+    assert scheduler_stats()["hit_rate"] == 10 / 12
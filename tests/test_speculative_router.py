@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+from langchain_core.messages import AIMessage
+from langchain_core.messages import HumanMessage
+import pytest
+
+from cache_lm.experts import _EARLY_CALLS
+from cache_lm.graph import create_graph
+from cache_lm.streaming import SectionOrderer
+
+# The rules router sends this to compliance_auditor only.
+_QUERY = "Can I approve in chat?"
+_ROUTER_DELAY_S = 0.1
+_CHUNK_DELAY_S = 0.01
+
+
+class _FakeChunk:
+
+    def __init__(self, content: str):
+        self.content = content
+
+
+class _FakeChatModel:
+    # The router answers `route` after a delay (with `query` for every
+    # task); every expert call streams chunks tagged with the first three
+    # letters of its query and is counted.
+
+    def __init__(self):
+        self.route: list[str] = []
+        self.query = _QUERY
+        self.router_done_at: float | None = None
+        self.expert_calls: list[float] = []
+
+    def _router_response(self) -> AIMessage:
+        tasks = [
+            f'{{"expert":"{e}","query":"{self.query}"}}' for e in self.route
+        ]
+        self.router_done_at = time.perf_counter()
+        return AIMessage(content='{"tasks":[' + ",".join(tasks) + "]}")
+
+    def invoke(self, messages):
+        time.sleep(_ROUTER_DELAY_S)
+        return self._router_response()
+
+    async def ainvoke(self, messages):
+        await asyncio.sleep(_ROUTER_DELAY_S)
+        return self._router_response()
+
+    def stream(self, messages):
+        self.expert_calls.append(time.perf_counter())
+        for _ in range(30):
+            time.sleep(_CHUNK_DELAY_S)
+            yield _FakeChunk(f"[{messages[-1].content[:3]}]")
+
+    async def astream(self, messages):
+        self.expert_calls.append(time.perf_counter())
+        for _ in range(30):
+            await asyncio.sleep(_CHUNK_DELAY_S)
+            yield _FakeChunk(f"[{messages[-1].content[:3]}]")
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    model = _FakeChatModel()
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("CACHE_LM_MODE", "llm")
+    monkeypatch.setenv("CACHE_LM_ROUTER_MODE", "llm")
+    monkeypatch.setenv("CACHE_LM_EXPERT_EXECUTION", "parallel")
+    monkeypatch.setenv("CACHE_LM_ROUTER_SPECULATE", "1")
+    monkeypatch.setattr("cache_lm.experts.create_chat_model",
+                        lambda streaming: model)
+    monkeypatch.setattr("cache_lm.router_llm.create_chat_model",
+                        lambda streaming: model)
+    return model
+
+
+def _run(graph, *, use_async: bool) -> dict:
+    inputs = {"messages": [HumanMessage(content=_QUERY)]}
+    if use_async:
+        return asyncio.run(graph.ainvoke(inputs))
+    return graph.invoke(inputs)
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_agreed_expert_keeps_running_and_added_expert_launches(
+        fake_model, use_async) -> None:
+    fake_model.route = ["compliance_auditor", "technical_specialist"]
+    result = _run(create_graph().compile(), use_async=use_async)
+
+    assert set(result["expert_outputs"]) == {
+        "compliance_auditor",
+        "technical_specialist",
+    }
+    # One call per expert: the speculative one was kept, not restarted.
+    assert len(fake_model.expert_calls) == 2
+    assert fake_model.expert_calls[0] < fake_model.router_done_at
+    assert result["speculation"] == {
+        "speculated": ["compliance_auditor"],
+        "kept": ["compliance_auditor"],
+        "cancelled": [],
+        "added": ["technical_specialist"],
+        "hit_rate": 1.0,
+        "fallback": False,
+        "wasted_tokens": 0,
+    }
+    # The kept call had a head start of about one router round trip.
+    lead_ms = result["router_lead_ms_by_expert"]
+    assert list(lead_ms) == ["compliance_auditor"]
+    assert lead_ms["compliance_auditor"] > _ROUTER_DELAY_S * 1000.0 / 2
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_dropped_expert_is_cancelled_and_counted_as_waste(
+        fake_model, use_async) -> None:
+    fake_model.route = ["support_concierge"]
+    result = _run(create_graph().compile(), use_async=use_async)
+
+    assert list(result["expert_outputs"]) == ["support_concierge"]
+    speculation = result["speculation"]
+    assert speculation["cancelled"] == ["compliance_auditor"]
+    assert speculation["added"] == ["support_concierge"]
+    assert speculation["hit_rate"] == 0.0
+    assert 0 < speculation["wasted_tokens"] < 30
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_router_failure_is_not_counted_as_a_hit(fake_model, monkeypatch,
+                                                use_async) -> None:
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("router unavailable")
+
+    monkeypatch.setattr(fake_model, "invoke", fail)
+    monkeypatch.setattr(fake_model, "ainvoke", fail)
+    result = _run(create_graph().compile(), use_async=use_async)
+
+    # The speculated expert still answers, but nothing confirmed the guess.
+    assert list(result["expert_outputs"]) == ["compliance_auditor"]
+    assert len(fake_model.expert_calls) == 1
+    speculation = result["speculation"]
+    assert speculation["kept"] == ["compliance_auditor"]
+    assert speculation["fallback"] is True
+    assert speculation["hit_rate"] is None
+
+
+async def _astream_text(graph, inputs: dict) -> tuple[str, dict]:
+    orderer = SectionOrderer()
+    parts: list[str] = []
+    result: dict = {}
+    async for mode, chunk in graph.astream(inputs,
+                                           stream_mode=["custom", "values"]):
+        if mode == "custom":
+            parts.extend(orderer.feed(chunk))
+        else:
+            result = chunk
+    return "".join(parts), result
+
+
+def _stream_text(graph, *, use_async: bool) -> tuple[str, dict]:
+    inputs = {"messages": [HumanMessage(content=_QUERY)]}
+    if use_async:
+        return asyncio.run(_astream_text(graph, inputs))
+    orderer = SectionOrderer()
+    parts: list[str] = []
+    result: dict = {}
+    for mode, chunk in graph.stream(inputs, stream_mode=["custom", "values"]):
+        if mode == "custom":
+            parts.extend(orderer.feed(chunk))
+        else:
+            result = chunk
+    return "".join(parts), result
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_rewritten_query_retracts_the_speculative_tokens(
+        fake_model, use_async) -> None:
+    fake_model.route = ["compliance_auditor"]
+    fake_model.query = "rewritten: may I approve in chat?"
+    streamed, result = _stream_text(create_graph().compile(),
+                                    use_async=use_async)
+
+    assert result["speculation"]["cancelled"] == ["compliance_auditor"]
+    assert result["speculation"]["wasted_tokens"] > 0
+    assert "[Can]" not in streamed
+    assert streamed == result["expert_outputs"]["compliance_auditor"]
+    assert streamed == result["response"]
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_budget_spent_while_routing_cancels_the_speculative_call(
+        fake_model, monkeypatch, use_async) -> None:
+    # The router alone outlasts the budget; the speculative call is in flight.
+    monkeypatch.setenv("CACHE_LM_TURN_BUDGET_MS", "50")
+    fake_model.route = ["compliance_auditor"]
+    streamed, result = _stream_text(create_graph().compile(),
+                                    use_async=use_async)
+
+    # Stopped at the budget, keeping the text it had already streamed.
+    assert not _EARLY_CALLS
+    assert result["deadline"]["cut_off"] == ["compliance_auditor"]
+    assert result["deadline"]["skipped"] == []
+    assert len(fake_model.expert_calls) == 1
+    partial = result["expert_outputs"]["compliance_auditor"]
+    cut = result["cutoff_by_expert"]["compliance_auditor"]
+    assert partial.startswith("[Can]") and cut["started"]
+    assert len(partial) < 30 * len("[Can]")
+    assert streamed == result["response"]
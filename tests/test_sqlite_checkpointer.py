@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import sqlite3
+import time
+
+from langchain_core.messages import HumanMessage
+import pytest
+
+from cache_lm.checkpoint_sqlite import checkpoint_db_stats
+from cache_lm.checkpoint_sqlite import checkpoint_id_floor
+from cache_lm.checkpoint_sqlite import close_shared_checkpointers
+from cache_lm.checkpoint_sqlite import prune_checkpoints
+from cache_lm.checkpointing import sqlite_checkpointer
+from cache_lm.cli import main
+from cache_lm.graph import create_graph
+
+
+@pytest.fixture
+def tuned(monkeypatch):
+    monkeypatch.setenv("CACHE_LM_CHECKPOINT_MODE", "tuned")
+    yield
+    close_shared_checkpointers()
+
+
+def _turn(db_path: str, thread_id: str, text: str) -> dict:
+    with sqlite_checkpointer(db_path) as checkpointer:
+        graph = create_graph().compile(checkpointer=checkpointer)
+        return graph.invoke(
+            {"messages": [HumanMessage(content=text)]},
+            config={"configurable": {
+                "thread_id": thread_id
+            }},
+        )
+
+
+def _count(db_path: str, table: str, thread_id: str | None = None) -> int:
+    conn = sqlite3.connect(db_path)
+    try:
+        if thread_id is None:
+            return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        return conn.execute(
+            f"SELECT COUNT(*) FROM {table} WHERE thread_id = ?",
+            (thread_id, )).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_tuned_saver_shares_a_wal_connection_and_groups_commits(
+        tuned, tmp_path) -> None:
+    db_path = str(tmp_path / "checkpoints.sqlite")
+    with sqlite_checkpointer(db_path) as first:
+        pass
+    with sqlite_checkpointer(db_path) as second:
+        assert second is first
+        assert second.conn.execute(
+            "PRAGMA journal_mode").fetchone()[0] == "wal"
+        # 1 = NORMAL
+        assert second.conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+
+    _turn(db_path, "t1", "What is the API limit?")
+    result = _turn(db_path, "t1", "Summarize that in steps.")
+    assert len(result["messages"]) == 4
+
+    stats = checkpoint_db_stats(db_path)
+    # Every turn writes several checkpoints but commits them once.
+    assert stats["commits"] == 2 and stats["writes"] > 2 * 5
+    assert stats["avg_write_ms"] > 0 and stats["p95_write_ms"] > 0
+    assert stats["db_bytes"] + stats["wal_bytes"] > 0
+    # Committed: visible to another connection.
+    assert _count(db_path, "checkpoints", "t1") > 0
+
+
+def test_commit_window_bounds_a_long_group(tuned, monkeypatch,
+                                           tmp_path) -> None:
+    monkeypatch.setenv("CACHE_LM_CHECKPOINT_COMMIT_MS", "0")
+    db_path = str(tmp_path / "checkpoints.sqlite")
+    _turn(db_path, "t1", "What is the API limit?")
+    stats = checkpoint_db_stats(db_path)
+    assert stats["commits"] == stats["writes"]
+
+
+def test_prune_keeps_the_newest_checkpoints_per_thread(tuned,
+                                                       tmp_path) -> None:
+    db_path = str(tmp_path / "checkpoints.sqlite")
+    for _ in range(3):
+        _turn(db_path, "t1", "What is the API limit?")
+    _turn(db_path, "t2", "Can I approve in chat?")
+    t2_checkpoints = _count(db_path, "checkpoints", "t2")
+    close_shared_checkpointers()
+
+    report = prune_checkpoints(db_path, keep_last=2)
+    assert report.checkpoints_deleted > 0
+    assert _count(db_path, "checkpoints", "t1") == 2
+    assert _count(db_path, "checkpoints", "t2") == 2 < t2_checkpoints
+    assert report.writes_deleted > 0
+    # Writes only remain for checkpoints that still exist.
+    conn = sqlite3.connect(db_path)
+    orphans = conn.execute("""
+        SELECT COUNT(*) FROM writes w WHERE NOT EXISTS (
+            SELECT 1 FROM checkpoints c WHERE c.checkpoint_id = w.checkpoint_id)
+        """).fetchone()[0]
+    conn.close()
+    assert orphans == 0
+
+    # The newest checkpoint still restores the whole thread.
+    with sqlite_checkpointer(db_path) as checkpointer:
+        graph = create_graph().compile(checkpointer=checkpointer)
+        state = graph.get_state({"configurable": {"thread_id": "t1"}})
+    assert len(state.values["messages"]) == 6
+
+
+def test_prune_leaves_a_db_without_checkpoints_alone(tmp_path, capsys) -> None:
+    db_path = tmp_path / "checkpoints.sqlite"
+    db_path.touch()
+    report = prune_checkpoints(str(db_path), keep_last=1, max_age_s=60)
+    assert report.checkpoints_deleted == report.checkpoints_kept == 0
+    assert report.db_bytes_after == report.db_bytes_before == 0
+
+    assert main([
+        "checkpoints", "prune", "--checkpoint-db",
+        str(db_path), "--keep-last", "1"
+    ]) == 0
+    assert "checkpoints_kept: 0" in capsys.readouterr().out
+    assert not db_path.with_name(db_path.name + "-wal").exists()
+
+
+def test_prune_ttl_drops_idle_threads(tuned, tmp_path, capsys) -> None:
+    db_path = str(tmp_path / "checkpoints.sqlite")
+    _turn(db_path, "t1", "What is the API limit?")
+    close_shared_checkpointers()
+
+    # Checkpoint ids order by creation time.
+    assert checkpoint_id_floor(time.time() - 60) < checkpoint_id_floor(
+        time.time())
+    assert prune_checkpoints(db_path, keep_last=0,
+                             max_age_s=3600).checkpoints_deleted == 0
+
+    assert main([
+        "checkpoints", "prune", "--checkpoint-db", db_path, "--keep-last", "0",
+        "--ttl-s", "0.001", "--vacuum"
+    ]) == 0
+    out = capsys.readouterr().out
+    assert "checkpoints_kept: 0" in out
+    assert _count(db_path, "checkpoints") == 0
+    assert _count(db_path, "writes") == 0
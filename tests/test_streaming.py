@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+from langchain_core.messages import HumanMessage
+
+from cache_lm.graph import create_graph
+from cache_lm.streaming import end_event
+from cache_lm.streaming import route_event
+from cache_lm.streaming import SectionOrderer
+from cache_lm.streaming import token_event
+
+
+class _FakeChunk:
+
+    def __init__(self, content: str):
+        self.content = content
+
+
+class _FakeStreamingChatModel:
+
+    def stream(self, messages):
+        persona = messages[1].content.split(".")[0]
+        for word in [persona, " says", " hi."]:
+            yield _FakeChunk(word)
+
+
+def _render(events: list[dict]) -> str:
+    orderer = SectionOrderer()
+    return "".join(text for event in events for text in orderer.feed(event))
+
+
+def test_section_orderer_buffers_later_sections() -> None:
+    orderer = SectionOrderer()
+    assert orderer.feed(
+        route_event(["compliance_auditor", "support_concierge"])) == []
+    # Support streams first but must wait for compliance.
+    assert orderer.feed(token_event("support_concierge", "Step 1")) == []
+    assert orderer.feed(token_event("compliance_auditor", " No.")) == ["No."]
+    assert orderer.feed(end_event("support_concierge")) == []
+    assert orderer.feed(end_event("compliance_auditor")) == ["\n\nStep 1"]
+
+
+def test_streamed_text_matches_final_response_in_parallel_mode(
+        monkeypatch) -> None:
+    monkeypatch.setenv("CACHE_LM_MODE", "llm")
+    monkeypatch.setenv("CACHE_LM_EXPERT_EXECUTION", "parallel")
+    monkeypatch.setattr("cache_lm.experts.create_chat_model",
+                        lambda streaming: _FakeStreamingChatModel())
+
+    graph = create_graph().compile()
+    events: list[dict] = []
+    result: dict = {}
+    for mode, chunk in graph.stream(
+        {
+            "messages": [
+                HumanMessage(content="Can I do this under policy, what are "
+                             "the API limits, and give me steps?")
+            ]
+        },
+            stream_mode=["custom", "values"],
+    ):
+        if mode == "custom":
+            events.append(chunk)
+        else:
+            result = chunk
+
+    assert sum(1 for e in events if e["event"] == "token") == 9
+    assert _render(events) == result["response"]
+    assert result["first_visible_token_ms"] >= 0
+
+
+def test_stub_mode_streams_sections_too() -> None:
+    graph = create_graph().compile()
+    events = [
+        chunk for chunk in graph.stream(
+            {"messages": [HumanMessage(content="What is the API limit?")]},
+            stream_mode="custom",
+        )
+    ]
+    assert [e["event"] for e in events] == ["route", "token", "end"]
+    assert _render(events).startswith("Technical Specialist (stub)")
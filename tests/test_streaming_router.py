@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+from langchain_core.messages import HumanMessage
+import pytest
+
+from cache_lm.graph import create_graph
+from cache_lm.router_llm import RoutingJsonStream
+
+_ROUTER_CHUNKS = [
+    '```json\n{"tasks":[{"expert":"compliance_auditor",',
+    '"query":"Can I {approve} \\"this\\"?"},',
+    '{"expert":"technical_specialist","query":"API limits"}',
+    "]}\n```",
+]
+_ROUTER_CHUNK_DELAY_S = 0.05
+
+
+class _FakeChunk:
+
+    def __init__(self, content: str):
+        self.content = content
+
+
+class _FakeChatModel:
+    # Router calls stream `_ROUTER_CHUNKS` slowly; expert calls record when
+    # they started, relative to the router call.
+
+    def __init__(self, router_chunks: list[str]):
+        self.router_chunks = router_chunks
+        self.router_done_at: float | None = None
+        self.expert_started_at: dict[str, float] = {}
+
+    @staticmethod
+    def _is_router(messages) -> bool:
+        return messages[0].content.startswith("You are a router")
+
+    def stream(self, messages):
+        if self._is_router(messages):
+            for chunk in self.router_chunks:
+                time.sleep(_ROUTER_CHUNK_DELAY_S)
+                yield _FakeChunk(chunk)
+            self.router_done_at = time.perf_counter()
+            return
+        self.expert_started_at[messages[-1].content] = time.perf_counter()
+        time.sleep(0.02)
+        yield _FakeChunk("answer")
+
+    async def astream(self, messages):
+        if self._is_router(messages):
+            for chunk in self.router_chunks:
+                await asyncio.sleep(_ROUTER_CHUNK_DELAY_S)
+                yield _FakeChunk(chunk)
+            self.router_done_at = time.perf_counter()
+            return
+        self.expert_started_at[messages[-1].content] = time.perf_counter()
+        await asyncio.sleep(0.02)
+        yield _FakeChunk("answer")
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    model = _FakeChatModel(list(_ROUTER_CHUNKS))
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("CACHE_LM_MODE", "llm")
+    monkeypatch.setenv("CACHE_LM_ROUTER_MODE", "llm")
+    monkeypatch.setenv("CACHE_LM_EXPERT_EXECUTION", "parallel")
+    monkeypatch.setenv("CACHE_LM_ROUTER_STREAMING", "1")
+    monkeypatch.setattr("cache_lm.experts.create_chat_model",
+                        lambda streaming: model)
+    monkeypatch.setattr("cache_lm.router_llm.create_chat_model",
+                        lambda streaming: model)
+    return model
+
+
+def test_routing_json_stream_closes_tasks_incrementally() -> None:
+    parser = RoutingJsonStream()
+    closed = []
+    for chunk in _ROUTER_CHUNKS:
+        for ch in chunk:
+            closed.append((len(closed), parser.feed(ch)))
+    tasks = [task for _, found in closed for task in found]
+    assert tasks == [
+        {
+            "expert": "compliance_auditor",
+            "query": 'Can I {approve} "this"?'
+        },
+        {
+            "expert": "technical_specialist",
+            "query": "API limits"
+        },
+    ]
+    # The first task is emitted on its closing brace, before the second one
+    # has started arriving.
+    first_at = next(i for i, found in closed if found)
+    assert first_at == len(_ROUTER_CHUNKS[0]) + len(_ROUTER_CHUNKS[1]) - 2
+
+
+def _assert_first_expert_overlapped_router(model, result) -> None:
+    assert result["expert_outputs"] == {
+        "compliance_auditor": "answer",
+        "technical_specialist": "answer",
+    }
+    first_started = model.expert_started_at['Can I {approve} "this"?']
+    assert first_started < model.router_done_at
+    assert result["router_lead_ms_by_expert"]["compliance_auditor"] > (
+        _ROUTER_CHUNK_DELAY_S * 1000.0)
+    assert result["router_overlap_ms_saved"] > 0
+
+
+def test_parallel_graph_starts_experts_before_routing_completes(
+        fake_model) -> None:
+    graph = create_graph().compile()
+    result = graph.invoke({"messages": [HumanMessage(content="Help?")]})
+    _assert_first_expert_overlapped_router(fake_model, result)
+
+
+def test_async_parallel_graph_starts_experts_before_routing_completes(
+        fake_model) -> None:
+    graph = create_graph().compile()
+    result = asyncio.run(
+        graph.ainvoke({"messages": [HumanMessage(content="Help?")]}))
+    _assert_first_expert_overlapped_router(fake_model, result)
+
+
+def test_broken_router_stream_keeps_dispatched_tasks(fake_model) -> None:
+    fake_model.router_chunks = _ROUTER_CHUNKS[:2] + ["{not json"]
+    graph = create_graph().compile()
+    result = graph.invoke({"messages": [HumanMessage(content="Help?")]})
+    assert result["expert_outputs"] == {"compliance_auditor": "answer"}
+    assert result["router_overlap_ms_saved"] is not None
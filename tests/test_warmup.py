@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+from dataclasses import replace
+import json
+import time
+
+import pytest
+
+from cache_lm.manual import get_manual
+from cache_lm.prompts import EXPERT_NAMES
+from cache_lm.prompts import expert_system_suffix_text
+from cache_lm.prompts import system_prefix_hash
+from cache_lm.prompts import system_prefix_text
+from cache_lm.warmup import ensure_prefix_warm
+from cache_lm.warmup import is_prefix_warm
+from cache_lm.warmup import reset_warmup_state
+from cache_lm.warmup import warm_prefix
+from cache_lm.warmup import WARMUP_MAX_TOKENS
+
+
+class _FakeChunk:
+
+    def __init__(self, content: str):
+        self.content = content
+
+
+class _FakeStreamingChatModel:
+
+    def __init__(self, calls: list):
+        self.calls = calls
+
+    def stream(self, messages):
+        self.calls.append(messages)
+        yield _FakeChunk("OK")
+
+
+@pytest.fixture
+def fake_warmup_model(monkeypatch):
+    calls: list = []
+    budgets: list = []
+
+    def create(*, streaming, max_tokens=None):
+        budgets.append(max_tokens)
+        return _FakeStreamingChatModel(calls)
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.delenv("CACHE_LM_WARMUP_STATE", raising=False)
+    monkeypatch.setattr("cache_lm.warmup.create_chat_model", create)
+    reset_warmup_state()
+    yield calls, budgets
+    reset_warmup_state()
+
+
+def test_warm_prefix_sends_manual_prefix_with_each_expert_suffix(
+        fake_warmup_model) -> None:
+    calls, budgets = fake_warmup_model
+    manual = get_manual()
+
+    report = warm_prefix()
+
+    assert not report.skipped
+    assert report.system_prefix_hash == system_prefix_hash(
+        manual_text=manual.text)
+    assert [r.expert for r in report.results] == list(EXPERT_NAMES)
+    assert set(budgets) == {WARMUP_MAX_TOKENS}
+    # One cold and one warm request per expert.
+    assert len(calls) == 2 * len(EXPERT_NAMES)
+    for messages, expert in zip(calls[::2], EXPERT_NAMES):
+        assert messages[0].content == system_prefix_text(
+            manual_text=manual.text)
+        assert messages[1].content == expert_system_suffix_text(expert)
+    assert is_prefix_warm()
+
+
+def test_warm_prefix_skips_already_warmed_hash(fake_warmup_model) -> None:
+    calls, _ = fake_warmup_model
+    warm_prefix()
+    calls.clear()
+
+    assert warm_prefix().skipped
+    assert calls == []
+    assert ensure_prefix_warm() is None
+
+    assert not warm_prefix(force=True).skipped
+    assert calls
+
+
+def test_prefix_change_triggers_rewarm(fake_warmup_model) -> None:
+    calls, _ = fake_warmup_model
+    warm_prefix()
+    calls.clear()
+
+    manual = get_manual()
+    edited = replace(manual,
+                     text=(manual.text + "\nAddendum."),
+                     sha256="0" * 64)
+    thread = ensure_prefix_warm(manual=edited)
+    assert thread is not None
+    thread.join(timeout=5)
+
+    assert len(calls) == 2 * len(EXPERT_NAMES)
+    assert is_prefix_warm(manual=edited)
+
+
+def test_warm_state_file_skips_across_processes(fake_warmup_model, tmp_path,
+                                                monkeypatch) -> None:
+    calls, _ = fake_warmup_model
+    monkeypatch.setenv("CACHE_LM_WARMUP_STATE", str(tmp_path / "warmup.json"))
+    warm_prefix()
+    reset_warmup_state()
+    calls.clear()
+
+    assert warm_prefix().skipped
+    assert calls == []
+
+
+def test_warm_state_file_entries_expire(fake_warmup_model, tmp_path,
+                                        monkeypatch) -> None:
+    calls, _ = fake_warmup_model
+    state = tmp_path / "warmup.json"
+    monkeypatch.setenv("CACHE_LM_WARMUP_STATE", str(state))
+    monkeypatch.setenv("CACHE_LM_WARMUP_STATE_TTL_S", "60")
+    warm_prefix()
+    reset_warmup_state()
+    # Recorded before the backend could have evicted or restarted.
+    data = json.loads(state.read_text(encoding="utf-8"))
+    data["warmed"] = {key: time.time() - 120 for key in data["warmed"]}
+    state.write_text(json.dumps(data), encoding="utf-8")
+    calls.clear()
+
+    assert not warm_prefix().skipped
+    assert len(calls) == 2 * len(EXPERT_NAMES)
+
+
+def test_start_up_warmup_ignores_the_state_file(fake_warmup_model, tmp_path,
+                                                monkeypatch) -> None:
+    calls, _ = fake_warmup_model
+    monkeypatch.setenv("CACHE_LM_WARMUP_STATE", str(tmp_path / "warmup.json"))
+    warm_prefix()
+    reset_warmup_state()
+    calls.clear()
+
+    thread = ensure_prefix_warm()
+    assert thread is not None
+    thread.join(timeout=5)
+    assert len(calls) == 2 * len(EXPERT_NAMES)
+    # Within the process it is deduplicated as before.
+    assert ensure_prefix_warm() is None